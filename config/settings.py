@@ -94,6 +94,61 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+# Bounded per-process cache. The feed cache and the relations cache are
+# invalidated by the process that writes the change, so with several server
+# processes the others can serve stale feed pages and relations until
+# FEED_CACHE_TIMEOUT and SOCIAL_GRAPH_CACHE_TIMEOUT; use a shared backend as
+# 'django.core.cache.backends.redis.RedisCache' in that case. The ETags and
+# the block checks read the database, so they stay correct either way.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'litrevu',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
+# Home feed pages cached per user, invalidated by signals
+FEED_CACHE_ALIAS = 'default'
+FEED_CACHE_TIMEOUT = 300
+
+# Follow and block relations cached per user, invalidated by signals
+SOCIAL_GRAPH_CACHE_ALIAS = 'default'
+SOCIAL_GRAPH_CACHE_TIMEOUT = 3600
+
+# Maximum number of users followed, unfollowed or blocked by one bulk request
+BULK_RELATIONS_MAX_ITEMS = 1000
+
+# Username suggestions of the follow form, from an index loaded by each server
+# process; users created by other processes are added every REFRESH seconds
+USERNAME_AUTOCOMPLETE_LIMIT = 10
+USERNAME_INDEX_REFRESH = 60
+
+# Friends-of-friends suggestions stored per user by compute_suggestions
+FOLLOW_SUGGESTIONS_LIMIT = 20
+
+# Feed events pushed to the open streams of /home/events/ (served under ASGI).
+# LocalBackend only reaches the streams of the current process; use
+# 'litrevu.events.SQLiteBackend' with
+# FEED_EVENTS_OPTIONS = {'path': BASE_DIR / 'feed_events.sqlite3'}
+# to share the events between several worker processes.
+FEED_EVENTS_BACKEND = 'litrevu.events.LocalBackend'
+FEED_EVENTS_OPTIONS = {}
+FEED_EVENTS_HEARTBEAT = 30
+
+# Ticket images are resized by a pool of threads after the upload is saved.
+# With 0 workers they are processed before the request returns.
+IMAGE_PROCESSING_WORKERS = 2
+IMAGE_PROCESSING_QUEUE_SIZE = 100
+# Uploads with more pixels are rejected from their headers, before decoding
+IMAGE_MAX_PIXELS = 50_000_000
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -136,6 +191,26 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Media files are served by litrevu.media.serve. Behind Apache (mod_xsendfile)
+# or nginx, set MEDIA_SENDFILE to 'x-sendfile' or 'x-accel-redirect' to let the
+# front server send the file; nginx needs an internal location mapping
+# MEDIA_ACCEL_REDIRECT_PREFIX to MEDIA_ROOT.
+MEDIA_SENDFILE = None
+MEDIA_ACCEL_REDIRECT_PREFIX = '/internal-media/'
+
+# Ticket images are stored under the SHA-256 of their content, once
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+    'ticket_images': {
+        'BACKEND': 'litrevu.storage.ContentAddressedStorage',
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
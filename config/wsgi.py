@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+# Load the usernames suggested by the follow form while the server starts
+from litrevu.username_index import warm_in_background  # noqa: E402
+
+warm_in_background()
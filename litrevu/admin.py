@@ -10,14 +10,16 @@ class TicketAdmin(admin.ModelAdmin):
     """Admin configuration for the Ticket model.
 
     Customizes the admin interface with:
-    - List display showing title, user, and creation time
-    - Filters for time and user
+    - List display showing title, user, image state, and creation time
+    - Filters for time, user, and image state
     - Search functionality for title and description
+    - Recorded image dimensions and size, read-only
     - Reverse chronological ordering
     """
 
-    list_display = ("title", "user", "time_created")
-    list_filter = ("time_created", "user")
+    list_display = ("title", "user", "image_state", "time_created")
+    list_filter = ("time_created", "user", "image_state")
+    readonly_fields = ("image_width", "image_height", "image_size")
     search_fields = ("title", "description")
     ordering = ("-time_created",)
 
@@ -5,8 +5,12 @@ class LitrevuConfig(AppConfig):
     """Configuration class for the LITRevu application.
 
     Defines basic Django application settings including the app name
-    and database auto field type.
+    and database auto field type, and connects the signal receivers.
     """
 
     default_auto_field = "django.db.models.BigAutoField"
     name = "litrevu"
+
+    def ready(self):
+        """Connect the signal receivers of the application."""
+        from . import signals  # noqa: F401
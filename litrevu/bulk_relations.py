@@ -0,0 +1,322 @@
+"""Follow, unfollow and block many users at once.
+
+Used by onboarding flows and imports, which would otherwise post one
+username at a time to the follows page. The targets are resolved in one
+query, checked against the relations of the user loaded in one query, and
+the rows are written with a single ``bulk_create`` or ``DELETE``. Skipping
+the per-row signal receivers, the feeds, counters, caches and suggestion
+changes are then updated once for the whole batch.
+
+Each target gets a status, so callers can report which ones were applied
+and why the others were not.
+"""
+
+from collections import namedtuple
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Q
+
+from . import counters, feed, feed_cache, social_graph, suggestions
+from .models import UserBlocks, UserFollows
+
+User = get_user_model()
+
+BULK_RELATIONS_MAX_ITEMS = getattr(settings, "BULK_RELATIONS_MAX_ITEMS", 1000)
+
+# Largest value of a 64-bit primary key: greater ids overflow the database
+MAX_USER_ID = 2**63 - 1
+
+FOLLOW = "follow"
+UNFOLLOW = "unfollow"
+BLOCK = "block"
+
+# Statuses of the targets the action was applied to
+FOLLOWED = "followed"
+UNFOLLOWED = "unfollowed"
+BLOCKED = "blocked"
+# Statuses of the skipped targets
+NOT_FOUND = "not_found"
+DUPLICATE = "duplicate"
+SELF = "self"
+ALREADY_FOLLOWING = "already_following"
+NOT_FOLLOWING = "not_following"
+ALREADY_BLOCKED = "already_blocked"
+BLOCKING = "blocking"
+BLOCKED_BY = "blocked_by"
+
+APPLIED = {FOLLOWED, UNFOLLOWED, BLOCKED}
+
+BulkResult = namedtuple("BulkResult", ["target", "user_id", "status"])
+BulkResult.__doc__ = "Outcome of a bulk action for one username or id."
+
+
+class TooManyTargets(Exception):
+    """Raised when a bulk action is given more than BULK_RELATIONS_MAX_ITEMS."""
+
+
+class InvalidTargets(ValueError):
+    """Raised when the usernames or ids of a bulk action are malformed."""
+
+
+def clean_targets(usernames, ids):
+    """Check the types of the targets and convert the ids to integers.
+
+    Args:
+        usernames: List of usernames
+        ids: List of ids, as integers or strings of digits
+
+    Returns:
+        tuple: The stripped usernames and the integer ids
+
+    Raises:
+        InvalidTargets: If usernames or ids is not a list, a username is not
+            a string or an id is not a positive 64-bit integer
+    """
+    for name, values in (("usernames", usernames), ("ids", ids)):
+        if not isinstance(values, (list, tuple)):
+            raise InvalidTargets(f"{name} doit être une liste.")
+    if not all(isinstance(username, str) for username in usernames):
+        raise InvalidTargets("Les noms d'utilisateur doivent être des chaînes.")
+    cleaned_ids = []
+    for pk in ids:
+        try:
+            if isinstance(pk, (bool, float)):
+                raise TypeError
+            pk = int(pk)
+        except (TypeError, ValueError):
+            raise InvalidTargets(f"Identifiant invalide : {pk!r}.")
+        if not 0 < pk <= MAX_USER_ID:
+            raise InvalidTargets(f"Identifiant hors limites : {pk}.")
+        cleaned_ids.append(pk)
+    return [username.strip() for username in usernames], cleaned_ids
+
+
+def resolve_targets(usernames=(), ids=()):
+    """Find the users named by usernames and ids, in one query.
+
+    Args:
+        usernames: Usernames of the targets
+        ids: Ids of the targets
+
+    Returns:
+        list: ``(target, user_id)`` pairs in the order given, usernames
+            first, with a None id for unknown users
+
+    Raises:
+        InvalidTargets: If the usernames or ids are malformed
+        TooManyTargets: If there are more than BULK_RELATIONS_MAX_ITEMS
+            targets
+    """
+    usernames, ids = clean_targets(usernames, ids)
+    if len(usernames) + len(ids) > BULK_RELATIONS_MAX_ITEMS:
+        raise TooManyTargets(
+            f"{BULK_RELATIONS_MAX_ITEMS} utilisateurs au maximum par requête."
+        )
+    found = User.objects.filter(Q(username__in=usernames) | Q(pk__in=ids))
+    by_username = dict(found.values_list("username", "pk"))
+    known_ids = set(by_username.values())
+    return [(username, by_username.get(username)) for username in usernames] + [
+        (pk, pk if pk in known_ids else None) for pk in ids
+    ]
+
+
+def _classify(user_id, targets, check):
+    """Give each target a status.
+
+    Args:
+        user_id: Id of the user acting
+        targets: ``(target, user_id)`` pairs from ``resolve_targets``
+        check: Function returning the status of a valid, distinct target id
+
+    Returns:
+        list: BulkResult of each target
+    """
+    results = []
+    seen = set()
+    for target, other_id in targets:
+        if other_id is None:
+            status = NOT_FOUND
+        elif other_id in seen:
+            status = DUPLICATE
+        elif other_id == user_id:
+            status = SELF
+        else:
+            status = check(other_id)
+        if other_id is not None:
+            seen.add(other_id)
+        results.append(BulkResult(target, other_id, status))
+    return results
+
+
+def _applied_ids(results):
+    return [result.user_id for result in results if result.status in APPLIED]
+
+
+def _delete_follows(owner, owner_id, other, other_ids):
+    """Delete follow rows with one DELETE, without sending ``post_delete``.
+
+    The receivers would prune the feeds and invalidate the caches row by
+    row; the bulk actions do it once for the whole batch instead.
+
+    Args:
+        owner: Name of the foreign key matching ``owner_id``
+        owner_id: Id of the user on that side of the follows
+        other: Name of the foreign key matching ``other_ids``
+        other_ids: Ids of the users on the other side
+    """
+    quote = connection.ops.quote_name
+    table = quote(UserFollows._meta.db_table)
+    owner_column = quote(UserFollows._meta.get_field(owner).column)
+    other_column = quote(UserFollows._meta.get_field(other).column)
+    placeholders = ", ".join(["%s"] * len(other_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {table} WHERE {owner_column} = %s "
+            f"AND {other_column} IN ({placeholders})",
+            [owner_id, *other_ids],
+        )
+
+
+def _invalidate(user_ids):
+    feed_cache.invalidate(user_ids)
+    social_graph.invalidate(user_ids)
+
+
+@transaction.atomic
+def bulk_follow(user, usernames=(), ids=()):
+    """Make a user follow several users.
+
+    Users who block the user or are blocked by them are skipped, as on the
+    follows page.
+
+    Args:
+        user: The user who follows
+        usernames: Usernames of the users to follow
+        ids: Ids of the users to follow
+
+    Returns:
+        list: BulkResult of each target
+
+    Raises:
+        InvalidTargets: If the usernames or ids are malformed
+        TooManyTargets: If there are too many targets
+    """
+    targets = resolve_targets(usernames, ids)
+    related = social_graph.load_relations(user.pk)
+
+    def check(other_id):
+        if other_id in related.following:
+            return ALREADY_FOLLOWING
+        if other_id in related.blocking:
+            return BLOCKING
+        if other_id in related.blocked_by:
+            return BLOCKED_BY
+        return FOLLOWED
+
+    results = _classify(user.pk, targets, check)
+    followed_ids = _applied_ids(results)
+    if followed_ids:
+        UserFollows.objects.bulk_create(
+            [
+                UserFollows(user_id=user.pk, followed_user_id=followed_id)
+                for followed_id in followed_ids
+            ],
+            ignore_conflicts=True,
+        )
+        feed.backfill_follows(user.pk, followed_ids)
+        counters.follows_changed(user.pk, followed_ids, 1)
+        _invalidate([user.pk, *followed_ids])
+        suggestions.mark_changed([user.pk])
+    return results
+
+
+@transaction.atomic
+def bulk_unfollow(user, usernames=(), ids=()):
+    """Make a user stop following several users.
+
+    Args:
+        user: The user who follows
+        usernames: Usernames of the users to unfollow
+        ids: Ids of the users to unfollow
+
+    Returns:
+        list: BulkResult of each target
+
+    Raises:
+        InvalidTargets: If the usernames or ids are malformed
+        TooManyTargets: If there are too many targets
+    """
+    targets = resolve_targets(usernames, ids)
+    related = social_graph.load_relations(user.pk)
+    results = _classify(
+        user.pk,
+        targets,
+        lambda other_id: (
+            UNFOLLOWED if other_id in related.following else NOT_FOLLOWING
+        ),
+    )
+    unfollowed_ids = _applied_ids(results)
+    if unfollowed_ids:
+        _delete_follows("user", user.pk, "followed_user", unfollowed_ids)
+        feed.prune_follows(user.pk, unfollowed_ids)
+        counters.follows_changed(user.pk, unfollowed_ids, -1)
+        _invalidate([user.pk, *unfollowed_ids])
+        suggestions.mark_changed([user.pk])
+    return results
+
+
+@transaction.atomic
+def bulk_block(user, usernames=(), ids=()):
+    """Make a user block several users.
+
+    As with ``block_user``, the follow relationships between the user and
+    each blocked user are removed in both directions.
+
+    Args:
+        user: The user who blocks
+        usernames: Usernames of the users to block
+        ids: Ids of the users to block
+
+    Returns:
+        list: BulkResult of each target
+
+    Raises:
+        InvalidTargets: If the usernames or ids are malformed
+        TooManyTargets: If there are too many targets
+    """
+    targets = resolve_targets(usernames, ids)
+    related = social_graph.load_relations(user.pk)
+    results = _classify(
+        user.pk,
+        targets,
+        lambda other_id: ALREADY_BLOCKED if other_id in related.blocking else BLOCKED,
+    )
+    blocked_ids = _applied_ids(results)
+    if not blocked_ids:
+        return results
+
+    UserBlocks.objects.bulk_create(
+        [
+            UserBlocks(user_id=user.pk, blocked_user_id=blocked_id)
+            for blocked_id in blocked_ids
+        ],
+        ignore_conflicts=True,
+    )
+    followed_ids = [pk for pk in blocked_ids if pk in related.following]
+    follower_ids = [pk for pk in blocked_ids if pk in related.followers]
+    if followed_ids:
+        _delete_follows("user", user.pk, "followed_user", followed_ids)
+        feed.prune_follows(user.pk, followed_ids)
+        counters.follows_changed(user.pk, followed_ids, -1)
+    if follower_ids:
+        _delete_follows("followed_user", user.pk, "user", follower_ids)
+        feed.prune_followers(user.pk, follower_ids)
+        counters.followers_removed(user.pk, follower_ids)
+    _invalidate([user.pk, *blocked_ids])
+    suggestions.mark_changed([user.pk, *blocked_ids])
+    return results
+
+
+ACTIONS = {FOLLOW: bulk_follow, UNFOLLOW: bulk_unfollow, BLOCK: bulk_block}
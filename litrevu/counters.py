@@ -0,0 +1,171 @@
+"""Denormalized counters of users and tickets.
+
+Users store their number of followers, followed users, tickets and reviews,
+and tickets their number of reviews and the sum of their ratings, so pages
+show them without a ``COUNT(*)`` per item. The columns are only written
+with ``F()`` expressions, by the signal receivers of ``litrevu.signals`` and
+by ``litrevu.bulk_relations``, in the transaction of the change they count:
+concurrent changes add up instead of overwriting each other. Deletes send
+``post_delete`` inside their own transaction; the views creating rows wrap
+them in one.
+
+Decrements stop at zero, so a counter that drifted never makes a delete
+fail. ``reconcile`` recomputes the counters from the source tables and
+reports the drift; see the ``reconcile_counters`` command.
+"""
+
+from collections import namedtuple
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Review, Ticket, UserFollows
+
+User = get_user_model()
+
+Counter = namedtuple("Counter", ["model", "field", "source", "owner", "value"])
+Counter.__doc__ = "Counter column and the rows of the source table it counts."
+
+# Each counter with its source model, the column of the source row pointing
+# at the counted object, and the aggregate it stores
+COUNTERS = [
+    Counter(User, "followers_count", UserFollows, "followed_user_id", Count("pk")),
+    Counter(User, "following_count", UserFollows, "user_id", Count("pk")),
+    Counter(User, "tickets_count", Ticket, "user_id", Count("pk")),
+    Counter(User, "reviews_count", Review, "user_id", Count("pk")),
+    Counter(Ticket, "review_count", Review, "ticket_id", Count("pk")),
+    Counter(Ticket, "rating_sum", Review, "ticket_id", Sum("rating")),
+]
+
+
+def _add(queryset, **deltas):
+    """Add values to counters of the rows of a queryset, in one UPDATE.
+
+    Args:
+        queryset: Rows to update
+        **deltas: Value added to each counter, negative to subtract
+    """
+    updates = {}
+    for field, delta in deltas.items():
+        if delta > 0:
+            updates[field] = F(field) + delta
+        elif delta < 0:
+            updates[field] = Greatest(F(field) + delta, 0)
+    if updates:
+        queryset.update(**updates)
+
+
+def follows_changed(follower_id, followed_ids, delta):
+    """Count follows created or deleted by a user.
+
+    Args:
+        follower_id: Id of the user who follows
+        followed_ids: Ids of the followed users
+        delta: 1 for created follows, -1 for deleted ones
+    """
+    _add(User.objects.filter(pk=follower_id), following_count=delta * len(followed_ids))
+    _add(User.objects.filter(pk__in=followed_ids), followers_count=delta)
+
+
+def followers_removed(followed_id, follower_ids):
+    """Count follows of a user deleted for several followers.
+
+    Args:
+        followed_id: Id of the followed user
+        follower_ids: Ids of the users who followed them
+    """
+    _add(User.objects.filter(pk=followed_id), followers_count=-len(follower_ids))
+    _add(User.objects.filter(pk__in=follower_ids), following_count=-1)
+
+
+def ticket_changed(ticket, delta):
+    """Count a created or deleted ticket.
+
+    Args:
+        ticket: The ticket
+        delta: 1 for a created ticket, -1 for a deleted one
+    """
+    _add(User.objects.filter(pk=ticket.user_id), tickets_count=delta)
+
+
+def review_changed(review, delta):
+    """Count a created or deleted review.
+
+    Args:
+        review: The review
+        delta: 1 for a created review, -1 for a deleted one
+    """
+    _add(User.objects.filter(pk=review.user_id), reviews_count=delta)
+    _add(
+        Ticket.objects.filter(pk=review.ticket_id),
+        review_count=delta,
+        rating_sum=delta * review.rating,
+    )
+
+
+def rating_changed(review, previous_rating):
+    """Update the rating sum of the ticket of an edited review.
+
+    Args:
+        review: The review, with its new rating
+        previous_rating: Rating of the review before the edit
+    """
+    _add(
+        Ticket.objects.filter(pk=review.ticket_id),
+        rating_sum=review.rating - previous_rating,
+    )
+
+
+def reconcile(counter, first_id, last_id, fix=True):
+    """Recompute a counter for a range of rows and report the drift.
+
+    The stored and actual values are read by the same query, so they are
+    consistent with each other, and the drift is fixed by adding the
+    difference: changes committed in the meantime are kept.
+
+    Args:
+        counter: Entry of COUNTERS
+        first_id: Lowest primary key of the range, inclusive
+        last_id: Highest primary key of the range, inclusive
+        fix: Correct the counters that drifted
+
+    Returns:
+        list: ``(pk, stored, actual)`` of each row whose counter drifted
+    """
+    actual = (
+        counter.source.objects.filter(**{counter.owner: OuterRef("pk")})
+        .order_by()
+        .values(counter.owner)
+        .annotate(value=counter.value)
+        .values("value")
+    )
+    drifted = list(
+        counter.model.objects.filter(pk__gte=first_id, pk__lte=last_id)
+        .annotate(actual=Coalesce(Subquery(actual), 0))
+        .exclude(**{counter.field: F("actual")})
+        .order_by("pk")
+        .values_list("pk", counter.field, "actual")
+    )
+    if fix:
+        for pk, stored, value in drifted:
+            _add(counter.model.objects.filter(pk=pk), **{counter.field: value - stored})
+    return drifted
+
+
+def reconcile_all(counters=COUNTERS, chunk_size=1000, fix=True):
+    """Recompute counters for all rows, in chunks of primary keys.
+
+    Args:
+        counters: Entries of COUNTERS to recompute
+        chunk_size: Number of primary keys checked per query
+        fix: Correct the counters that drifted
+
+    Yields:
+        tuple: Each counter with the drifted rows of a chunk, as returned
+            by ``reconcile``
+    """
+    for counter in counters:
+        last_id = counter.model.objects.aggregate(Max("pk"))["pk__max"] or 0
+        for first_id in range(1, last_id + 1, chunk_size):
+            yield counter, reconcile(counter, first_id, first_id + chunk_size - 1, fix)
@@ -0,0 +1,97 @@
+"""View decorators for the LITRevu application."""
+
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.utils.cache import get_conditional_response, patch_cache_control, quote_etag
+
+
+def async_login_required(view_func):
+    """Async counterpart of ``login_required``.
+
+    Django 5.0's ``login_required`` only wraps sync views. This decorator
+    resolves the user with ``request.auser()`` and redirects anonymous users
+    to the login page.
+
+    Args:
+        view_func: The async view to protect
+
+    Returns:
+        The decorated async view
+    """
+
+    @wraps(view_func)
+    async def _wrapper_view(request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        # Keep the resolved user so that rendering does not load it again
+        request.user = user
+        return await view_func(request, *args, **kwargs)
+
+    return _wrapper_view
+
+
+def _conditional_response(request, etag):
+    """Return a 304 response if the client's copy matches ``etag``."""
+    if etag is None:
+        return None
+    return get_conditional_response(request, etag=quote_etag(etag))
+
+
+def _add_validator(response, etag):
+    """Add the ETag to a response and make clients revalidate it."""
+    if etag is not None:
+        response.headers.setdefault("ETag", quote_etag(etag))
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def conditional_page(etag_func):
+    """Answer conditional GET requests on a per-user page.
+
+    Works like Django's ``condition(etag_func=...)`` but also supports async
+    views, where the ETag function, which usually queries the database, is
+    run through ``sync_to_async``. Other methods than GET and HEAD skip the
+    ETag computation. Must be applied inside the login decorator, since the
+    ETag depends on the user.
+
+    Args:
+        etag_func: Callable taking the view arguments and returning the ETag
+            of the page, or None to disable conditional processing
+
+    Returns:
+        The decorator
+    """
+
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            async_etag_func = sync_to_async(etag_func)
+
+            @wraps(view_func)
+            async def _wrapper_view(request, *args, **kwargs):
+                if request.method not in ("GET", "HEAD"):
+                    return await view_func(request, *args, **kwargs)
+                etag = await async_etag_func(request, *args, **kwargs)
+                response = _conditional_response(request, etag)
+                if response is None:
+                    response = await view_func(request, *args, **kwargs)
+                return _add_validator(response, etag)
+
+        else:
+
+            @wraps(view_func)
+            def _wrapper_view(request, *args, **kwargs):
+                if request.method not in ("GET", "HEAD"):
+                    return view_func(request, *args, **kwargs)
+                etag = etag_func(request, *args, **kwargs)
+                response = _conditional_response(request, etag)
+                if response is None:
+                    response = view_func(request, *args, **kwargs)
+                return _add_validator(response, etag)
+
+        return _wrapper_view
+
+    return decorator
@@ -0,0 +1,98 @@
+"""ETag functions for the per-user pages.
+
+Each validator combines a few indexed aggregates (row count and highest
+primary key of the rows shown on the page) with the ``pages_version``
+column of the user. New rows change the highest key, deleted rows change
+the count, and edits bump the column through ``feed_cache.invalidate`` in
+the transaction of the edit. Both come from the database, so they stay
+correct across worker processes that do not share a cache.
+"""
+
+import hashlib
+
+from django.contrib.messages import get_messages
+from django.db.models import Count, Max, Q
+
+from .models import Ticket, Review, UserFollows, UserBlocks, FeedEntry, FollowSuggestion
+
+
+def _summary(queryset):
+    """Return the row count and highest primary key of a queryset."""
+    values = queryset.aggregate(count=Count("pk"), last=Max("pk"))
+    return f"{values['count']}:{values['last']}"
+
+
+def _etag(request, page, *parts):
+    """Hash the parts of a validator with the request-specific ones.
+
+    The CSRF secret and the query string are part of the hash because they
+    are rendered in the page. Pages with pending flash messages get no ETag,
+    so the messages are never hidden by a 304 response.
+    """
+    if len(get_messages(request)):
+        return None
+    user = request.user
+    raw = "|".join(
+        str(part)
+        for part in (
+            page,
+            user.pk,
+            # Loaded with the user by the authentication middleware
+            user.pages_version,
+            request.META.get("CSRF_COOKIE", ""),
+            request.get_full_path(),
+            *parts,
+        )
+    )
+    return hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest()
+
+
+def home_etag(request):
+    """Return the ETag of the home feed of the requesting user.
+
+    Args:
+        request: The HTTP request
+
+    Returns:
+        str: The ETag, or None if the page must be rendered
+    """
+    return _etag(
+        request, "home", _summary(FeedEntry.objects.filter(owner=request.user))
+    )
+
+
+def posts_etag(request):
+    """Return the ETag of the posts page of the requesting user.
+
+    Args:
+        request: The HTTP request
+
+    Returns:
+        str: The ETag, or None if the page must be rendered
+    """
+    return _etag(
+        request,
+        "posts",
+        _summary(Ticket.objects.filter(user=request.user)),
+        _summary(Review.objects.filter(user=request.user)),
+    )
+
+
+def follows_etag(request):
+    """Return the ETag of the follows page of the requesting user.
+
+    Args:
+        request: The HTTP request
+
+    Returns:
+        str: The ETag, or None if the page must be rendered
+    """
+    user = request.user
+    return _etag(
+        request,
+        "follows",
+        _summary(UserFollows.objects.filter(Q(user=user) | Q(followed_user=user))),
+        _summary(UserBlocks.objects.filter(Q(user=user) | Q(blocked_user=user))),
+        # Replaced by each run of the suggestions job
+        _summary(FollowSuggestion.objects.filter(user=user)),
+    )
@@ -0,0 +1,270 @@
+"""Publish/subscribe hub pushing feed events to connected clients.
+
+Each open Server-Sent Events stream subscribes to the hub for its user and
+waits on an asyncio queue, which costs nothing while no event arrives.
+Signal receivers publish a small event when a ticket or review is created,
+addressed to every user whose feed contains it.
+
+Delivery between processes goes through a pluggable backend, selected with
+the ``FEED_EVENTS_BACKEND`` setting:
+
+- ``LocalBackend`` delivers events to the subscribers of the current
+  process only. It is enough with a single worker process.
+- ``SQLiteBackend`` appends events to a table in a shared SQLite file that
+  every process polls while it has subscribers, so that several worker
+  processes on the same host share the events.
+"""
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .feed import FeedCursor
+
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class Subscription:
+    """Queue of the events delivered to one open stream.
+
+    Attributes:
+        user_id: Id of the user the stream belongs to
+        loop: Event loop the stream runs in
+        queue: Events waiting to be sent
+    """
+
+    def __init__(self, user_id, loop):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def offer(self, event):
+        """Queue an event, dropping it if the client is not keeping up.
+
+        Must be called from the subscription's event loop.
+        """
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            pass
+
+    async def get(self):
+        """Wait for the next event.
+
+        Returns:
+            dict: The event
+        """
+        return await self.queue.get()
+
+
+class FeedEventHub:
+    """In-process registry of the subscriptions, fed by a backend."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        """Register a stream for ``user_id``.
+
+        Must be called from the event loop serving the stream.
+
+        Args:
+            user_id: Id of the user the stream belongs to
+
+        Returns:
+            Subscription: The subscription to read events from
+        """
+        subscription = Subscription(user_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions[user_id].add(subscription)
+        self.backend.subscribed(self)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Remove a stream from the registry.
+
+        Args:
+            subscription: The subscription returned by ``subscribe``
+        """
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def has_subscribers(self):
+        """Return True if a stream is open in this process."""
+        with self._lock:
+            return bool(self._subscriptions)
+
+    def publish(self, user_ids, event):
+        """Send an event to the streams of several users, in all processes.
+
+        Args:
+            user_ids: Ids of the recipients
+            event: JSON-serializable event
+        """
+        self.backend.publish(self, list(user_ids), event)
+
+    def dispatch(self, user_ids, event):
+        """Deliver an event to the streams open in this process.
+
+        Safe to call from any thread.
+
+        Args:
+            user_ids: Ids of the recipients
+            event: The event
+        """
+        with self._lock:
+            subscriptions = [
+                subscription
+                for user_id in user_ids
+                for subscription in self._subscriptions.get(user_id, ())
+            ]
+        for subscription in subscriptions:
+            subscription.loop.call_soon_threadsafe(subscription.offer, event)
+
+
+class LocalBackend:
+    """Backend delivering events within the current process only."""
+
+    def subscribed(self, hub):
+        """Nothing to start: events are dispatched as they are published."""
+
+    def publish(self, hub, user_ids, event):
+        """Dispatch the event to the local subscribers."""
+        hub.dispatch(user_ids, event)
+
+
+class SQLiteBackend:
+    """Backend sharing events between processes through a SQLite table.
+
+    Published events are appended to the table. Each process runs a poller
+    task while it has subscribers; it reads the events added since its last
+    poll and dispatches them locally. The position of the last poll is kept
+    while the process has no subscribers, so the events published while a
+    client reconnects are delivered once it has subscribed again. Events
+    older than ``retention`` seconds are deleted by the publishers.
+
+    Args:
+        path: Path of the SQLite file shared by the processes
+        interval: Seconds between two polls
+        retention: Seconds an event is kept in the table
+    """
+
+    def __init__(self, path, interval=0.5, retention=60):
+        self.path = str(path)
+        self.interval = interval
+        self.retention = retention
+        self._poller = None
+        connection = self._connect()
+        try:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS feed_event ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "time_created REAL NOT NULL, "
+                "user_ids TEXT NOT NULL, "
+                "event TEXT NOT NULL)"
+            )
+            # Events published before the process started are not delivered
+            row = connection.execute("SELECT MAX(id) FROM feed_event").fetchone()
+            self._last_id = row[0] or 0
+        finally:
+            connection.close()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=5)
+        connection.execute("PRAGMA journal_mode=WAL")
+        return connection
+
+    def publish(self, hub, user_ids, event):
+        """Append the event to the shared table."""
+        now = time.time()
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute(
+                    "INSERT INTO feed_event (time_created, user_ids, event) "
+                    "VALUES (?, ?, ?)",
+                    (now, json.dumps(user_ids), json.dumps(event)),
+                )
+                connection.execute(
+                    "DELETE FROM feed_event WHERE time_created < ?",
+                    (now - self.retention,),
+                )
+        finally:
+            connection.close()
+
+    def subscribed(self, hub):
+        """Start the poller of this process if it is not running."""
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.get_running_loop().create_task(self._poll(hub))
+
+    def _read(self):
+        """Return the events added since the last read."""
+        connection = self._connect()
+        try:
+            rows = connection.execute(
+                "SELECT id, user_ids, event FROM feed_event WHERE id > ? ORDER BY id",
+                (self._last_id,),
+            ).fetchall()
+        finally:
+            connection.close()
+        if rows:
+            self._last_id = rows[-1][0]
+        return rows
+
+    async def _poll(self, hub):
+        """Dispatch the shared events while this process has subscribers."""
+        while hub.has_subscribers():
+            for _, user_ids, event in await asyncio.to_thread(self._read):
+                hub.dispatch(json.loads(user_ids), json.loads(event))
+            await asyncio.sleep(self.interval)
+
+
+_hub = None
+_hub_lock = threading.Lock()
+
+
+def get_hub():
+    """Return the hub of this process, creating it on first use.
+
+    Returns:
+        FeedEventHub: The hub, using the backend configured in the settings
+    """
+    global _hub
+    with _hub_lock:
+        if _hub is None:
+            backend_class = import_string(
+                getattr(settings, "FEED_EVENTS_BACKEND", "litrevu.events.LocalBackend")
+            )
+            backend = backend_class(**getattr(settings, "FEED_EVENTS_OPTIONS", {}))
+            _hub = FeedEventHub(backend)
+        return _hub
+
+
+def publish_item(kind, item, viewer_ids):
+    """Announce a new feed item to its viewers once the transaction commits.
+
+    Args:
+        kind: TICKET or REVIEW
+        item: The created ticket or review
+        viewer_ids: Ids of the users whose feed contains the item
+    """
+    event = {
+        "kind": kind,
+        "id": item.pk,
+        "cursor": FeedCursor(item.time_created, kind, item.pk).encode(),
+    }
+    viewer_ids = list(viewer_ids)
+    transaction.on_commit(lambda: get_hub().publish(viewer_ids, event))
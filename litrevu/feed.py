@@ -0,0 +1,558 @@
+"""Feed engine for the LITRevu home page.
+
+The home feed is materialized in the FeedEntry table: entries are written
+when tickets and reviews are created (fan-out on write) and when follow
+relationships change, so a page is read with one range scan on the owner's
+entries. Only the rows of the requested page are then loaded as model
+instances. Pages are addressed with a ``(time_created, kind, id)`` keyset
+cursor, so the cost of a page does not depend on how long the user's history
+is.
+
+The query-based feed, which merges the ticket and review streams in the
+database with a UNION ALL of their keys, remains the source of truth used to
+rebuild and check the materialized entries.
+"""
+
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Q, CharField, Value, Exists, OuterRef
+
+from .models import Ticket, Review, UserFollows, FeedEntry
+
+User = get_user_model()
+
+FEED_PAGE_SIZE = 20
+FEED_DELTA_MAX_ITEMS = 50
+FEED_DELTA_MAX_BYTES = 64 * 1024
+FAN_OUT_BATCH_SIZE = 1000
+
+TICKET = "TICKET"
+REVIEW = "REVIEW"
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+class FeedCursor(namedtuple("FeedCursor", ["time_created", "kind", "id"])):
+    """Position of an item in a feed.
+
+    Items are sorted by ``(time_created, kind, id)`` in descending order, so a
+    cursor identifies a unique position even when several items share the
+    same creation time.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def for_item(cls, item):
+        """Build the cursor pointing at a hydrated feed item.
+
+        Args:
+            item: A Ticket or Review annotated with ``content_type``
+
+        Returns:
+            FeedCursor: The position of the item
+        """
+        return cls(item.time_created, item.content_type, item.pk)
+
+    def encode(self):
+        """Serialize the cursor for use in a query string.
+
+        Returns:
+            str: The cursor as ``<microseconds>-<kind>-<id>``, where the
+                signed number of microseconds is counted from the epoch
+        """
+        microseconds = (self.time_created - _EPOCH) // _MICROSECOND
+        return f"{microseconds}-{self.kind}-{self.id}"
+
+    @classmethod
+    def decode(cls, value):
+        """Parse a cursor produced by ``encode``.
+
+        Args:
+            value: The encoded cursor, usually taken from ``request.GET``
+
+        Returns:
+            FeedCursor: The decoded cursor, or None if the value is missing
+            or malformed
+        """
+        if not value:
+            return None
+        try:
+            # The time is negative before 1970: split from the right
+            microseconds, kind, pk = value.rsplit("-", 2)
+            time_created = _EPOCH + timedelta(microseconds=int(microseconds))
+            pk = int(pk)
+        except (ValueError, OverflowError):
+            return None
+        if kind not in (TICKET, REVIEW):
+            return None
+        return cls(time_created, kind, pk)
+
+
+class FeedPage:
+    """A bounded slice of a feed.
+
+    Attributes:
+        items: Hydrated tickets and reviews, most recent first
+        next_cursor: Cursor to pass as ``before`` to get the next (older)
+            page, or None if this is the last page
+    """
+
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        """Return True if older items are available."""
+        return self.next_cursor is not None
+
+
+def followed_users(user):
+    """Return a queryset of the users followed by ``user``.
+
+    Args:
+        user: The viewing user
+
+    Returns:
+        QuerySet: Users followed by ``user``, usable as a subquery
+    """
+    return User.objects.filter(followed_by__user=user)
+
+
+def feed_tickets(user):
+    """Return the tickets visible in the home feed of ``user``.
+
+    This covers the user's own tickets and the tickets of the users they
+    follow.
+
+    Args:
+        user: The viewing user
+
+    Returns:
+        QuerySet: Unordered ticket queryset
+    """
+    return Ticket.objects.filter(Q(user=user) | Q(user__in=followed_users(user)))
+
+
+def feed_reviews(user):
+    """Return the reviews visible in the home feed of ``user``.
+
+    This covers the user's own reviews, the reviews of the users they follow
+    and the reviews posted on the user's tickets.
+
+    Args:
+        user: The viewing user
+
+    Returns:
+        QuerySet: Unordered review queryset
+    """
+    return Review.objects.filter(
+        Q(user=user) | Q(user__in=followed_users(user)) | Q(ticket__user=user)
+    )
+
+
+def _keys(queryset, kind):
+    """Project a stream onto its ``(time_created, kind, id)`` keys."""
+    return (
+        queryset.order_by()
+        .annotate(kind=Value(kind, CharField()))
+        .values_list("time_created", "kind", "id")
+    )
+
+
+def hydrate(keys, user):
+    """Load the tickets and reviews referenced by ``keys``.
+
+    Runs at most one query per kind, whatever the size of the feed.
+
+    Args:
+        keys: FeedCursor keys, in display order
+        user: The viewing user, used for the ``has_user_reviewed`` flag
+
+    Returns:
+        list: Tickets and reviews in the order of ``keys``
+    """
+    ticket_ids = [key.id for key in keys if key.kind == TICKET]
+    review_ids = [key.id for key in keys if key.kind == REVIEW]
+    objects = {TICKET: {}, REVIEW: {}}
+
+    if ticket_ids:
+        tickets = (
+            Ticket.objects.filter(pk__in=ticket_ids)
+            .annotate(
+                content_type=Value(TICKET, CharField()),
+                has_user_reviewed=Exists(
+                    Review.objects.filter(ticket=OuterRef("pk"), user=user)
+                ),
+            )
+            .select_related("user")
+        )
+        objects[TICKET] = {ticket.pk: ticket for ticket in tickets}
+
+    if review_ids:
+        reviews = (
+            Review.objects.filter(pk__in=review_ids)
+            .annotate(content_type=Value(REVIEW, CharField()))
+            .select_related("user", "ticket", "ticket__user")
+        )
+        objects[REVIEW] = {review.pk: review for review in reviews}
+
+    # Rows deleted between the two steps are simply skipped
+    return [objects[key.kind][key.id] for key in keys if key.id in objects[key.kind]]
+
+
+def entry_keys(user, before=None, limit=FEED_PAGE_SIZE):
+    """Read the keys of one page of the materialized feed of ``user``.
+
+    Args:
+        user: The owner of the feed
+        before: Optional cursor; only items older than it are returned
+        limit: Maximum number of keys to return
+
+    Returns:
+        list: FeedCursor keys, most recent first
+    """
+    entries = FeedEntry.objects.filter(owner=user)
+    if before is not None:
+        entries = entries.filter(
+            Q(time_created__lt=before.time_created)
+            | Q(time_created=before.time_created, kind__lt=before.kind)
+            | Q(
+                time_created=before.time_created,
+                kind=before.kind,
+                item_id__lt=before.id,
+            )
+        )
+    rows = entries.order_by("-time_created", "-kind", "-item_id").values_list(
+        "time_created", "kind", "item_id"
+    )[:limit]
+    return [FeedCursor(*row) for row in rows]
+
+
+def get_feed_page(user, before=None, limit=FEED_PAGE_SIZE):
+    """Build one page of the home feed of ``user``.
+
+    Args:
+        user: The viewing user
+        before: Optional cursor of the last item of the previous page
+        limit: Number of items per page
+
+    Returns:
+        FeedPage: The requested page
+    """
+    keys = entry_keys(user, before=before, limit=limit + 1)
+    next_cursor = keys[limit - 1] if len(keys) > limit else None
+    return FeedPage(hydrate(keys[:limit], user), next_cursor)
+
+
+def entry_keys_after(user, after, limit):
+    """Read the keys of the materialized feed that are newer than ``after``.
+
+    Keys are returned oldest first, so that a client catching up can pass
+    the last key it received as the next ``after``.
+
+    Args:
+        user: The owner of the feed
+        after: Cursor of the newest item the client already has
+        limit: Maximum number of keys to return
+
+    Returns:
+        list: FeedCursor keys, oldest first
+    """
+    rows = (
+        FeedEntry.objects.filter(owner=user)
+        .filter(
+            Q(time_created__gt=after.time_created)
+            | Q(time_created=after.time_created, kind__gt=after.kind)
+            | Q(
+                time_created=after.time_created,
+                kind=after.kind,
+                item_id__gt=after.id,
+            )
+        )
+        .order_by("time_created", "kind", "item_id")
+        .values_list("time_created", "kind", "item_id")[:limit]
+    )
+    return [FeedCursor(*row) for row in rows]
+
+
+def _bulk_insert(entries):
+    """Insert feed entries in batches, ignoring the ones that already exist."""
+    entries = iter(entries)
+    while batch := list(islice(entries, FAN_OUT_BATCH_SIZE)):
+        FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def follower_ids(user_id):
+    """Return the ids of the users following ``user_id``.
+
+    Args:
+        user_id: Id of the followed user
+
+    Returns:
+        list: Ids of the followers
+    """
+    return list(
+        UserFollows.objects.filter(followed_user_id=user_id).values_list(
+            "user_id", flat=True
+        )
+    )
+
+
+def ticket_viewer_ids(ticket):
+    """Return the ids of the users whose feed contains ``ticket``.
+
+    Args:
+        ticket: The ticket
+
+    Returns:
+        set: The author and their followers
+    """
+    return {ticket.user_id, *follower_ids(ticket.user_id)}
+
+
+def review_viewer_ids(review):
+    """Return the ids of the users whose feed contains ``review``.
+
+    Args:
+        review: The review
+
+    Returns:
+        set: The author, their followers and the owner of the reviewed ticket
+    """
+    ticket_owner_id = (
+        Ticket.objects.filter(pk=review.ticket_id)
+        .values_list("user_id", flat=True)
+        .first()
+    )
+    viewers = {review.user_id, *follower_ids(review.user_id)}
+    if ticket_owner_id is not None:
+        viewers.add(ticket_owner_id)
+    return viewers
+
+
+def fan_out(kind, item, viewer_ids):
+    """Add an item to the feed of every viewer.
+
+    Args:
+        kind: TICKET or REVIEW
+        item: The created ticket or review
+        viewer_ids: Ids of the users whose feed contains the item
+    """
+    _bulk_insert(
+        FeedEntry(
+            owner_id=owner_id,
+            kind=kind,
+            item_id=item.pk,
+            time_created=item.time_created,
+        )
+        for owner_id in viewer_ids
+    )
+
+
+def retract(kind, item_id):
+    """Remove an item from every feed.
+
+    Args:
+        kind: TICKET or REVIEW
+        item_id: Id of the deleted ticket or review
+    """
+    FeedEntry.objects.filter(kind=kind, item_id=item_id).delete()
+
+
+def backfill_follow(follower_id, followed_id):
+    """Add the posts of a newly followed user to the follower's feed.
+
+    Args:
+        follower_id: Id of the user who follows
+        followed_id: Id of the user being followed
+    """
+    backfill_follows(follower_id, [followed_id])
+
+
+def backfill_follows(follower_id, followed_ids):
+    """Add the posts of several newly followed users to the follower's feed.
+
+    Args:
+        follower_id: Id of the user who follows
+        followed_ids: Ids of the users being followed
+    """
+    tickets = Ticket.objects.filter(user_id__in=followed_ids)
+    reviews = Review.objects.filter(user_id__in=followed_ids)
+    _bulk_insert(
+        FeedEntry(owner_id=follower_id, kind=kind, item_id=pk, time_created=created)
+        for created, kind, pk in _keys(tickets, TICKET)
+        .union(_keys(reviews, REVIEW), all=True)
+        .iterator()
+    )
+
+
+def prune_follow(follower_id, followed_id):
+    """Remove the posts of an unfollowed user from the former follower's feed.
+
+    Reviews posted on the follower's own tickets stay in the feed since they
+    remain visible without the follow relationship.
+
+    Args:
+        follower_id: Id of the user who followed
+        followed_id: Id of the user who was followed
+    """
+    prune_follows(follower_id, [followed_id])
+
+
+def prune_follows(follower_id, followed_ids):
+    """Remove the posts of several unfollowed users from a feed.
+
+    Args:
+        follower_id: Id of the user who followed
+        followed_ids: Ids of the users who were followed
+    """
+    FeedEntry.objects.filter(
+        owner_id=follower_id,
+        kind=TICKET,
+        item_id__in=Ticket.objects.filter(user_id__in=followed_ids).values("id"),
+    ).delete()
+    FeedEntry.objects.filter(
+        owner_id=follower_id,
+        kind=REVIEW,
+        item_id__in=Review.objects.filter(user_id__in=followed_ids)
+        .exclude(ticket__user_id=follower_id)
+        .values("id"),
+    ).delete()
+
+
+def prune_followers(followed_id, follower_ids):
+    """Remove the posts of a user from the feeds of several former followers.
+
+    Reviews posted on a follower's own tickets stay in that follower's feed.
+
+    Args:
+        followed_id: Id of the user who was followed
+        follower_ids: Ids of the users who followed them
+    """
+    FeedEntry.objects.filter(
+        owner_id__in=follower_ids,
+        kind=TICKET,
+        item_id__in=Ticket.objects.filter(user_id=followed_id).values("id"),
+    ).delete()
+    FeedEntry.objects.filter(
+        owner_id__in=follower_ids,
+        kind=REVIEW,
+        item_id__in=Review.objects.filter(user_id=followed_id).values("id"),
+    ).exclude(
+        Exists(
+            Review.objects.filter(
+                pk=OuterRef("item_id"), ticket__user_id=OuterRef("owner_id")
+            )
+        )
+    ).delete()
+
+
+def query_feed_keys(user):
+    """Compute every key of the home feed of ``user`` from the source tables.
+
+    Args:
+        user: The viewing user
+
+    Returns:
+        QuerySet: Unordered ``(time_created, kind, id)`` rows
+    """
+    return _keys(feed_tickets(user), TICKET).union(
+        _keys(feed_reviews(user), REVIEW), all=True
+    )
+
+
+@transaction.atomic
+def rebuild_user_feed(user):
+    """Recompute the materialized feed of ``user`` from the source tables.
+
+    Args:
+        user: The owner of the feed
+
+    Returns:
+        int: Number of entries written
+    """
+    FeedEntry.objects.filter(owner=user).delete()
+    keys = list(query_feed_keys(user).iterator())
+    _bulk_insert(
+        FeedEntry(owner=user, kind=kind, item_id=pk, time_created=created)
+        for created, kind, pk in keys
+    )
+    return len(keys)
+
+
+@transaction.atomic
+def rebuild_all_feeds():
+    """Recompute the materialized feeds of all users with set-based queries.
+
+    Used after bulk loads, which bypass the signal receivers. Each visibility
+    rule is one ``INSERT ... SELECT``, so the cost does not depend on the
+    number of users.
+
+    Returns:
+        int: Number of entries written
+    """
+    quote = connection.ops.quote_name
+    entries = quote(FeedEntry._meta.db_table)
+    tickets = quote(Ticket._meta.db_table)
+    reviews = quote(Review._meta.db_table)
+    follows = quote(UserFollows._meta.db_table)
+    insert = f"INSERT INTO {entries} (owner_id, kind, item_id, time_created) "
+    # "WHERE 1 = 1" lets SQLite parse ON CONFLICT after a join
+    ignore_duplicates = " WHERE 1 = 1 ON CONFLICT DO NOTHING"
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {entries}")
+        # Tickets: the author and their followers
+        cursor.execute(
+            insert + f"SELECT t.user_id, %s, t.id, t.time_created FROM {tickets} t",
+            [TICKET],
+        )
+        cursor.execute(
+            insert + f"SELECT f.user_id, %s, t.id, t.time_created FROM {tickets} t "
+            f"JOIN {follows} f ON f.followed_user_id = t.user_id",
+            [TICKET],
+        )
+        # Reviews: the author, their followers and the owner of the ticket
+        cursor.execute(
+            insert + f"SELECT r.user_id, %s, r.id, r.time_created FROM {reviews} r",
+            [REVIEW],
+        )
+        cursor.execute(
+            insert + f"SELECT f.user_id, %s, r.id, r.time_created FROM {reviews} r "
+            f"JOIN {follows} f ON f.followed_user_id = r.user_id" + ignore_duplicates,
+            [REVIEW],
+        )
+        cursor.execute(
+            insert + f"SELECT t.user_id, %s, r.id, r.time_created FROM {reviews} r "
+            f"JOIN {tickets} t ON t.id = r.ticket_id" + ignore_duplicates,
+            [REVIEW],
+        )
+    return FeedEntry.objects.count()
+
+
+def diff_user_feed(user):
+    """Compare the materialized feed of ``user`` with the query-based feed.
+
+    Args:
+        user: The owner of the feed
+
+    Returns:
+        tuple: ``(missing, extra)`` sets of FeedCursor keys, where ``missing``
+        are expected but not materialized and ``extra`` are materialized but
+        not expected
+    """
+    expected = {FeedCursor(*row) for row in query_feed_keys(user).iterator()}
+    actual = {
+        FeedCursor(*row)
+        for row in FeedEntry.objects.filter(owner=user)
+        .values_list("time_created", "kind", "item_id")
+        .iterator()
+    }
+    return expected - actual, actual - expected
@@ -0,0 +1,148 @@
+"""Per-user cache of home feed pages.
+
+Pages are stored in Django's cache framework under a key that includes a
+per-user version number. Invalidating a user's feed bumps that version, so
+every cached page of the user becomes unreachable at once and ages out of
+the cache on its own. Hit, miss and invalidation counters are kept in the
+memory of each process, off the cache, so counting a hit costs no cache
+call.
+
+With the default LocMemCache, each process has its own cache and only sees
+the invalidations it makes: the other processes can serve a page cached
+before a change until ``FEED_CACHE_TIMEOUT`` expires. Use a shared backend
+when running several processes.
+
+Invalidating also bumps the ``pages_version`` column of the users, in the
+transaction of the change. The ETags of the per-user pages are built from
+that column rather than from the cached version, so they stay correct when
+the workers do not share a cache.
+"""
+
+import threading
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F
+
+from .feed import FAN_OUT_BATCH_SIZE, FEED_PAGE_SIZE, get_feed_page
+
+User = get_user_model()
+
+FEED_CACHE_ALIAS = getattr(settings, "FEED_CACHE_ALIAS", "default")
+FEED_CACHE_TIMEOUT = getattr(settings, "FEED_CACHE_TIMEOUT", 300)
+
+HITS = "hits"
+MISSES = "misses"
+INVALIDATIONS = "invalidations"
+
+_stats_lock = threading.Lock()
+_stats = {HITS: 0, MISSES: 0, INVALIDATIONS: 0}
+
+
+def _cache():
+    return caches[FEED_CACHE_ALIAS]
+
+
+def _version_key(user_id):
+    return f"feed:version:{user_id}"
+
+
+def _count(name, delta=1):
+    """Increment one of the counters of this process."""
+    with _stats_lock:
+        _stats[name] += delta
+
+
+def feed_version(user_id):
+    """Return the current cache version of a user's feed.
+
+    A missing version is initialized from the clock rather than from zero,
+    so pages cached under a version that was evicted can never be reached
+    again.
+
+    Args:
+        user_id: Id of the owner of the feed
+
+    Returns:
+        int: The current version
+    """
+    cache = _cache()
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def get_page(user, before=None, limit=FEED_PAGE_SIZE):
+    """Return one page of the home feed of ``user``, from the cache if possible.
+
+    Args:
+        user: The viewing user
+        before: Optional cursor of the last item of the previous page
+        limit: Number of items per page
+
+    Returns:
+        FeedPage: The requested page
+    """
+    cache = _cache()
+    cursor = before.encode() if before is not None else "first"
+    key = f"feed:page:{user.pk}:{feed_version(user.pk)}:{cursor}:{limit}"
+
+    page = cache.get(key)
+    if page is not None:
+        _count(HITS)
+        return page
+
+    _count(MISSES)
+    page = get_feed_page(user, before=before, limit=limit)
+    cache.set(key, page, FEED_CACHE_TIMEOUT)
+    return page
+
+
+def _bump(user_ids):
+    cache = _cache()
+    for user_id in user_ids:
+        try:
+            cache.incr(_version_key(user_id))
+        except ValueError:
+            # No version means no reachable page for this user
+            pass
+    _count(INVALIDATIONS, len(user_ids))
+
+
+def invalidate(user_ids):
+    """Invalidate the cached feed pages of several users.
+
+    The stored page versions are bumped right away, so they are committed
+    with the change. The cache versions are bumped once the current
+    transaction is committed, so a concurrent request cannot cache a page
+    read before the change.
+
+    Args:
+        user_ids: Ids of the users whose feed changed
+    """
+    user_ids = set(user_ids)
+    remaining = iter(sorted(user_ids))
+    while batch := list(islice(remaining, FAN_OUT_BATCH_SIZE)):
+        User.objects.filter(pk__in=batch).update(pages_version=F("pages_version") + 1)
+    if user_ids:
+        transaction.on_commit(lambda: _bump(user_ids))
+
+
+def stats():
+    """Return the counters of the feed cache in this process.
+
+    Returns:
+        dict: Hit, miss and invalidation counts, and the hit rate
+    """
+    with _stats_lock:
+        counters = dict(_stats)
+    lookups = counters[HITS] + counters[MISSES]
+    counters["hit_rate"] = counters[HITS] / lookups if lookups else None
+    return counters
@@ -1,7 +1,10 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth import get_user_model
-from .models import UserFollows, Ticket, Review
+from django.core.files.uploadedfile import UploadedFile
+from .images import ImageTooLarge, check_size, max_pixels
+from .models import Ticket, Review
+from .social_graph import relationship
 
 User = get_user_model()
 
@@ -66,6 +69,7 @@ class UserFollowForm(forms.Form):
                 "class": "form-control",
                 "placeholder": "Entrez le nom d'utilisateur",
                 "autocomplete": "off",
+                "list": "username-suggestions",
             }
         ),
     )
@@ -77,7 +81,11 @@ class UserFollowForm(forms.Form):
         - User exists
         - Not trying to follow self
         - Not already following
-        - No blocking relationships in either direction
+
+        The follow check uses the cached relations of the current user. The
+        blocks are checked once, against the database, by
+        ``UserFollows.clean`` when the follow is saved. The user found is
+        kept in ``user_to_follow``.
 
         Returns:
             str: The validated username
@@ -91,43 +99,19 @@ class UserFollowForm(forms.Form):
 
         try:
             user_to_follow = User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise forms.ValidationError(f"L'utilisateur {username} n'existe pas.")
+        self.user_to_follow = user_to_follow
+        if not self.request:
+            return username
 
-            if self.request and self.request.user == user_to_follow:
-                raise forms.ValidationError("Vous ne pouvez pas vous suivre vous-même.")
-
-            if (
-                self.request
-                and UserFollows.objects.filter(
-                    user=self.request.user, followed_user=user_to_follow
-                ).exists()
-            ):
-                raise forms.ValidationError(f"Vous suivez déjà {username}.")
-
-            # Check if the user has blocked the user they're trying to follow
-            if (
-                self.request
-                and self.request.user.blocking.filter(
-                    blocked_user=user_to_follow
-                ).exists()
-            ):
-                raise forms.ValidationError(
-                    "Vous ne pouvez pas suivre un utilisateur que vous avez bloqué."
-                )
+        if self.request.user == user_to_follow:
+            raise forms.ValidationError("Vous ne pouvez pas vous suivre vous-même.")
 
-            # Check if the target user has blocked the current user
-            if (
-                self.request
-                and user_to_follow.blocking.filter(
-                    blocked_user=self.request.user
-                ).exists()
-            ):
-                raise forms.ValidationError(
-                    "Vous ne pouvez pas suivre cet utilisateur car il vous a bloqué."
-                )
+        if relationship(self.request.user.pk, user_to_follow.pk).following:
+            raise forms.ValidationError(f"Vous suivez déjà {username}.")
 
-            return username
-        except User.DoesNotExist:
-            raise forms.ValidationError(f"L'utilisateur {username} n'existe pas.")
+        return username
 
     def __init__(self, *args, **kwargs):
         """Initialize the form with request context.
@@ -139,6 +123,7 @@ class UserFollowForm(forms.Form):
             **kwargs: Arbitrary keyword arguments with 'request' key
         """
         self.request = kwargs.pop("request", None)
+        self.user_to_follow = None
         super().__init__(*args, **kwargs)
 
 
@@ -158,6 +143,30 @@ class TicketForm(forms.ModelForm):
             "image": forms.FileInput(attrs={"class": "form-control"}),
         }
 
+    def clean_image(self):
+        """Reject uploads with too many pixels.
+
+        The size comes from the image headers read by the ImageField
+        validation: no pixel is decoded.
+
+        Returns:
+            The uploaded image, or the current image if none was uploaded
+
+        Raises:
+            ValidationError: If the uploaded image is too large
+        """
+        image = self.cleaned_data.get("image")
+        if isinstance(image, UploadedFile):
+            try:
+                check_size(image.image.size)
+            except ImageTooLarge:
+                width, height = image.image.size
+                raise forms.ValidationError(
+                    f"L'image est trop grande ({width} x {height} pixels, "
+                    f"{max_pixels() // 1_000_000} millions de pixels au maximum)."
+                )
+        return image
+
 
 class ReviewForm(forms.ModelForm):
     """Form for creating and editing reviews.
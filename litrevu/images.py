@@ -0,0 +1,569 @@
+"""Background processing of the ticket images.
+
+Views store the uploaded image as is and return; the ticket is saved with
+``image_state`` set to pending. Once the transaction commits, the ticket is
+submitted to a bounded pool of threads which decodes the upload and encodes
+its renditions (see RENDITIONS and FORMATS), then points the ticket at the
+full JPEG rendition, records the others and marks it ready. Pillow
+releases the GIL while decoding, resizing and encoding, so threads are
+enough to keep this work off the request threads.
+
+The pool is configured with two settings:
+
+- ``IMAGE_PROCESSING_WORKERS``: number of threads. With 0, images are
+  processed in the committing thread, which suits tests and commands.
+- ``IMAGE_PROCESSING_QUEUE_SIZE``: number of images waiting or being
+  processed. When the queue is full, the image is processed in the
+  committing thread, which slows the request down rather than letting the
+  backlog grow without bounds.
+
+Images still pending after a restart are processed by the
+``process_pending_images`` command.
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.urls import reverse
+from PIL import Image
+
+from .models import Ticket
+
+logger = logging.getLogger(__name__)
+
+# Renditions of each ticket image, by the side of the square they fit in.
+# The full JPEG rendition is the ticket's image field itself.
+RENDITIONS = {"thumb": 200, "card": 400, "full": 800}
+FULL = "full"
+
+PROCESSED_DIRECTORY = "tickets/processed"
+RENDITIONS_DIRECTORY = "tickets/renditions"
+
+# Images are reduced by integer factors down to this multiple of the target
+# size before being resampled
+REDUCING_GAP = 3.0
+
+# Pillow format, file extension and quality of each rendition format
+FORMATS = {"jpeg": ("JPEG", "jpg", 85), "webp": ("WEBP", "webp", 80)}
+
+_executor = None
+_lock = threading.Lock()
+_metrics = {
+    "submitted": 0,
+    "processed": 0,
+    "failed": 0,
+    "reused": 0,
+    "inline": 0,
+    "queued": 0,
+    "processing_seconds": 0.0,
+    "max_processing_seconds": 0.0,
+}
+
+
+def _workers():
+    return getattr(settings, "IMAGE_PROCESSING_WORKERS", 2)
+
+
+def _queue_size():
+    return getattr(settings, "IMAGE_PROCESSING_QUEUE_SIZE", 100)
+
+
+def _get_executor():
+    """Return the thread pool of this process, creating it on first use."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=_workers(), thread_name_prefix="litrevu-images"
+        )
+    return _executor
+
+
+def fit(size, max_side):
+    """Return the size of an image scaled down to fit in a square.
+
+    Args:
+        size: Width and height of the image
+        max_side: Side of the square
+
+    Returns:
+        tuple: Width and height, never larger than ``size``
+    """
+    scale = min(1, max_side / max(size))
+    return max(1, round(size[0] * scale)), max(1, round(size[1] * scale))
+
+
+class ImageTooLarge(ValueError):
+    """Raised when an image has more pixels than IMAGE_MAX_PIXELS."""
+
+
+def max_pixels():
+    return getattr(settings, "IMAGE_MAX_PIXELS", 50_000_000)
+
+
+def check_size(size):
+    """Reject an image with more pixels than allowed.
+
+    Called with the size read from the image headers, before any pixel is
+    decoded, so that decompression bombs are rejected cheaply.
+
+    Args:
+        size: Width and height of the image
+
+    Raises:
+        ImageTooLarge: If the image has more than IMAGE_MAX_PIXELS pixels
+    """
+    if size[0] * size[1] > max_pixels():
+        raise ImageTooLarge(f"Image of {size[0]}x{size[1]} pixels is too large")
+
+
+def open_rgb(image_file, max_side):
+    """Decode an image near the size it will be displayed at.
+
+    Only the headers are read until the size is checked. JPEG images are
+    then decoded directly at 1/2, 1/4 or 1/8 of their size when that is
+    still larger than ``max_side``, which is much cheaper than decoding
+    every pixel.
+
+    Args:
+        image_file: Readable file of the image
+        max_side: Side of the square the image will be resized to fit in
+
+    Returns:
+        tuple: The decoded RGB image, and the size of the original image
+
+    Raises:
+        ImageTooLarge: If the image has too many pixels
+    """
+    img = Image.open(image_file)
+    size = img.size
+    check_size(size)
+    img.draft("RGB", fit(size, max_side))
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    return img, size
+
+
+def shrink(img, size):
+    """Resize an image to ``size``.
+
+    With a reducing gap, the image is first reduced by an integer factor
+    with ``reduce()``, which is cheap, down to three times the target size;
+    LANCZOS then only resamples the reduced image.
+
+    Args:
+        img: Decoded image
+        size: Target width and height
+
+    Returns:
+        PIL.Image.Image: The resized image
+    """
+    if size == img.size:
+        return img
+    return img.resize(size, Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
+
+
+def encode(img, size, image_format):
+    """Resize an image and encode it.
+
+    Args:
+        img: Decoded RGB image
+        size: Width and height of the rendition
+        image_format: Key of FORMATS
+
+    Returns:
+        bytes: The encoded rendition
+    """
+    img = shrink(img, size)
+    pil_format, _, quality = FORMATS[image_format]
+    output = BytesIO()
+    img.save(output, format=pil_format, quality=quality)
+    return output.getvalue()
+
+
+def render(image_file):
+    """Produce the full JPEG image and all the other renditions of an upload.
+
+    The upload is decoded once; every rendition is resized from the full
+    image.
+
+    Args:
+        image_file: Readable file of the original image
+
+    Returns:
+        tuple: The full JPEG data, its size, and the data of the other
+            renditions by rendition key
+
+    Raises:
+        ImageTooLarge: If the image has too many pixels
+    """
+    img, source_size = open_rgb(image_file, RENDITIONS[FULL])
+    size = fit(source_size, RENDITIONS[FULL])
+    img = shrink(img, size)
+    renditions = {
+        rendition_key(rendition, image_format): encode(
+            img, fit(size, max_side), image_format
+        )
+        for rendition, max_side in RENDITIONS.items()
+        for image_format in FORMATS
+    }
+    return renditions.pop(rendition_key(FULL, "jpeg")), size, renditions
+
+
+def rendition_key(rendition, image_format):
+    """Return the key of a rendition in ``Ticket.image_renditions``.
+
+    Args:
+        rendition: Key of RENDITIONS
+        image_format: Key of FORMATS
+
+    Returns:
+        str: e.g. "card.webp"
+    """
+    return f"{rendition}.{image_format}"
+
+
+def processed_name():
+    """Return the name hint of a processed image.
+
+    The storage names the file after its content; the hint only gives the
+    directory and the extension.
+    """
+    return os.path.join(PROCESSED_DIRECTORY, "image.jpg")
+
+
+def rendition_name(rendition, image_format):
+    """Return the name hint of a rendition.
+
+    Args:
+        rendition: Key of RENDITIONS
+        image_format: Key of FORMATS
+
+    Returns:
+        str: e.g. "tickets/renditions/card.webp"
+    """
+    extension = FORMATS[image_format][1]
+    return os.path.join(RENDITIONS_DIRECTORY, f"{rendition}.{extension}")
+
+
+def stored_names(image_name, renditions):
+    """Return the storage names of an image and of its renditions.
+
+    Args:
+        image_name: Storage name of the ticket image
+        renditions: Value of ``Ticket.image_renditions``
+
+    Returns:
+        list: The storage names
+    """
+    return [image_name, *renditions.get("files", {}).values()]
+
+
+def release(image_hash, names):
+    """Delete the files of an image that no ticket references any more.
+
+    Files are shared by every ticket with the same source image, so a file
+    is only deleted when no ticket has the same ``image_hash`` or uses the
+    file as its image.
+
+    Args:
+        image_hash: SHA-256 of the source image, or "" if unknown
+        names: Storage names of the image and of its renditions
+    """
+    if image_hash and Ticket.objects.filter(image_hash=image_hash).exists():
+        return
+    storage = Ticket._meta.get_field("image").storage
+    for name in names:
+        if name and not Ticket.objects.filter(image=name).exists():
+            storage.delete(name)
+
+
+def release_on_commit(image_hash, names):
+    """Call ``release`` once the transaction commits.
+
+    Args:
+        image_hash: SHA-256 of the source image, or "" if unknown
+        names: Storage names of the image and of its renditions
+    """
+    names = list(names)
+    transaction.on_commit(lambda: release(image_hash, names))
+
+
+def _adopt(ticket_id, upload_name, processed):
+    """Point a pending ticket at processed files and mark it ready.
+
+    Args:
+        ticket_id: Id of the ticket
+        upload_name: Storage name of the upload that was processed
+        processed: Values of ``Ticket.PROCESSED_IMAGE_FIELDS``
+
+    Returns:
+        bool: False if the image of the ticket changed in the meantime
+    """
+    with transaction.atomic():
+        ticket = Ticket.objects.filter(pk=ticket_id, image=upload_name).first()
+        if ticket is None:
+            return False
+        for field, value in processed.items():
+            setattr(ticket, field, value)
+        ticket.image_state = Ticket.ImageState.READY
+        # Saving the instance invalidates the cached feeds showing it
+        ticket.save(update_fields=[*processed, "image_state"])
+    return True
+
+
+def _fail(ticket_id, upload_name):
+    """Mark the image of a pending ticket as failed.
+
+    Args:
+        ticket_id: Id of the ticket
+        upload_name: Storage name of the upload that could not be processed
+    """
+    with transaction.atomic():
+        ticket = Ticket.objects.filter(pk=ticket_id, image=upload_name).first()
+        if ticket is None:
+            return
+        ticket.image_state = Ticket.ImageState.FAILED
+        # Saving the instance invalidates the cached feeds showing it
+        ticket.save(update_fields=["image_state"])
+
+
+def process_ticket_image(ticket_id):
+    """Process the pending image of a ticket.
+
+    Does nothing if the ticket is gone or its image is no longer pending.
+    If another ticket with the same source image is ready, its files are
+    reused without decoding anything. If the image was replaced while it
+    was processed, the processed files are released: the new upload has its
+    own job.
+
+    Args:
+        ticket_id: Id of the ticket
+
+    Returns:
+        bool: True if the ticket now has a processed image
+    """
+    ticket = Ticket.objects.filter(
+        pk=ticket_id, image_state=Ticket.ImageState.PENDING
+    ).first()
+    if ticket is None or not ticket.image:
+        return False
+
+    upload_name = ticket.image.name
+    storage = ticket.image.storage
+    start = time.perf_counter()
+    processed = (
+        Ticket.objects.filter(
+            image_hash=ticket.image_hash, image_state=Ticket.ImageState.READY
+        )
+        .values(*Ticket.PROCESSED_IMAGE_FIELDS)
+        .first()
+    )
+    if processed and processed["image_width"] is not None:
+        adopted = _adopt(ticket_id, upload_name, processed)
+        if adopted:
+            release("", [upload_name])
+            _record("reused", time.perf_counter() - start)
+        return adopted
+
+    try:
+        with ticket.image.open("rb") as upload:
+            data, size, renditions = render(upload)
+    except Exception:
+        logger.exception("Could not process the image of ticket %s", ticket_id)
+        _fail(ticket_id, upload_name)
+        _record("failed", time.perf_counter() - start)
+        return False
+
+    name = storage.save(processed_name(), ContentFile(data))
+    files = {}
+    for key, rendition_data in renditions.items():
+        rendition, image_format = key.split(".")
+        files[key] = storage.save(
+            rendition_name(rendition, image_format), ContentFile(rendition_data)
+        )
+    processed = {
+        "image": name,
+        "image_renditions": {"files": files},
+        "image_width": size[0],
+        "image_height": size[1],
+        "image_size": len(data),
+    }
+    if not _adopt(ticket_id, upload_name, processed):
+        release(ticket.image_hash, stored_names(name, {"files": files}))
+        return False
+    # Other pending tickets may share the upload
+    release("", [upload_name])
+    _record("processed", time.perf_counter() - start)
+    return True
+
+
+def ensure_rendition(ticket, rendition, image_format):
+    """Return the storage name of a rendition, generating it if it is missing.
+
+    Renditions missing from the ticket, or whose file is gone, are resized
+    from the processed image and recorded on the ticket, with the size of
+    the image if it was not known yet.
+
+    Args:
+        ticket: Ticket with a processed image
+        rendition: Key of RENDITIONS
+        image_format: Key of FORMATS
+
+    Returns:
+        str: Storage name of the rendition
+    """
+    if (rendition, image_format) == (FULL, "jpeg"):
+        return ticket.image.name
+    key = rendition_key(rendition, image_format)
+    storage = ticket.image.storage
+    name = ticket.image_renditions.get("files", {}).get(key)
+    if name and storage.exists(name):
+        return name
+
+    with ticket.image.open("rb") as image_file:
+        img, size = open_rgb(image_file, RENDITIONS[rendition])
+        data = encode(img, fit(size, RENDITIONS[rendition]), image_format)
+    name = storage.save(rendition_name(rendition, image_format), ContentFile(data))
+    with transaction.atomic():
+        current = (
+            Ticket.objects.filter(pk=ticket.pk, image=ticket.image.name)
+            .values_list("image_renditions", flat=True)
+            .first()
+        )
+        if current is not None:
+            current = {**current, "files": {**current.get("files", {}), key: name}}
+            # Tickets sharing the image share its renditions
+            Ticket.objects.filter(image=ticket.image.name).update(
+                image_renditions=current, image_width=size[0], image_height=size[1]
+            )
+            ticket.image_renditions = current
+            ticket.image_width, ticket.image_height = size
+    return name
+
+
+def picture(ticket, rendition):
+    """Return the URLs and sizes needed to display a ticket image.
+
+    Renditions not generated yet point to the ``ticket_rendition`` view,
+    which generates them on first request. Only the fields of the ticket
+    are read: the image file is never opened.
+
+    Args:
+        ticket: Ticket with a processed image
+        rendition: Key of RENDITIONS used as the default source
+
+    Returns:
+        dict: "src", "width" and "height" of the default source, and a
+            srcset per format; None if the size of the image is not known
+    """
+    if ticket.image_width is None or ticket.image_height is None:
+        return None
+    size = (ticket.image_width, ticket.image_height)
+    files = ticket.image_renditions.get("files", {})
+    storage = ticket.image.storage
+
+    def url(name, image_format):
+        if (name, image_format) == (FULL, "jpeg"):
+            return ticket.image.url
+        stored = files.get(rendition_key(name, image_format))
+        if stored:
+            return storage.url(stored)
+        return reverse(
+            "litrevu:ticket_rendition",
+            args=[ticket.pk, name, FORMATS[image_format][1]],
+        )
+
+    srcsets = {}
+    for image_format in FORMATS:
+        candidates = {}
+        for name, max_side in RENDITIONS.items():
+            # Renditions of an image smaller than their size are duplicates
+            candidates.setdefault(fit(size, max_side)[0], url(name, image_format))
+        srcsets[image_format] = ", ".join(
+            f"{candidate} {width}w" for width, candidate in sorted(candidates.items())
+        )
+    width, height = fit(size, RENDITIONS[rendition])
+    return {
+        "src": url(rendition, "jpeg"),
+        "srcset": srcsets["jpeg"],
+        "webp_srcset": srcsets["webp"],
+        "width": width,
+        "height": height,
+    }
+
+
+def _record(outcome, seconds):
+    with _lock:
+        _metrics[outcome] += 1
+        _metrics["processing_seconds"] += seconds
+        _metrics["max_processing_seconds"] = max(
+            _metrics["max_processing_seconds"], seconds
+        )
+
+
+def _run(ticket_id):
+    """Process an image in a pool thread."""
+    try:
+        process_ticket_image(ticket_id)
+    except Exception:
+        logger.exception("Image job of ticket %s failed", ticket_id)
+    finally:
+        with _lock:
+            _metrics["queued"] -= 1
+        # Pool threads are long-lived: do not keep their connections open
+        close_old_connections()
+
+
+def submit(ticket_id):
+    """Queue the processing of the pending image of a ticket.
+
+    The image is processed in the calling thread if the pool is disabled or
+    its queue is full.
+
+    Args:
+        ticket_id: Id of the ticket
+    """
+    with _lock:
+        _metrics["submitted"] += 1
+        queued = _workers() > 0 and _metrics["queued"] < _queue_size()
+        if queued:
+            _metrics["queued"] += 1
+        else:
+            _metrics["inline"] += 1
+    if queued:
+        _get_executor().submit(_run, ticket_id)
+    else:
+        process_ticket_image(ticket_id)
+
+
+def submit_on_commit(ticket):
+    """Queue the processing of a ticket's image once the transaction commits.
+
+    Args:
+        ticket: Ticket whose image was just uploaded
+    """
+    ticket_id = ticket.pk
+    transaction.on_commit(lambda: submit(ticket_id))
+
+
+def stats():
+    """Return the metrics of the image processing of this process.
+
+    Returns:
+        dict: Job counts, current queue depth and processing times in seconds
+    """
+    with _lock:
+        metrics = dict(_metrics)
+    done = metrics["processed"] + metrics["failed"] + metrics["reused"]
+    metrics["queue_depth"] = metrics.pop("queued")
+    metrics["mean_processing_seconds"] = (
+        metrics["processing_seconds"] / done if done else None
+    )
+    return metrics
@@ -0,0 +1,84 @@
+"""Management command to record the size of the images processed earlier.
+
+Tickets whose image was stored before its width, height and file size were
+recorded are displayed without explicit dimensions. This command reads them
+once from the files: only the image headers are read, and a file shared by
+several tickets is read once for all of them.
+"""
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from PIL import Image, UnidentifiedImageError
+
+from litrevu.models import Ticket
+
+
+class Command(BaseCommand):
+    """Django management command to backfill the ticket image dimensions.
+
+    Images are read in batches of distinct storage names, in name order, so
+    the command can be interrupted and run again.
+    """
+
+    help = "Records the width, height and file size of the ticket images"
+
+    def add_arguments(self, parser):
+        """Add the command line arguments.
+
+        Args:
+            parser: The argument parser of the command
+        """
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of distinct images read per batch",
+        )
+
+    def handle(self, *args, **options):
+        """Execute the command to backfill the dimensions.
+
+        Args:
+            *args: Variable length argument list
+            **options: Parsed command line options
+        """
+        missing = (
+            Ticket.objects.filter(image_state=Ticket.ImageState.READY)
+            .exclude(image="")
+            .exclude(image=None)
+            .filter(Q(image_width=None) | Q(image_height=None) | Q(image_size=None))
+        )
+        storage = Ticket._meta.get_field("image").storage
+        updated = unreadable = 0
+        last = ""
+        while True:
+            names = list(
+                missing.filter(image__gt=last)
+                .order_by("image")
+                .values_list("image", flat=True)
+                .distinct()[: options["batch_size"]]
+            )
+            if not names:
+                break
+            last = names[-1]
+            for name in names:
+                try:
+                    with storage.open(name, "rb") as image_file:
+                        with Image.open(image_file) as img:
+                            width, height = img.size
+                    size = storage.size(name)
+                except (OSError, UnidentifiedImageError) as error:
+                    unreadable += 1
+                    self.stderr.write(f"Cannot read {name}: {error}")
+                    continue
+                updated += missing.filter(image=name).update(
+                    image_width=width, image_height=height, image_size=size
+                )
+            self.stdout.write(f"Read {len(names)} images, up to {last}")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Recorded the dimensions of {updated} tickets, "
+                f"{unreadable} images could not be read"
+            )
+        )
@@ -0,0 +1,456 @@
+"""Management command to benchmark the main read and write paths.
+
+Creates a throwaway test database, seeds it with ``generate_sample_data``
+and drives the home, posts and follows pages and the ticket, review, block
+and delete actions through the Django test client, as the user with the
+largest feed. For each path it reports latency percentiles, queries and
+rows fetched per request and the peak memory allocated by one request.
+
+Results can be written to a JSON file, and compared with the JSON file of
+an earlier run: the command then fails if a path got slower or heavier
+than the baseline beyond a tolerance.
+"""
+
+import json
+import platform
+import time
+import tracemalloc
+from io import StringIO
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.backends.utils import CursorDebugWrapper, CursorWrapper
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from litrevu.models import FeedEntry, Review, Ticket, UserBlocks, UserFollows
+
+from .benchmark_asgi import CLIENT_DEFAULTS, percentile
+
+User = get_user_model()
+
+PATHS = [
+    "home",
+    "posts",
+    "follows_list",
+    "create_ticket",
+    "create_review",
+    "block_user",
+    "delete_ticket",
+]
+
+# Metrics compared with the baseline; higher is worse for all of them
+COMPARED_METRICS = ["p50_ms", "p95_ms", "queries", "rows", "peak_kib"]
+
+
+class CountingCursorMixin:
+    """Cursor wrapper mixin counting the queries run and the rows fetched."""
+
+    def __init__(self, cursor, db, counter):
+        super().__init__(cursor, db)
+        self.counter = counter
+
+    def execute(self, sql, params=None):
+        self.counter["queries"] += 1
+        return super().execute(sql, params)
+
+    def executemany(self, sql, param_list):
+        self.counter["queries"] += 1
+        return super().executemany(sql, param_list)
+
+    def fetchone(self):
+        with self.db.wrap_database_errors:
+            row = self.cursor.fetchone()
+        if row is not None:
+            self.counter["rows"] += 1
+        return row
+
+    def fetchmany(self, size=None):
+        with self.db.wrap_database_errors:
+            rows = self.cursor.fetchmany(size or self.cursor.arraysize)
+        self.counter["rows"] += len(rows)
+        return rows
+
+    def fetchall(self):
+        with self.db.wrap_database_errors:
+            rows = self.cursor.fetchall()
+        self.counter["rows"] += len(rows)
+        return rows
+
+
+class CountingCursorWrapper(CountingCursorMixin, CursorWrapper):
+    pass
+
+
+class CountingCursorDebugWrapper(CountingCursorMixin, CursorDebugWrapper):
+    pass
+
+
+class counting_queries:
+    """Count the queries and fetched rows of the default connection.
+
+    Attributes:
+        counter: Dict with the "queries" and "rows" counts so far
+    """
+
+    def __enter__(self):
+        self.counter = {"queries": 0, "rows": 0}
+        # The debug wrapper is used instead when queries are logged (DEBUG)
+        connection.make_cursor = lambda cursor: CountingCursorWrapper(
+            cursor, connection, self.counter
+        )
+        connection.make_debug_cursor = lambda cursor: CountingCursorDebugWrapper(
+            cursor, connection, self.counter
+        )
+        return self
+
+    def __exit__(self, *exc_info):
+        del connection.make_cursor
+        del connection.make_debug_cursor
+
+    def reset(self):
+        """Return the counts so far and start again from zero.
+
+        Returns:
+            tuple: Number of queries and of rows fetched
+        """
+        counts = self.counter["queries"], self.counter["rows"]
+        self.counter["queries"] = self.counter["rows"] = 0
+        return counts
+
+
+class Command(BaseCommand):
+    """Django management command to benchmark the main paths.
+
+    Nothing is written to the configured database: the data set lives in a
+    test database destroyed at the end. Each path gets a few warm-up
+    requests, then the measured ones, then one request traced with
+    tracemalloc for its peak memory.
+    """
+
+    help = "Benchmarks the feed, posts and write paths on a generated data set"
+
+    def add_arguments(self, parser):
+        """Add the command line arguments.
+
+        Args:
+            parser: The argument parser of the command
+        """
+        parser.add_argument("--users", type=int, default=1000, help="Number of users")
+        parser.add_argument(
+            "--follows", type=float, default=20, help="Mean number of followed users"
+        )
+        parser.add_argument(
+            "--follow-distribution",
+            choices=["uniform", "zipf"],
+            default="zipf",
+            help="Distribution of the follow degrees and of the followed users",
+        )
+        parser.add_argument(
+            "--tickets-per-user",
+            type=float,
+            default=5,
+            help="Mean number of tickets per user",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=42, help="Seed of the generated data set"
+        )
+        parser.add_argument(
+            "--requests", type=int, default=50, help="Measured requests per path"
+        )
+        parser.add_argument(
+            "--warmup", type=int, default=5, help="Unmeasured requests per path"
+        )
+        parser.add_argument(
+            "--path",
+            action="append",
+            choices=PATHS,
+            dest="paths",
+            help="Path to benchmark, can be repeated (defaults to all)",
+        )
+        parser.add_argument(
+            "--cache",
+            action="store_true",
+            help="Keep the configured cache instead of disabling it",
+        )
+        parser.add_argument("--output", help="JSON file the results are written to")
+        parser.add_argument(
+            "--baseline", help="JSON file of an earlier run to compare the results with"
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.25,
+            help="Allowed relative increase of each metric over the baseline",
+        )
+
+    def handle(self, *args, **options):
+        """Execute the command to run the benchmark.
+
+        Args:
+            *args: Variable length argument list
+            **options: Parsed command line options
+
+        Raises:
+            CommandError: If the data set is too small for the number of
+                requests, if a request fails, or if a path regressed beyond
+                the tolerance
+        """
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"]) as baseline_file:
+                baseline = json.load(baseline_file)
+
+        overrides = {"ALLOWED_HOSTS": ["testserver"]}
+        if not options["cache"]:
+            overrides["CACHES"] = {
+                "default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}
+            }
+
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            self.stdout.write("Generating the data set...")
+            call_command(
+                "generate_sample_data",
+                users=options["users"],
+                follows=options["follows"],
+                follow_distribution=options["follow_distribution"],
+                tickets_per_user=options["tickets_per_user"],
+                seed=options["seed"],
+                stdout=StringIO(),
+            )
+            dataset = {
+                model.__name__: model.objects.count()
+                for model in (User, UserFollows, Ticket, Review, FeedEntry)
+            }
+            with override_settings(**overrides):
+                results = self.run_paths(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report = {
+            "environment": {
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": connection.vendor,
+            },
+            "options": {
+                name: options[name]
+                for name in (
+                    "users",
+                    "follows",
+                    "follow_distribution",
+                    "tickets_per_user",
+                    "seed",
+                    "requests",
+                    "warmup",
+                    "cache",
+                )
+            },
+            "dataset": dataset,
+            "paths": results,
+        }
+        if options["output"]:
+            with open(options["output"], "w") as output_file:
+                json.dump(report, output_file, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if baseline is not None:
+            regressions = self.compare(results, baseline, options["tolerance"])
+            if regressions:
+                raise CommandError(f"{regressions} regression(s) found")
+            self.stdout.write(self.style.SUCCESS("No regression found"))
+
+    def run_paths(self, options):
+        """Benchmark each path as the user with the largest feed.
+
+        Args:
+            options: Parsed command options
+
+        Returns:
+            dict: Metrics of each path, by path name
+        """
+        owner = (
+            FeedEntry.objects.values("owner")
+            .annotate(entries=Count("id"))
+            .order_by("-entries", "owner")
+            .first()
+        )
+        if owner is None:
+            raise CommandError("The data set has no feed to benchmark")
+        self.user = User.objects.get(pk=owner["owner"])
+        self.other_users = User.objects.exclude(pk=self.user.pk).order_by("pk")
+        self.block_targets = list(
+            UserFollows.objects.filter(user=self.user)
+            .order_by("followed_user")
+            .values_list("followed_user", flat=True)
+        ) + list(
+            self.other_users.exclude(followed_by__user=self.user).values_list(
+                "pk", flat=True
+            )
+        )
+        if len(self.block_targets) < options["warmup"] + options["requests"] + 1:
+            raise CommandError("Not enough users to block; use more --users")
+
+        self.client = Client(**CLIENT_DEFAULTS)
+        self.client.force_login(self.user)
+        self.stdout.write(f"Requesting as {self.user.username}")
+
+        results = {}
+        for path in options["paths"] or PATHS:
+            results[path] = self.run_path(path, options)
+            self.report(path, results[path])
+        return results
+
+    def run_path(self, path, options):
+        """Benchmark one path.
+
+        Args:
+            path: Name of the path, one of PATHS
+            options: Parsed command options
+
+        Returns:
+            dict: Latency percentiles in milliseconds, mean queries and rows
+                fetched per request and peak memory in KiB
+        """
+        prepare = getattr(self, f"prepare_{path}")
+        for _ in range(options["warmup"]):
+            self.send(*prepare())
+
+        latencies = []
+        queries = rows = 0
+        with counting_queries() as counts:
+            for _ in range(options["requests"]):
+                request = prepare()
+                counts.reset()
+                start = time.perf_counter()
+                self.send(*request)
+                latencies.append(time.perf_counter() - start)
+                request_queries, request_rows = counts.reset()
+                queries += request_queries
+                rows += request_rows
+
+        request = prepare()
+        tracemalloc.start()
+        try:
+            self.send(*request)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        latencies.sort()
+        return {
+            "requests": len(latencies),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+            "queries": round(queries / len(latencies), 2),
+            "rows": round(rows / len(latencies), 2),
+            "peak_kib": round(peak / 1024, 1),
+        }
+
+    def send(self, method, url, data, expected_status):
+        """Send a request with the logged-in client.
+
+        Args:
+            method: "get" or "post"
+            url: URL to request
+            data: POST data, or None
+            expected_status: Status code of a successful response
+
+        Raises:
+            CommandError: If the response has another status code
+        """
+        response = getattr(self.client, method)(url, data)
+        if response.status_code != expected_status:
+            raise CommandError(f"{url} returned {response.status_code}")
+
+    # Each prepare_<path> method sets up the data of one request outside of
+    # the measured time and returns the arguments of ``send``
+
+    def prepare_home(self):
+        return "get", reverse("litrevu:home"), None, 200
+
+    def prepare_posts(self):
+        return "get", reverse("litrevu:posts"), None, 200
+
+    def prepare_follows_list(self):
+        return "get", reverse("litrevu:follows"), None, 200
+
+    def prepare_create_ticket(self):
+        data = {"title": "Benchmark", "description": "Billet de benchmark"}
+        return "post", reverse("litrevu:create_ticket"), data, 302
+
+    def prepare_create_review(self):
+        ticket = Ticket.objects.create(
+            title="Benchmark",
+            description="Billet à critiquer",
+            user=self.other_users.first(),
+        )
+        url = reverse("litrevu:create_review_for_ticket", args=[ticket.pk])
+        data = {"headline": "Benchmark", "rating": 4, "body": "Critique"}
+        return "post", url, data, 302
+
+    def prepare_block_user(self):
+        user_id = self.block_targets.pop(0)
+        UserBlocks.objects.filter(user=self.user, blocked_user_id=user_id).delete()
+        return "post", reverse("litrevu:block", args=[user_id]), None, 302
+
+    def prepare_delete_ticket(self):
+        ticket = Ticket.objects.create(
+            title="Benchmark", description="Billet à supprimer", user=self.user
+        )
+        return "post", reverse("litrevu:delete_ticket", args=[ticket.pk]), None, 302
+
+    def report(self, path, metrics):
+        """Write the results of one path.
+
+        Args:
+            path: Name of the path
+            metrics: Metrics returned by ``run_path``
+        """
+        self.stdout.write(
+            f"{path:<14} "
+            f"p50={metrics['p50_ms']:8.2f} ms  "
+            f"p95={metrics['p95_ms']:8.2f} ms  "
+            f"p99={metrics['p99_ms']:8.2f} ms  "
+            f"queries={metrics['queries']:6.1f}  "
+            f"rows={metrics['rows']:8.1f}  "
+            f"peak={metrics['peak_kib']:8.1f} KiB"
+        )
+
+    def compare(self, results, baseline, tolerance):
+        """Report the metrics that exceed the baseline beyond the tolerance.
+
+        Args:
+            results: Metrics of this run, by path name
+            baseline: Report of an earlier run
+            tolerance: Allowed relative increase, 0.25 for 25%
+
+        Returns:
+            int: Number of regressed metrics
+        """
+        regressions = 0
+        for path, metrics in results.items():
+            reference = baseline.get("paths", {}).get(path)
+            if reference is None:
+                continue
+            for metric in COMPARED_METRICS:
+                limit = reference[metric] * (1 + tolerance)
+                if metrics[metric] > limit:
+                    regressions += 1
+                    self.stdout.write(
+                        self.style.ERROR(
+                            f"{path}: {metric} {metrics[metric]} > "
+                            f"{reference[metric]} + {tolerance:.0%}"
+                        )
+                    )
+        return regressions
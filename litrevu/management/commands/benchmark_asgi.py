@@ -0,0 +1,191 @@
+"""Management command to benchmark the home and posts pages under ASGI and WSGI.
+
+Requests the home and posts pages for one user through Django's WSGI
+handler (test client, one thread per concurrent request) and through its
+ASGI handler (async test client, one task per concurrent request), on the
+current database. Reports p50/p99 latency and requests per second for each
+page and handler.
+"""
+
+import asyncio
+import copy
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+User = get_user_model()
+
+PAGES = ["litrevu:home", "litrevu:posts"]
+
+# A remote address outside INTERNAL_IPS keeps the debug toolbar off
+CLIENT_DEFAULTS = {"REMOTE_ADDR": "192.0.2.1"}
+
+
+def percentile(values, fraction):
+    """Return the value below which ``fraction`` of the values fall.
+
+    Args:
+        values: Sorted list of numbers
+        fraction: Number between 0 and 1
+
+    Returns:
+        float: The nearest-rank percentile
+    """
+    index = max(0, min(len(values) - 1, round(fraction * len(values)) - 1))
+    return values[index]
+
+
+class Command(BaseCommand):
+    """Django management command to compare ASGI and WSGI serving.
+
+    Both handlers serve the same views, with the same middleware and data,
+    in this process. By default the cache is disabled so that every request
+    reaches the database.
+    """
+
+    help = "Benchmarks the home and posts pages under ASGI and WSGI"
+
+    def add_arguments(self, parser):
+        """Add the command line arguments.
+
+        Args:
+            parser: The argument parser of the command
+        """
+        parser.add_argument(
+            "--requests", type=int, default=200, help="Requests per page and handler"
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=10, help="Requests in flight"
+        )
+        parser.add_argument(
+            "--user", help="Username of the requesting user (defaults to the first)"
+        )
+        parser.add_argument(
+            "--cache",
+            action="store_true",
+            help="Keep the configured cache instead of disabling it",
+        )
+
+    def handle(self, *args, **options):
+        """Execute the command to run the benchmark.
+
+        Args:
+            *args: Variable length argument list
+            **options: Parsed command line options
+
+        Raises:
+            CommandError: If there is no user to request the pages as
+        """
+        users = User.objects.order_by("pk")
+        if options["user"]:
+            users = users.filter(username=options["user"])
+        user = users.first()
+        if user is None:
+            raise CommandError("No user to request the pages as")
+
+        overrides = {"ALLOWED_HOSTS": ["testserver"]}
+        if not options["cache"]:
+            overrides["CACHES"] = {
+                "default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}
+            }
+
+        with override_settings(**overrides):
+            client = Client(**CLIENT_DEFAULTS)
+            client.force_login(user)
+            try:
+                for page in PAGES:
+                    url = reverse(page)
+                    for handler, run in (
+                        ("WSGI", self.run_wsgi),
+                        ("ASGI", self.run_asgi),
+                    ):
+                        latencies, elapsed = run(
+                            client, url, options["requests"], options["concurrency"]
+                        )
+                        self.report(page, handler, latencies, elapsed)
+            finally:
+                client.logout()
+
+    def run_wsgi(self, client, url, requests, concurrency):
+        """Send the requests through the WSGI handler from a thread pool.
+
+        Args:
+            client: Logged-in test client whose session is reused
+            url: URL to request
+            requests: Number of requests
+            concurrency: Number of threads
+
+        Returns:
+            tuple: Sorted latencies in seconds and total elapsed time
+        """
+        local = threading.local()
+
+        def fetch(_):
+            if not hasattr(local, "client"):
+                local.client = Client(**CLIENT_DEFAULTS)
+                local.client.cookies = copy.copy(client.cookies)
+            start = time.perf_counter()
+            response = local.client.get(url)
+            latency = time.perf_counter() - start
+            if response.status_code != 200:
+                raise CommandError(f"{url} returned {response.status_code}")
+            return latency
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = list(executor.map(fetch, range(requests)))
+        return sorted(latencies), time.perf_counter() - start
+
+    def run_asgi(self, client, url, requests, concurrency):
+        """Send the requests through the ASGI handler from an event loop.
+
+        Args:
+            client: Logged-in test client whose session is reused
+            url: URL to request
+            requests: Number of requests
+            concurrency: Number of requests awaited at the same time
+
+        Returns:
+            tuple: Sorted latencies in seconds and total elapsed time
+        """
+        async_client = AsyncClient(**CLIENT_DEFAULTS)
+        async_client.cookies = copy.copy(client.cookies)
+
+        async def fetch(semaphore):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await async_client.get(url)
+                latency = time.perf_counter() - start
+            if response.status_code != 200:
+                raise CommandError(f"{url} returned {response.status_code}")
+            return latency
+
+        async def run():
+            semaphore = asyncio.Semaphore(concurrency)
+            return await asyncio.gather(*(fetch(semaphore) for _ in range(requests)))
+
+        start = time.perf_counter()
+        latencies = asyncio.run(run())
+        return sorted(latencies), time.perf_counter() - start
+
+    def report(self, page, handler, latencies, elapsed):
+        """Write the results of one run.
+
+        Args:
+            page: Name of the URL pattern of the page
+            handler: "WSGI" or "ASGI"
+            latencies: Sorted latencies in seconds
+            elapsed: Total duration of the run in seconds
+        """
+        self.stdout.write(
+            f"{page:<16} {handler}  "
+            f"p50={percentile(latencies, 0.50) * 1000:7.2f} ms  "
+            f"p99={percentile(latencies, 0.99) * 1000:7.2f} ms  "
+            f"{len(latencies) / elapsed:8.1f} req/s"
+        )
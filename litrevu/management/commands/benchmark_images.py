@@ -0,0 +1,196 @@
+"""Management command to benchmark the decoding of large ticket images.
+
+Generates a corpus of large synthetic JPEG and PNG images and processes it
+twice, each time in a fresh child process: with a full-resolution decode
+and a plain LANCZOS resize, as tickets used to be processed, and with the
+current pipeline of ``litrevu.images``, which decodes JPEG images at a
+reduced scale with ``draft()`` and resizes with ``reduce()`` first. Reports
+the CPU time and the peak RSS increase of each run.
+
+Also checks that an image over IMAGE_MAX_PIXELS is rejected from its
+headers, and reports how long that takes.
+"""
+
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+from io import BytesIO
+
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from litrevu import images
+
+FORMATS = {"jpeg": "jpg", "png": "png"}
+
+
+def synthetic_image(width, height):
+    """Return a noisy RGB image that compresses like a photo.
+
+    Args:
+        width: Width in pixels
+        height: Height in pixels
+
+    Returns:
+        PIL.Image.Image: The image
+    """
+    noise = Image.effect_noise((width, height), 48)
+    gradient = Image.linear_gradient("L").resize((width, height))
+    return Image.merge(
+        "RGB", (noise, gradient, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT))
+    )
+
+
+def full_decode_render(image_file):
+    """Render the renditions of an image the way tickets used to be processed.
+
+    Decodes every pixel of the upload and resamples it with LANCZOS only.
+
+    Args:
+        image_file: Readable file of the image
+
+    Returns:
+        int: Total size of the encoded renditions
+    """
+    img = Image.open(image_file)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    full = images.fit(img.size, images.RENDITIONS[images.FULL])
+    img = img.resize(full, Image.Resampling.LANCZOS)
+    total = 0
+    for max_side in images.RENDITIONS.values():
+        resized = img.resize(images.fit(full, max_side), Image.Resampling.LANCZOS)
+        for pil_format, _, quality in images.FORMATS.values():
+            output = BytesIO()
+            resized.save(output, format=pil_format, quality=quality)
+            total += output.tell()
+    return total
+
+
+def current_render(image_file):
+    """Render the renditions of an image with the current pipeline.
+
+    Args:
+        image_file: Readable file of the image
+
+    Returns:
+        int: Total size of the encoded renditions
+    """
+    data, _, renditions = images.render(image_file)
+    return len(data) + sum(len(rendition) for rendition in renditions.values())
+
+
+PIPELINES = {"full decode": full_decode_render, "draft + reduce": current_render}
+
+
+def _run_pipeline(pipeline, paths, results):
+    """Process the corpus in a child process and report its usage."""
+    start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.process_time()
+    for path in paths:
+        with open(path, "rb") as image_file:
+            PIPELINES[pipeline](image_file)
+    cpu = time.process_time() - start
+    # ru_maxrss is in KiB on Linux; a forked child starts at its current RSS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_rss
+    results.put((cpu, peak))
+
+
+class Command(BaseCommand):
+    """Django management command to benchmark the image decoding.
+
+    Each pipeline runs in its own forked process so that the peak RSS of
+    one run does not hide the other's.
+    """
+
+    help = "Compares full-resolution and reduced-scale decoding of large images"
+
+    def add_arguments(self, parser):
+        """Add the command line arguments.
+
+        Args:
+            parser: The argument parser of the command
+        """
+        parser.add_argument(
+            "--count", type=int, default=4, help="Images per format in the corpus"
+        )
+        parser.add_argument(
+            "--megapixels", type=float, default=20, help="Size of each image"
+        )
+        parser.add_argument(
+            "--format",
+            action="append",
+            choices=list(FORMATS),
+            dest="formats",
+            help="Format of the corpus, can be repeated (defaults to all)",
+        )
+
+    def handle(self, *args, **options):
+        """Execute the command to run the benchmark.
+
+        Args:
+            *args: Variable length argument list
+            **options: Parsed command line options
+
+        Raises:
+            CommandError: If an oversized image is not rejected
+        """
+        width = round((options["megapixels"] * 1_000_000 * 4 / 3) ** 0.5)
+        height = width * 3 // 4
+        context = multiprocessing.get_context("fork")
+
+        with tempfile.TemporaryDirectory() as directory:
+            self.stdout.write(
+                f"Generating {options['count']} images of {width}x{height} "
+                "per format..."
+            )
+            corpus = {}
+            for image_format in options["formats"] or FORMATS:
+                corpus[image_format] = []
+                for index in range(options["count"]):
+                    path = os.path.join(directory, f"{index}.{FORMATS[image_format]}")
+                    synthetic_image(width, height).save(path, format=image_format)
+                    corpus[image_format].append(path)
+
+            for image_format, paths in corpus.items():
+                for pipeline in PIPELINES:
+                    results = context.Queue()
+                    process = context.Process(
+                        target=_run_pipeline, args=(pipeline, paths, results)
+                    )
+                    process.start()
+                    cpu, peak = results.get()
+                    process.join()
+                    self.stdout.write(
+                        f"{image_format:<5} {pipeline:<15} "
+                        f"cpu={cpu / len(paths) * 1000:8.1f} ms/image  "
+                        f"peak RSS +{peak / 1024:7.1f} MiB"
+                    )
+
+            self.check_bomb(directory)
+
+    def check_bomb(self, directory):
+        """Check that an image over IMAGE_MAX_PIXELS is rejected early.
+
+        A bilevel PNG keeps the oversized file small.
+
+        Args:
+            directory: Directory to write the image to
+        """
+        side = int(images.max_pixels() ** 0.5) + 1
+        path = os.path.join(directory, "bomb.png")
+        Image.new("1", (side, side)).save(path)
+        start = time.perf_counter()
+        try:
+            with open(path, "rb") as image_file:
+                images.render(image_file)
+        except images.ImageTooLarge:
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"{side}x{side} image rejected from its headers in "
+                f"{elapsed * 1000:.2f} ms"
+            )
+        else:
+            raise CommandError(f"{side}x{side} image was not rejected")
@@ -0,0 +1,93 @@
+"""Management command to follow, unfollow or block many users at once.
+
+Applies ``litrevu.bulk_relations`` on behalf of one user, for instance to
+import a follow list. Targets are given as arguments or read from a file,
+one per line, and processed in batches of BULK_RELATIONS_MAX_ITEMS.
+"""
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from litrevu import bulk_relations
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """Django management command to apply a relation action to many users.
+
+    Each target is reported with its status at verbosity 2; the number of
+    targets per status is always reported.
+    """
+
+    help = "Follows, unfollows or blocks many users on behalf of a user"
+
+    def add_arguments(self, parser):
+        """Add the command line arguments.
+
+        Args:
+            parser: The argument parser of the command
+        """
+        parser.add_argument("user", help="Username of the user acting")
+        parser.add_argument("action", choices=sorted(bulk_relations.ACTIONS))
+        parser.add_argument(
+            "targets", nargs="*", help="Usernames (or ids with --ids) of the targets"
+        )
+        parser.add_argument(
+            "--ids", action="store_true", help="The targets are user ids"
+        )
+        parser.add_argument(
+            "--file", help="File with one target per line, '-' for stdin"
+        )
+
+    def handle(self, *args, **options):
+        """Execute the command to apply the action.
+
+        Args:
+            *args: Variable length argument list
+            **options: Parsed command line options
+
+        Raises:
+            CommandError: If the user does not exist or an id is invalid
+        """
+        user = User.objects.filter(username=options["user"]).first()
+        if user is None:
+            raise CommandError(f"User {options['user']} does not exist")
+
+        targets = list(options["targets"])
+        if options["file"]:
+            if options["file"] == "-":
+                lines = self.stdin.read().splitlines()
+            else:
+                with open(options["file"], encoding="utf-8") as file:
+                    lines = file.read().splitlines()
+            targets.extend(line.strip() for line in lines if line.strip())
+
+        if options["ids"]:
+            # Checked before the first batch, so no batch is applied when an
+            # id of a later one is invalid
+            try:
+                _, targets = bulk_relations.clean_targets([], targets)
+            except bulk_relations.InvalidTargets as error:
+                raise CommandError(f"Invalid user id: {error}")
+
+        action = bulk_relations.ACTIONS[options["action"]]
+        batch_size = bulk_relations.BULK_RELATIONS_MAX_ITEMS
+        counts = {}
+        while targets:
+            batch, targets = targets[:batch_size], targets[batch_size:]
+            if options["ids"]:
+                results = action(user, ids=batch)
+            else:
+                results = action(user, usernames=batch)
+            for result in results:
+                counts[result.status] = counts.get(result.status, 0) + 1
+                if options["verbosity"] > 1:
+                    self.stdout.write(f"{result.target}: {result.status}")
+
+        summary = ", ".join(f"{count} {status}" for status, count in counts.items())
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{options['action'].capitalize()}: {summary or 'no targets'}"
+            )
+        )
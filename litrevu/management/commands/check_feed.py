@@ -0,0 +1,70 @@
+"""Management command to check the materialized home feeds.
+
+Compares the FeedEntry rows of every user, or of a single user, with the
+feed computed from the tickets, reviews and follow relationships.
+"""
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from litrevu.feed import diff_user_feed
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """Django management command to check the materialized home feeds.
+
+    Reports, for each inconsistent feed, the entries that are missing and
+    the ones that should not be there. Exits with an error if any feed is
+    inconsistent; ``rebuild_feed`` repairs them.
+    """
+
+    help = "Checks the materialized home feeds against the query-based feed"
+
+    def add_arguments(self, parser):
+        """Add the command line arguments.
+
+        Args:
+            parser: The argument parser of the command
+        """
+        parser.add_argument(
+            "--user", help="Username of the only user whose feed is checked"
+        )
+
+    def handle(self, *args, **options):
+        """Execute the command to check the feeds.
+
+        Args:
+            *args: Variable length argument list
+            **options: Parsed command line options
+
+        Raises:
+            CommandError: If the given user does not exist or if any feed is
+                inconsistent
+        """
+        users = User.objects.order_by("pk")
+        if options["user"]:
+            users = users.filter(username=options["user"])
+            if not users.exists():
+                raise CommandError(f"User {options['user']} does not exist")
+
+        inconsistent = 0
+        for user in users.iterator():
+            missing, extra = diff_user_feed(user)
+            if not missing and not extra:
+                continue
+            inconsistent += 1
+            self.stdout.write(
+                self.style.WARNING(
+                    f"{user.username}: {len(missing)} missing, {len(extra)} extra"
+                )
+            )
+            for key in sorted(missing, reverse=True):
+                self.stdout.write(f"  - missing {key.kind} {key.id}")
+            for key in sorted(extra, reverse=True):
+                self.stdout.write(f"  - extra {key.kind} {key.id}")
+
+        if inconsistent:
+            raise CommandError(f"{inconsistent} inconsistent feed(s)")
+        self.stdout.write(self.style.SUCCESS("All feeds are consistent"))
@@ -0,0 +1,126 @@
+"""Management command to check the query plans of the main pages.
+
+Renders the home, posts and follows pages and the username suggestions for a
+user, captures every query they run and asks SQLite for its plan with
+``EXPLAIN QUERY PLAN``. The command fails if any of these queries falls back
+to a full table scan.
+"""
+
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+User = get_user_model()
+
+# URL names of the pages, with their query parameters
+PAGES = {
+    "litrevu:home": {},
+    "litrevu:posts": {},
+    "litrevu:follows": {},
+    # Uses the database, as the username index is not loaded here
+    "litrevu:username_autocomplete": {"q": "a"},
+}
+
+# "SCAN <table>" without "USING ... INDEX" reads the whole table
+TABLE_SCAN = re.compile(r"^SCAN (?P<table>\w+)$")
+# The same line reports reading the rows of a subquery in FROM, which are
+# bounded by the subquery itself; such subqueries are declared by these lines
+SUBQUERY = re.compile(r"^(CO-ROUTINE|MATERIALIZE) (?P<name>\w+)$")
+
+
+class Command(BaseCommand):
+    """Django management command to check the query plans of the main pages.
+
+    The pages are rendered with the test client in a transaction that is
+    rolled back, with the cache disabled so that every query really runs.
+    """
+
+    help = "Fails if the main pages or username suggestions run a full table scan"
+
+    def add_arguments(self, parser):
+        """Add the command line arguments.
+
+        Args:
+            parser: The argument parser of the command
+        """
+        parser.add_argument(
+            "--user",
+            help="Username of the user the pages are rendered for "
+            "(defaults to the first user)",
+        )
+
+    def handle(self, *args, **options):
+        """Execute the command to check the query plans.
+
+        Args:
+            *args: Variable length argument list
+            **options: Parsed command line options
+
+        Raises:
+            CommandError: If the database is not SQLite, if there is no user
+                to render the pages for, or if a table scan is found
+        """
+        if connection.vendor != "sqlite":
+            raise CommandError("EXPLAIN QUERY PLAN is only supported on SQLite")
+
+        users = User.objects.order_by("pk")
+        if options["user"]:
+            users = users.filter(username=options["user"])
+        user = users.first()
+        if user is None:
+            raise CommandError("No user to render the pages for")
+
+        scans = []
+        with transaction.atomic():
+            for page in PAGES:
+                for sql, table in self.check_page(user, page):
+                    scans.append((page, table))
+                    self.stdout.write(self.style.ERROR(f"{page}: SCAN {table}"))
+                    self.stdout.write(f"  {sql}")
+            transaction.set_rollback(True)
+
+        if scans:
+            raise CommandError(f"{len(scans)} table scan(s) found")
+        self.stdout.write(self.style.SUCCESS("No table scan found"))
+
+    def check_page(self, user, page):
+        """Render a page and yield the queries that scan a whole table.
+
+        Args:
+            user: The user the page is rendered for
+            page: Name of the URL pattern of the page
+
+        Yields:
+            tuple: The SQL of the query and the name of the scanned table
+        """
+        dummy_cache = {
+            "default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}
+        }
+        # A remote address outside INTERNAL_IPS keeps the debug toolbar off
+        client = Client(REMOTE_ADDR="192.0.2.1")
+        with override_settings(CACHES=dummy_cache, ALLOWED_HOSTS=["testserver"]):
+            client.force_login(user)
+            with CaptureQueriesContext(connection) as context:
+                response = client.get(reverse(page), PAGES[page])
+        if response.status_code != 200:
+            raise CommandError(f"{page} returned {response.status_code}")
+
+        with connection.cursor() as cursor:
+            for query in context.captured_queries:
+                sql = query["sql"]
+                if not sql.startswith("SELECT"):
+                    continue
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+                plan = [row[-1] for row in cursor.fetchall()]
+                subqueries = {
+                    match.group("name") for match in map(SUBQUERY.match, plan) if match
+                }
+                for line in plan:
+                    match = TABLE_SCAN.match(line)
+                    if match and match.group("table") not in subqueries:
+                        yield sql, match.group("table")
@@ -0,0 +1,222 @@
+"""Management command to delete the ticket image files no ticket references.
+
+Walks the ticket image directory of MEDIA_ROOT and, in the same order, the
+storage names referenced by the tickets: their images and the renditions
+recorded in ``image_renditions``. Both streams are sorted, the files by a
+directory walk and the names by the database, so they are compared like a
+merge join: memory does not grow with the number of files or tickets.
+
+Orphans are deleted, or moved to a quarantine directory. Recent files are
+skipped, since an upload is written before the ticket referencing it is
+committed.
+"""
+
+import heapq
+import os
+import shutil
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models.fields.json import KT
+
+from litrevu import images
+from litrevu.models import Ticket
+
+CHUNK_SIZE = 2000
+
+
+def walk_sorted(root, directory):
+    """Yield the files under a directory, sorted by their relative path.
+
+    Directory entries are sorted as if directory names ended with "/", so
+    that the paths come out in the same order as the database sorts them.
+    Only one directory listing is held in memory at a time per level.
+
+    Args:
+        root: Directory the yielded paths are relative to
+        directory: Directory to walk
+
+    Yields:
+        os.DirEntry: Each file, with its path relative to ``root`` in the
+            ``name`` order described above
+    """
+    with os.scandir(directory) as scanner:
+        entries = sorted(
+            scanner,
+            key=lambda entry: entry.name + "/" if entry.is_dir() else entry.name,
+        )
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            yield from walk_sorted(root, entry.path)
+        elif entry.is_file(follow_symlinks=False):
+            yield entry
+
+
+def referenced_names():
+    """Yield the storage names referenced by the tickets, sorted.
+
+    Each stream is sorted by the database and read in chunks; they are
+    merged lazily. Names referenced by several tickets come out several
+    times.
+
+    Yields:
+        str: Storage names relative to MEDIA_ROOT
+
+    Raises:
+        CommandError: If the database does not sort the names the way Python
+            compares strings, which would make referenced files look orphaned
+    """
+    tickets = Ticket.objects.order_by()
+    streams = [
+        tickets.exclude(image="")
+        .exclude(image=None)
+        .order_by("image")
+        .values_list("image", flat=True)
+        .iterator(chunk_size=CHUNK_SIZE)
+    ]
+    for rendition in images.RENDITIONS:
+        for image_format in images.FORMATS:
+            key = images.rendition_key(rendition, image_format)
+            streams.append(
+                tickets.annotate(name=KT(f"image_renditions__files__{key}"))
+                .filter(name__isnull=False)
+                .order_by("name")
+                .values_list("name", flat=True)
+                .iterator(chunk_size=CHUNK_SIZE)
+            )
+    previous = ""
+    for name in heapq.merge(*streams):
+        if name < previous:
+            raise CommandError(
+                f"The database sorts {previous!r} before {name!r}, "
+                "use a binary collation"
+            )
+        previous = name
+        yield name
+
+
+class Command(BaseCommand):
+    """Django management command to collect the orphaned ticket images.
+
+    Reports its progress every ``--progress`` files. ``--rate`` limits the
+    number of files deleted or moved per second, to keep the disk available
+    for the site.
+    """
+
+    help = "Deletes or quarantines the ticket image files no ticket references"
+
+    def add_arguments(self, parser):
+        """Add the command line arguments.
+
+        Args:
+            parser: The argument parser of the command
+        """
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report the orphans, without deleting or moving them",
+        )
+        parser.add_argument(
+            "--quarantine",
+            help="Directory to move the orphans to instead of deleting them",
+        )
+        parser.add_argument(
+            "--min-age",
+            type=float,
+            default=3600,
+            help="Skip files modified less than this many seconds ago",
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            help="Maximum number of files deleted or moved per second",
+        )
+        parser.add_argument(
+            "--progress",
+            type=int,
+            default=10000,
+            help="Report progress every this many files",
+        )
+
+    def handle(self, *args, **options):
+        """Execute the command to collect the orphans.
+
+        Args:
+            *args: Variable length argument list
+            **options: Parsed command line options
+
+        Raises:
+            CommandError: If the quarantine directory is inside the scanned
+                directory
+        """
+        storage = Ticket._meta.get_field("image").storage
+        root = os.path.abspath(storage.location)
+        directory = os.path.join(
+            root, Ticket._meta.get_field("image").upload_to.strip("/")
+        )
+        quarantine = options["quarantine"]
+        if quarantine:
+            quarantine = os.path.abspath(quarantine)
+            if os.path.commonpath([quarantine, directory]) == directory:
+                raise CommandError(
+                    f"The quarantine directory must be outside of {directory}"
+                )
+        if not os.path.isdir(directory):
+            self.stdout.write(f"{directory} does not exist, nothing to collect")
+            return
+
+        if options["dry_run"]:
+            action = "Would remove"
+        elif quarantine:
+            action = "Quarantined"
+        else:
+            action = "Removed"
+        cutoff = time.time() - options["min_age"]
+        references = referenced_names()
+        reference = next(references, None)
+        scanned = orphans = size = skipped = 0
+        start = time.monotonic()
+
+        for entry in walk_sorted(root, directory):
+            name = os.path.relpath(entry.path, root).replace(os.sep, "/")
+            scanned += 1
+            if scanned % options["progress"] == 0:
+                self.stdout.write(
+                    f"Scanned {scanned} files, {orphans} orphans "
+                    f"({size / 2**20:.1f} MiB)"
+                )
+
+            while reference is not None and reference < name:
+                reference = next(references, None)
+            if reference == name:
+                continue
+
+            stat = entry.stat(follow_symlinks=False)
+            if stat.st_mtime > cutoff:
+                skipped += 1
+                continue
+            orphans += 1
+            size += stat.st_size
+            if options["verbosity"] > 1:
+                self.stdout.write(f"{action} {name}")
+            if options["dry_run"]:
+                continue
+
+            if quarantine:
+                target = os.path.join(quarantine, name)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.move(entry.path, target)
+            else:
+                os.remove(entry.path)
+            if options["rate"]:
+                # Sleep until this file's slot at the requested rate
+                delay = start + orphans / options["rate"] - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Scanned {scanned} files: {action.lower()} {orphans} orphans "
+                f"({size / 2**20:.1f} MiB), skipped {skipped} recent files"
+            )
+        )
@@ -0,0 +1,67 @@
+"""Management command to compute the friends-of-friends follow suggestions.
+
+Meant to run periodically, for instance from cron. Each run recomputes the
+users whose follows or blocks changed since the previous run, and their
+followers; ``--full`` recomputes every user.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from litrevu import suggestions
+
+
+class Command(BaseCommand):
+    """Django management command to compute the follow suggestions.
+
+    Uses a sparse matrix product when NumPy and SciPy are installed, and
+    database queries otherwise.
+    """
+
+    help = "Computes the follow suggestions of the users whose follows changed"
+
+    def add_arguments(self, parser):
+        """Add the command line arguments.
+
+        Args:
+            parser: The argument parser of the command
+        """
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Recompute the suggestions of every user",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=suggestions.FOLLOW_SUGGESTIONS_LIMIT,
+            help="Number of suggestions stored per user",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=suggestions.BATCH_SIZE,
+            help="Number of users computed and written together",
+        )
+
+    def handle(self, *args, **options):
+        """Execute the command to compute the suggestions.
+
+        Args:
+            *args: Variable length argument list
+            **options: Parsed command line options
+        """
+        engine = "sparse matrices" if suggestions.sparse else "database queries"
+        start = time.monotonic()
+        count = suggestions.compute_suggestions(
+            full=options["full"],
+            limit=options["limit"],
+            batch_size=options["batch_size"],
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Computed the suggestions of {count} users with {engine} "
+                f"in {time.monotonic() - start:.1f}s"
+            )
+        )
@@ -1,23 +1,38 @@
 """Management command to generate sample data for testing the LITRevu application.
 
 Generates:
-- Test users with predefined usernames
-- Follow relationships between users
+- Test users with predefined usernames, then numbered ones
+- Follow relationships between users, with a configurable degree distribution
 - Sample book tickets with realistic French literature content
 - Reviews on tickets with varied ratings and comments
 
-All data is created with realistic timestamps to simulate actual usage.
+All data is created with realistic timestamps to simulate actual usage. Rows
+are written with ``bulk_create`` in batches, with their final timestamps, so
+that data sets of millions of rows can be loaded to reproduce production
+load. Generation is deterministic for a given seed and number of workers.
 """
 
-from django.core.management.base import BaseCommand
-from django.contrib.auth import get_user_model
-from litrevu.models import Ticket, Review, UserFollows
-from django.utils import timezone
+import multiprocessing
 import random
+import time
+from contextlib import contextmanager
 from datetime import timedelta
 
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.utils import timezone
+
+from litrevu.counters import reconcile_all
+from litrevu.feed import rebuild_all_feeds
+from litrevu.models import Ticket, Review, UserFollows, UserBlocks, FeedEntry
+
 User = get_user_model()
 
+PREDEFINED_USERNAMES = ["alice", "bob", "charlie", "david"]
+PASSWORD = "password123"
+
 SAMPLE_BOOKS = [
     {
         "title": "Le Petit Prince",
@@ -80,91 +95,370 @@ SAMPLE_REVIEWS = [
 ]
 
 
+@contextmanager
+def timestamps_as_given(*models):
+    """Let ``time_created`` values set on instances reach the database.
+
+    ``auto_now_add`` fields overwrite their value on insert, bulk inserts
+    included. This disables it for the duration of the block.
+
+    Args:
+        *models: Models whose ``time_created`` field is affected
+    """
+    fields = [model._meta.get_field("time_created") for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def follow_degrees(rng, count, mean, distribution):
+    """Draw the number of users followed by each of ``count`` users.
+
+    Args:
+        rng: Random number generator
+        count: Number of users
+        mean: Mean number of followed users
+        distribution: "uniform" for degrees spread evenly around the mean,
+            "zipf" for a heavy-tailed distribution where a few users follow
+            many accounts
+
+    Returns:
+        list: One degree per user, capped at ``count - 1``
+    """
+    if distribution == "uniform":
+        high = max(1, round(2 * mean) - 1)
+        degrees = [rng.randint(1, high) if mean else 0 for _ in range(count)]
+    else:
+        # Pareto with shape 2 has a mean of 2; rescale it to the wanted mean
+        degrees = [int(mean / 2 * rng.paretovariate(2)) for _ in range(count)]
+    return [min(degree, count - 1) for degree in degrees]
+
+
+def pick_followed(rng, index, count, degree, distribution):
+    """Pick the indexes of the users followed by user ``index``.
+
+    With the "zipf" distribution, users with a low index are much more
+    likely to be followed, which gives a few very popular accounts.
+
+    Returns:
+        set: Distinct indexes, excluding ``index``
+    """
+    followed = set()
+    while len(followed) < degree:
+        if distribution == "uniform":
+            candidate = rng.randrange(count)
+        else:
+            candidate = min(count - 1, int(rng.paretovariate(1.2)) - 1)
+        if candidate != index:
+            followed.add(candidate)
+    return followed
+
+
+def generate_posts(user_ids, reviewer_ids, options, seed):
+    """Generate the tickets of some users and the reviews on them.
+
+    Run in the main process or in a worker process, each with its own seed.
+
+    Args:
+        user_ids: Ids of the users whose tickets are generated
+        reviewer_ids: Ids of all the users, candidates for reviewing
+        options: Parsed command options
+        seed: Seed of this chunk of work
+
+    Returns:
+        int: Number of rows written
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    span = timedelta(days=options["days"]).total_seconds()
+    batch_size = options["batch_size"]
+    rows = 0
+    tickets = []
+
+    def flush():
+        nonlocal rows
+        with transaction.atomic():
+            Ticket.objects.bulk_create(tickets, batch_size=batch_size)
+            reviews = []
+            for ticket in tickets:
+                if len(reviewer_ids) < 2 or rng.random() >= options["review_ratio"]:
+                    continue
+                reviewer_id = ticket.user_id
+                while reviewer_id == ticket.user_id:
+                    reviewer_id = rng.choice(reviewer_ids)
+                review_sample = rng.choice(SAMPLE_REVIEWS)
+                age = (now - ticket.time_created).total_seconds()
+                reviews.append(
+                    Review(
+                        ticket_id=ticket.pk,
+                        user_id=reviewer_id,
+                        headline=review_sample["headline"],
+                        body=review_sample["body"],
+                        rating=review_sample["rating"],
+                        time_created=ticket.time_created
+                        + timedelta(seconds=rng.uniform(0, min(age, 7 * 86400))),
+                    )
+                )
+            Review.objects.bulk_create(reviews, batch_size=batch_size)
+        rows += len(tickets) + len(reviews)
+        tickets.clear()
+
+    with timestamps_as_given(Ticket, Review):
+        for user_id in user_ids:
+            for _ in range(rng.randint(0, 2 * options["tickets_per_user"])):
+                book = rng.choice(SAMPLE_BOOKS)
+                tickets.append(
+                    Ticket(
+                        title=book["title"],
+                        description=book["description"],
+                        user_id=user_id,
+                        time_created=now - timedelta(seconds=rng.uniform(0, span)),
+                    )
+                )
+                if len(tickets) >= batch_size:
+                    flush()
+        if tickets:
+            flush()
+    return rows
+
+
+def _generate_posts_in_worker(args):
+    """Entry point of the worker processes."""
+    if connection.vendor == "sqlite":
+        # SQLite has a single writer: wait for the other workers' batches
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA busy_timeout = 600000")
+    try:
+        return generate_posts(*args)
+    finally:
+        connections.close_all()
+
+
 class Command(BaseCommand):
     """Django management command to populate the database with sample data.
 
     This command will:
     1. Clean existing non-superuser data
-    2. Create test users (alice, bob, charlie, david)
+    2. Create test users (alice, bob, charlie, david, then user0000005...)
     3. Create random follow relationships
     4. Create tickets for French literature books
     5. Generate reviews with varied ratings
+    6. Rebuild the materialized feeds
+    7. Count the follows, tickets and reviews of the users and tickets
 
-    All created data uses realistic French content and timestamps.
+    All created data uses realistic French content and timestamps. The
+    defaults generate a small data set; the options scale it up to millions
+    of rows.
     """
 
     help = "Generates sample data for testing"
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        """Add the command line arguments.
+
+        Args:
+            parser: The argument parser of the command
+        """
+        parser.add_argument("--users", type=int, default=4, help="Number of users")
+        parser.add_argument(
+            "--follows",
+            type=float,
+            default=1.5,
+            help="Mean number of users followed by each user",
+        )
+        parser.add_argument(
+            "--follow-distribution",
+            choices=["uniform", "zipf"],
+            default="uniform",
+            help="Distribution of the follow degrees and of the followed users",
+        )
+        parser.add_argument(
+            "--tickets-per-user",
+            type=float,
+            default=2,
+            help="Mean number of tickets per user",
+        )
+        parser.add_argument(
+            "--review-ratio",
+            type=float,
+            default=0.75,
+            help="Share of tickets that receive a review",
+        )
+        parser.add_argument(
+            "--days", type=int, default=30, help="Span of the creation dates in days"
+        )
+        parser.add_argument("--seed", type=int, help="Seed of the random generator")
+        parser.add_argument(
+            "--batch-size", type=int, default=5000, help="Rows per bulk insert"
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of processes generating tickets and reviews",
+        )
+
+    def handle(self, *args, **options):
         """Execute the command to generate sample data.
 
         The data generation process follows these steps:
-        1. Clean existing data (users, tickets, reviews, follows)
-        2. Create test users with predefined usernames
-        3. Create random follow relationships between users
+        1. Clean existing data (users, tickets, reviews, follows, feeds)
+        2. Create test users, all with the same password
+        3. Create follow relationships between users
         4. Create tickets for books with realistic timestamps
-        5. Generate reviews for ~75% of tickets
+        5. Generate reviews for a share of the tickets
+        6. Rebuild the materialized feeds
+        7. Count the follows, tickets and reviews of the users and tickets
 
         Args:
             *args: Variable length argument list
-            **kwargs: Arbitrary keyword arguments
+            **options: Parsed command line options
 
-        Outputs progress messages to stdout during execution.
+        Raises:
+            CommandError: If the options are out of range
+
+        Outputs progress messages and the insertion rate to stdout.
         """
+        if options["users"] < 1 or options["workers"] < 1:
+            raise CommandError("--users and --workers must be at least 1")
+        if options["seed"] is None:
+            options["seed"] = random.randrange(2**32)
+        rng = random.Random(options["seed"])
+        self.stdout.write(f"Using seed {options['seed']}")
+        start = time.perf_counter()
+
         # Clean existing data
         self.stdout.write("Cleaning existing data...")
-        Review.objects.all().delete()
-        Ticket.objects.all().delete()
-        UserFollows.objects.all().delete()
-        User.objects.filter(is_superuser=False).delete()
+        self.clean()
 
         # Create test users
         self.stdout.write("Creating test users...")
-        users = []
-        usernames = ["alice", "bob", "charlie", "david"]
-        for username in usernames:
-            user = User.objects.create_user(
-                username=username,
-                password="password123",
-                email=f"{username}@example.com",
-            )
-            users.append(user)
+        user_ids = self.create_users(options)
 
         # Create some follows
         self.stdout.write("Creating user follows...")
-        for user in users:
-            other_users = [u for u in users if u != user]
-            # Follow 1-2 random users
-            for followed_user in random.sample(other_users, random.randint(1, 2)):
-                UserFollows.objects.create(user=user, followed_user=followed_user)
+        rows = len(user_ids) + self.create_follows(rng, user_ids, options)
 
         # Create tickets and reviews
         self.stdout.write("Creating tickets and reviews...")
-        for _ in range(8):  # Create 8 tickets
-            user = random.choice(users)
-            book = random.choice(SAMPLE_BOOKS)
-            time_created = timezone.now() - timedelta(days=random.randint(20, 30))
+        rows += self.create_posts(user_ids, options)
 
-            ticket = Ticket.objects.create(
-                title=book["title"], description=book["description"], user=user
+        # Timestamps were set directly and signals were bypassed
+        self.stdout.write("Rebuilding feeds...")
+        rows += rebuild_all_feeds()
+        self.stdout.write("Counting follows, tickets and reviews...")
+        for _ in reconcile_all():
+            pass
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Successfully generated sample data: {rows} rows in "
+                f"{elapsed:.1f}s ({rows / elapsed:.0f} rows/s)"
             )
-            # Update time_created after creation
-            Ticket.objects.filter(id=ticket.id).update(time_created=time_created)
-
-            # 75% chance to have a review
-            if random.random() < 0.75:
-                # Review by a different user
-                reviewer = random.choice([u for u in users if u != user])
-                review_sample = random.choice(SAMPLE_REVIEWS)
-                review = Review.objects.create(
-                    ticket=ticket,
-                    user=reviewer,
-                    headline=review_sample["headline"],
-                    body=review_sample["body"],
-                    rating=review_sample["rating"],
+        )
+
+    def clean(self):
+        """Delete the generated data without loading it in memory.
+
+        Tickets, reviews, follows, blocks and feed entries are deleted with
+        plain DELETE statements, which skip the per-row signal receivers.
+        Non-superusers are then deleted through the ORM for the cascades.
+        """
+        with transaction.atomic(), connection.cursor() as cursor:
+            for model in (FeedEntry, Review, Ticket, UserFollows, UserBlocks):
+                cursor.execute(
+                    f"DELETE FROM {connection.ops.quote_name(model._meta.db_table)}"
+                )
+        User.objects.filter(is_superuser=False).delete()
+
+    def create_users(self, options):
+        """Create the users with a password hashed only once.
+
+        Args:
+            options: Parsed command options
+
+        Returns:
+            list: Ids of the created users
+        """
+        password = make_password(PASSWORD)
+        usernames = PREDEFINED_USERNAMES[: options["users"]] + [
+            f"user{index:07d}"
+            for index in range(len(PREDEFINED_USERNAMES) + 1, options["users"] + 1)
+        ]
+        users = User.objects.bulk_create(
+            (
+                User(
+                    username=username,
+                    email=f"{username}@example.com",
+                    password=password,
                 )
-                # Update time_created after creation
-                review_time = time_created - timedelta(days=random.randint(1, 7))
-                Review.objects.filter(id=review.id).update(time_created=review_time)
+                for username in usernames
+            ),
+            batch_size=options["batch_size"],
+        )
+        return [user.pk for user in users]
+
+    def create_follows(self, rng, user_ids, options):
+        """Create the follow relationships.
+
+        Args:
+            rng: Random number generator
+            user_ids: Ids of the users
+            options: Parsed command options
+
+        Returns:
+            int: Number of rows written
+        """
+        distribution = options["follow_distribution"]
+        degrees = follow_degrees(rng, len(user_ids), options["follows"], distribution)
+        follows = []
+        rows = 0
+        with transaction.atomic():
+            for index, user_id in enumerate(user_ids):
+                for followed in pick_followed(
+                    rng, index, len(user_ids), degrees[index], distribution
+                ):
+                    follows.append(
+                        UserFollows(
+                            user_id=user_id, followed_user_id=user_ids[followed]
+                        )
+                    )
+                if len(follows) >= options["batch_size"]:
+                    UserFollows.objects.bulk_create(follows)
+                    rows += len(follows)
+                    follows.clear()
+            UserFollows.objects.bulk_create(follows)
+        return rows + len(follows)
+
+    def create_posts(self, user_ids, options):
+        """Create the tickets and reviews, in worker processes if requested.
+
+        Users are split in one contiguous chunk per worker, and each chunk
+        has its own seed derived from the main one.
+
+        Args:
+            user_ids: Ids of the users
+            options: Parsed command options
+
+        Returns:
+            int: Number of rows written
+        """
+        workers = min(options["workers"], len(user_ids))
+        size = -(-len(user_ids) // workers)
+        tasks = []
+        for i, start in enumerate(range(0, len(user_ids), size)):
+            end = start + size
+            tasks.append((user_ids[start:end], user_ids, options, options["seed"] + i))
+        if workers == 1:
+            return generate_posts(*tasks[0])
 
-        self.stdout.write(self.style.SUCCESS("Successfully generated sample data"))
+        # The forked workers must not share the parent's connection
+        connections.close_all()
+        context = multiprocessing.get_context("fork")
+        with context.Pool(workers) as pool:
+            return sum(pool.map(_generate_posts_in_worker, tasks))
@@ -0,0 +1,68 @@
+"""Management command to process the ticket images left pending.
+
+Images are processed by a thread pool of the web process; images queued
+when the process stopped stay pending. This command processes them, and
+can retry the ones whose processing failed.
+"""
+
+from django.core.management.base import BaseCommand
+
+from litrevu.images import process_ticket_image
+from litrevu.models import Ticket
+
+CHUNK_SIZE = 500
+
+
+class Command(BaseCommand):
+    """Django management command to process the pending ticket images.
+
+    Images are processed one at a time in this process, oldest first, in
+    chunks of CHUNK_SIZE tickets.
+    """
+
+    help = "Processes the ticket images still waiting to be resized"
+
+    def add_arguments(self, parser):
+        """Add the command line arguments.
+
+        Args:
+            parser: The argument parser of the command
+        """
+        parser.add_argument(
+            "--retry-failed",
+            action="store_true",
+            help="Also retry the images whose processing failed",
+        )
+
+    def handle(self, *args, **options):
+        """Execute the command to process the pending images.
+
+        Args:
+            *args: Variable length argument list
+            **options: Parsed command line options
+        """
+        if options["retry_failed"]:
+            Ticket.objects.filter(image_state=Ticket.ImageState.FAILED).update(
+                image_state=Ticket.ImageState.PENDING
+            )
+        pending = Ticket.objects.filter(image_state=Ticket.ImageState.PENDING).order_by(
+            "pk"
+        )
+
+        processed = failed = 0
+        last_id = 0
+        # Each chunk of ids is read in full before it is processed: the
+        # processing updates image_state through the same connection, which
+        # must not happen while a cursor over the pending rows is open
+        while ticket_ids := list(
+            pending.filter(pk__gt=last_id).values_list("pk", flat=True)[:CHUNK_SIZE]
+        ):
+            for ticket_id in ticket_ids:
+                if process_ticket_image(ticket_id):
+                    processed += 1
+                else:
+                    failed += 1
+            last_id = ticket_ids[-1]
+        self.stdout.write(
+            self.style.SUCCESS(f"Processed {processed} images, {failed} not processed")
+        )
@@ -0,0 +1,54 @@
+"""Management command to rebuild the materialized home feeds.
+
+Recomputes the FeedEntry rows of every user, or of a single user, from the
+tickets, reviews and follow relationships.
+"""
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from litrevu.feed import rebuild_all_feeds, rebuild_user_feed
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """Django management command to rebuild the materialized home feeds.
+
+    All feeds are rebuilt at once with set-based queries. A single user's
+    feed is rebuilt from the feed query of that user.
+    """
+
+    help = "Rebuilds the materialized home feed of all users or of one user"
+
+    def add_arguments(self, parser):
+        """Add the command line arguments.
+
+        Args:
+            parser: The argument parser of the command
+        """
+        parser.add_argument(
+            "--user", help="Username of the only user whose feed is rebuilt"
+        )
+
+    def handle(self, *args, **options):
+        """Execute the command to rebuild the feeds.
+
+        Args:
+            *args: Variable length argument list
+            **options: Parsed command line options
+
+        Raises:
+            CommandError: If the given user does not exist
+        """
+        if not options["user"]:
+            total = rebuild_all_feeds()
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt feeds with {total} entries"))
+            return
+
+        user = User.objects.filter(username=options["user"]).first()
+        if user is None:
+            raise CommandError(f"User {options['user']} does not exist")
+
+        count = rebuild_user_feed(user)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt feed with {count} entries"))
@@ -0,0 +1,82 @@
+"""Management command to check and fix the denormalized counters.
+
+Recomputes the follower, following, ticket and review counters of the users
+and the review count and rating sum of the tickets from the source tables,
+in chunks of primary keys, and reports the rows whose counter drifted.
+"""
+
+from django.core.management.base import BaseCommand
+
+from litrevu import counters
+
+
+class Command(BaseCommand):
+    """Django management command to reconcile the counters.
+
+    Drifted counters are corrected unless ``--dry-run`` is given. Each
+    drifted row is listed at verbosity 2.
+    """
+
+    help = "Recomputes the user and ticket counters and reports their drift"
+
+    def add_arguments(self, parser):
+        """Add the command line arguments.
+
+        Args:
+            parser: The argument parser of the command
+        """
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report the drift, without correcting it",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Number of primary keys checked per query",
+        )
+        parser.add_argument(
+            "--counter",
+            action="append",
+            choices=[counter.field for counter in counters.COUNTERS],
+            help="Counter to reconcile, may be repeated (defaults to all)",
+        )
+
+    def handle(self, *args, **options):
+        """Execute the command to reconcile the counters.
+
+        Args:
+            *args: Variable length argument list
+            **options: Parsed command line options
+        """
+        selected = [
+            counter
+            for counter in counters.COUNTERS
+            if not options["counter"] or counter.field in options["counter"]
+        ]
+        rows = {counter: 0 for counter in selected}
+        drift = {counter: 0 for counter in selected}
+        for counter, drifted in counters.reconcile_all(
+            selected, options["chunk_size"], fix=not options["dry_run"]
+        ):
+            for pk, stored, actual in drifted:
+                if options["verbosity"] > 1:
+                    self.stdout.write(
+                        f"{counter.model.__name__} {pk} {counter.field}: "
+                        f"stored {stored}, actual {actual}"
+                    )
+                drift[counter] += abs(actual - stored)
+            rows[counter] += len(drifted)
+
+        for counter in selected:
+            style = self.style.WARNING if rows[counter] else self.style.SUCCESS
+            self.stdout.write(
+                style(
+                    f"{counter.model.__name__}.{counter.field}: "
+                    f"{rows[counter]} rows drifted by {drift[counter]} in total"
+                )
+            )
+        total = sum(rows.values())
+        if total and not options["dry_run"]:
+            self.stdout.write(self.style.SUCCESS(f"Corrected {total} counters"))
@@ -0,0 +1,217 @@
+"""Serving of the uploaded media files.
+
+Replaces ``django.views.static.serve``, which reads whole files in Python
+and only honors If-Modified-Since. Files are served with a strong ETag and
+Last-Modified, conditional requests get a 304 before the file is opened,
+and single byte ranges are answered with 206 responses.
+
+Files stored under the hash of their content (see ``litrevu.storage``) never
+change, so their ETag is the hash and they are cached for a year as
+immutable. Other files are revalidated on every use.
+
+With MEDIA_SENDFILE set, the response carries an ``X-Sendfile`` or
+``X-Accel-Redirect`` header instead of the file, and the front server sends
+the bytes, including ranges.
+"""
+
+import mimetypes
+import os
+import posixpath
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+from .storage import is_hashed_name
+
+CHUNK_SIZE = 64 * 1024
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+SENDFILE_HEADERS = {"x-sendfile": "X-Sendfile", "x-accel-redirect": "X-Accel-Redirect"}
+
+
+class RangeNotSatisfiable(Exception):
+    """Raised when a Range header only asks for bytes past the end of a file."""
+
+
+def file_etag(name, stat):
+    """Return the strong ETag of a media file.
+
+    Args:
+        name: Storage name of the file
+        stat: Result of ``os.stat`` on the file
+
+    Returns:
+        str: The quoted content hash for hashed names, otherwise the
+            modification time and size, as nginx does
+    """
+    if is_hashed_name(name):
+        return f'"{posixpath.splitext(posixpath.basename(name))[0]}"'
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def parse_range(header, size):
+    """Parse a Range header asking for a single byte range.
+
+    Multiple ranges and malformed headers are ignored, as RFC 9110 allows:
+    the whole file is served instead.
+
+    Args:
+        header: Value of the Range header
+        size: Size of the file in bytes
+
+    Returns:
+        tuple: First and last byte positions, inclusive, or None to serve
+            the whole file
+
+    Raises:
+        RangeNotSatisfiable: If the range starts past the end of the file
+    """
+    unit, _, ranges = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in ranges:
+        return None
+    first, dash, last = ranges.strip().partition("-")
+    if not dash or not (first or last):
+        return None
+    if first and not first.isdigit() or last and not last.isdigit():
+        return None
+
+    if not first:
+        # Suffix range: the last N bytes
+        if int(last) == 0 or size == 0:
+            raise RangeNotSatisfiable
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+def if_range_passes(request, etag, last_modified):
+    """Return True if the Range header of a request applies to the file.
+
+    An If-Range header holding an outdated validator means the client's
+    partial copy is stale, so the whole file must be sent.
+
+    Args:
+        request: The HTTP request object
+        etag: Strong ETag of the file
+        last_modified: Modification time of the file as a timestamp
+
+    Returns:
+        bool: True if there is no If-Range header or it matches the file
+    """
+    validator = request.headers.get("If-Range")
+    if validator is None:
+        return True
+    validator = validator.strip()
+    if validator.startswith('"'):
+        return validator == etag
+    return parse_http_date_safe(validator) == int(last_modified)
+
+
+def read_range(path, start, length):
+    """Yield ``length`` bytes of a file from ``start``, in chunks.
+
+    Args:
+        path: Path of the file
+        start: Offset of the first byte
+        length: Number of bytes to read
+
+    Yields:
+        bytes: Chunks of at most CHUNK_SIZE bytes
+    """
+    with open(path, "rb") as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+@require_safe
+def serve(request, path):
+    """Serve a file of MEDIA_ROOT.
+
+    Args:
+        request: The HTTP request object
+        path: Path of the file relative to MEDIA_ROOT
+
+    Returns:
+        The file, a byte range of it, or a 304, 412 or 416 response
+
+    Raises:
+        Http404: If the path is not a file of MEDIA_ROOT
+    """
+    name = posixpath.normpath(path).lstrip("/")
+    fullpath = safe_join(settings.MEDIA_ROOT, name)
+    try:
+        stat = os.stat(fullpath)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404("Fichier introuvable")
+    if not os.path.isfile(fullpath):
+        raise Http404("Fichier introuvable")
+
+    etag = file_etag(name, stat)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(stat.st_mtime),
+        "Cache-Control": (
+            IMMUTABLE_CACHE_CONTROL
+            if is_hashed_name(name)
+            else REVALIDATE_CACHE_CONTROL
+        ),
+        "Accept-Ranges": "bytes",
+    }
+    not_modified = get_conditional_response(
+        request, etag=etag, last_modified=int(stat.st_mtime)
+    )
+    if not_modified is not None:
+        for header in ("Cache-Control", "Last-Modified"):
+            not_modified.headers.setdefault(header, headers[header])
+        return not_modified
+
+    content_type, encoding = mimetypes.guess_type(name)
+    content_type = content_type or "application/octet-stream"
+    if encoding:
+        headers["Content-Encoding"] = encoding
+
+    sendfile = settings.MEDIA_SENDFILE
+    if sendfile:
+        # The front server answers the Range header itself
+        if sendfile == "x-accel-redirect":
+            value = settings.MEDIA_ACCEL_REDIRECT_PREFIX.rstrip("/") + "/" + quote(name)
+        else:
+            value = fullpath
+        headers[SENDFILE_HEADERS[sendfile]] = value
+        return HttpResponse(content_type=content_type, headers=headers)
+
+    byte_range = None
+    if "Range" in request.headers and if_range_passes(request, etag, stat.st_mtime):
+        try:
+            byte_range = parse_range(request.headers["Range"], stat.st_size)
+        except RangeNotSatisfiable:
+            headers["Content-Range"] = f"bytes */{stat.st_size}"
+            return HttpResponse(status=416, headers=headers)
+    if byte_range is None:
+        return FileResponse(
+            open(fullpath, "rb"), content_type=content_type, headers=headers
+        )
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingHttpResponse(
+        read_range(fullpath, start, end - start + 1),
+        status=206,
+        content_type=content_type,
+        headers=headers,
+    )
@@ -0,0 +1,98 @@
+# Generated by Django 5.0.2 on 2026-10-17 17:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def _entries(apps):
+    """Yield the feed entries derived from the existing rows."""
+    FeedEntry = apps.get_model("litrevu", "FeedEntry")
+    Ticket = apps.get_model("litrevu", "Ticket")
+    Review = apps.get_model("litrevu", "Review")
+    UserFollows = apps.get_model("litrevu", "UserFollows")
+
+    followers = {}
+    for user_id, followed_user_id in UserFollows.objects.values_list(
+        "user_id", "followed_user_id"
+    ):
+        followers.setdefault(followed_user_id, []).append(user_id)
+
+    for pk, author_id, time_created in Ticket.objects.values_list(
+        "id", "user_id", "time_created"
+    ).iterator():
+        for owner_id in {author_id, *followers.get(author_id, [])}:
+            yield FeedEntry(
+                owner_id=owner_id, kind="TICKET", item_id=pk, time_created=time_created
+            )
+
+    for pk, author_id, ticket_owner_id, time_created in Review.objects.values_list(
+        "id", "user_id", "ticket__user_id", "time_created"
+    ).iterator():
+        owners = {author_id, ticket_owner_id, *followers.get(author_id, [])}
+        for owner_id in owners:
+            yield FeedEntry(
+                owner_id=owner_id, kind="REVIEW", item_id=pk, time_created=time_created
+            )
+
+
+def backfill_feed_entries(apps, schema_editor):
+    """Materialize the feed of every existing user."""
+    FeedEntry = apps.get_model("litrevu", "FeedEntry")
+    FeedEntry.objects.bulk_create(_entries(apps), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("litrevu", "0004_alter_ticket_image"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FeedEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("TICKET", "Billet"), ("REVIEW", "Critique")],
+                        max_length=6,
+                        verbose_name="Type",
+                    ),
+                ),
+                ("item_id", models.PositiveBigIntegerField(verbose_name="Identifiant")),
+                ("time_created", models.DateTimeField(verbose_name="Date de création")),
+                (
+                    "owner",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="feed_entries",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Propriétaire",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Entrée de flux",
+                "verbose_name_plural": "Entrées de flux",
+                "indexes": [
+                    models.Index(
+                        fields=["owner", "-time_created", "-kind", "-item_id"],
+                        name="feedentry_owner_page_idx",
+                    ),
+                    models.Index(fields=["kind", "item_id"], name="feedentry_item_idx"),
+                ],
+                "unique_together": {("owner", "kind", "item_id")},
+            },
+        ),
+        migrations.RunPython(backfill_feed_entries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.0.2 on 2026-10-17 17:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("litrevu", "0005_feedentry"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="review",
+            index=models.Index(
+                fields=["user", "-time_created"], name="review_user_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="review",
+            index=models.Index(
+                fields=["ticket", "user"], name="review_ticket_user_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="ticket",
+            index=models.Index(
+                fields=["user", "-time_created"], name="ticket_user_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="userblocks",
+            index=models.Index(
+                fields=["blocked_user", "-time_created"], name="userblocks_blocked_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="userfollows",
+            index=models.Index(
+                fields=["followed_user", "-time_created"],
+                name="userfollows_followed_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.0.2 on 2026-10-17 17:34
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def remove_duplicate_reviews(apps, schema_editor):
+    """Keep only the first review of each (ticket, user) pair."""
+    Review = apps.get_model("litrevu", "Review")
+    FeedEntry = apps.get_model("litrevu", "FeedEntry")
+
+    duplicates = (
+        Review.objects.values("ticket_id", "user_id")
+        .annotate(count=Count("id"), first_id=Min("id"))
+        .filter(count__gt=1)
+    )
+    for duplicate in duplicates.iterator():
+        extra_ids = list(
+            Review.objects.filter(
+                ticket_id=duplicate["ticket_id"], user_id=duplicate["user_id"]
+            )
+            .exclude(id=duplicate["first_id"])
+            .values_list("id", flat=True)
+        )
+        # Signals are not sent for historical models, so the materialized
+        # feeds are cleaned up here
+        FeedEntry.objects.filter(kind="REVIEW", item_id__in=extra_ids).delete()
+        Review.objects.filter(id__in=extra_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("litrevu", "0006_feed_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_reviews, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name="review",
+            unique_together={("ticket", "user")},
+        ),
+        # The unique constraint is backed by its own (ticket, user) index
+        migrations.RemoveIndex(
+            model_name="review",
+            name="review_ticket_user_idx",
+        ),
+    ]
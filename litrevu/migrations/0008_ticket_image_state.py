@@ -0,0 +1,27 @@
+# Generated by Django 5.0.2 on 2026-10-17 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("litrevu", "0007_review_unique_ticket_user"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ticket",
+            name="image_state",
+            field=models.CharField(
+                choices=[
+                    ("pending", "En cours de traitement"),
+                    ("ready", "Prête"),
+                    ("failed", "Échec du traitement"),
+                ],
+                default="ready",
+                max_length=7,
+                verbose_name="État de l'image",
+            ),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.2 on 2026-10-17 18:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("litrevu", "0008_ticket_image_state"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ticket",
+            name="image_hash",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                help_text="SHA-256 of the uploaded image the stored image comes from",
+                max_length=64,
+                verbose_name="Empreinte de l'image",
+            ),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.2 on 2026-10-17 18:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("litrevu", "0009_ticket_image_hash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ticket",
+            name="image_renditions",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                editable=False,
+                help_text="Size of the image and storage names of its renditions",
+                verbose_name="Déclinaisons de l'image",
+            ),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.0.2 on 2026-10-17 18:14
+
+import litrevu.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("litrevu", "0010_ticket_image_renditions"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="ticket",
+            name="image",
+            field=models.ImageField(
+                blank=True,
+                help_text="Image maximum size is 800x800 pixels",
+                null=True,
+                storage=litrevu.storage.ticket_image_storage,
+                upload_to="tickets/",
+                verbose_name="Image",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="ticket",
+            name="image_hash",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                editable=False,
+                help_text="SHA-256 of the uploaded image the stored image comes from",
+                max_length=64,
+                verbose_name="Empreinte de l'image",
+            ),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.0.2 on 2026-10-17 18:20
+
+from django.db import migrations, models
+
+
+def move_image_dimensions(apps, schema_editor):
+    """Move the image size kept in image_renditions to its own columns."""
+    Ticket = apps.get_model("litrevu", "Ticket")
+    tickets = []
+    for ticket in Ticket.objects.filter(image_renditions__has_key="width").iterator():
+        renditions = ticket.image_renditions
+        ticket.image_width = renditions.pop("width")
+        ticket.image_height = renditions.pop("height")
+        tickets.append(ticket)
+    Ticket.objects.bulk_update(
+        tickets,
+        ["image_width", "image_height", "image_renditions"],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("litrevu", "0011_ticket_image_storage"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ticket",
+            name="image_height",
+            field=models.PositiveIntegerField(
+                blank=True, editable=False, null=True, verbose_name="Hauteur de l'image"
+            ),
+        ),
+        migrations.AddField(
+            model_name="ticket",
+            name="image_size",
+            field=models.PositiveIntegerField(
+                blank=True,
+                editable=False,
+                help_text="Size of the stored image file in bytes",
+                null=True,
+                verbose_name="Poids de l'image",
+            ),
+        ),
+        migrations.AddField(
+            model_name="ticket",
+            name="image_width",
+            field=models.PositiveIntegerField(
+                blank=True, editable=False, null=True, verbose_name="Largeur de l'image"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="ticket",
+            name="image_renditions",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                editable=False,
+                help_text="Storage names of the renditions of the image",
+                verbose_name="Déclinaisons de l'image",
+            ),
+        ),
+        migrations.RunPython(move_image_dimensions, migrations.RunPython.noop),
+    ]
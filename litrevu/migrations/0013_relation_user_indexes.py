@@ -0,0 +1,25 @@
+# Generated by Django 5.0.2 on 2026-10-17 18:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("litrevu", "0012_ticket_image_dimensions"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="userblocks",
+            index=models.Index(
+                fields=["user", "-time_created"], name="userblocks_user_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="userfollows",
+            index=models.Index(
+                fields=["user", "-time_created"], name="userfollows_user_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 5.0.2 on 2026-10-17 18:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("litrevu", "0013_relation_user_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FollowGraphChange",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("user_id", models.PositiveBigIntegerField(verbose_name="Utilisateur")),
+                (
+                    "time_created",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Date de création"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Changement du graphe d'abonnements",
+                "verbose_name_plural": "Changements du graphe d'abonnements",
+            },
+        ),
+        migrations.CreateModel(
+            name="FollowSuggestion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "mutual_count",
+                    models.PositiveIntegerField(verbose_name="Abonnements communs"),
+                ),
+                ("time_computed", models.DateTimeField(verbose_name="Date de calcul")),
+                (
+                    "suggested_user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Utilisateur suggéré",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="follow_suggestions",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Utilisateur",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Suggestion d'abonnement",
+                "verbose_name_plural": "Suggestions d'abonnement",
+                "indexes": [
+                    models.Index(
+                        fields=["user", "-mutual_count", "suggested_user"],
+                        name="followsuggestion_user_idx",
+                    )
+                ],
+                "unique_together": {("user", "suggested_user")},
+            },
+        ),
+    ]
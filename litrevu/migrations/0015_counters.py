@@ -0,0 +1,87 @@
+# Generated by Django 5.0.2 on 2026-10-17 18:42
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def count_rows(apps, schema_editor):
+    """Fill the new counters from the source tables, one UPDATE per counter."""
+    User = apps.get_model("litrevu", "User")
+    Ticket = apps.get_model("litrevu", "Ticket")
+    Review = apps.get_model("litrevu", "Review")
+    UserFollows = apps.get_model("litrevu", "UserFollows")
+
+    def aggregate(model, owner, value):
+        rows = (
+            model.objects.filter(**{owner: OuterRef("pk")})
+            .order_by()
+            .values(owner)
+            .annotate(value=value)
+            .values("value")
+        )
+        return Coalesce(Subquery(rows), 0)
+
+    User.objects.update(
+        followers_count=aggregate(UserFollows, "followed_user_id", Count("pk")),
+        following_count=aggregate(UserFollows, "user_id", Count("pk")),
+        tickets_count=aggregate(Ticket, "user_id", Count("pk")),
+        reviews_count=aggregate(Review, "user_id", Count("pk")),
+    )
+    Ticket.objects.update(
+        review_count=aggregate(Review, "ticket_id", Count("pk")),
+        rating_sum=aggregate(Review, "ticket_id", Sum("rating")),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("litrevu", "0014_follow_suggestions"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ticket",
+            name="rating_sum",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Somme des notes"
+            ),
+        ),
+        migrations.AddField(
+            model_name="ticket",
+            name="review_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Nombre de critiques"
+            ),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="followers_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Abonnés"
+            ),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="following_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Abonnements"
+            ),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="reviews_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Critiques"
+            ),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="tickets_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Billets"
+            ),
+        ),
+        migrations.RunPython(count_rows, migrations.RunPython.noop),
+    ]
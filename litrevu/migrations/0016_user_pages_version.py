@@ -0,0 +1,20 @@
+# Generated by Django 5.0.2 on 2026-10-17 18:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("litrevu", "0015_counters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="pages_version",
+            field=models.PositiveBigIntegerField(
+                default=0, editable=False, verbose_name="Version des pages"
+            ),
+        ),
+    ]
@@ -1,20 +1,81 @@
+import hashlib
+
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.conf import settings
 from django.db import models
 from django.core.exceptions import ValidationError
-from PIL import Image
-from io import BytesIO
-from django.core.files import File
+
+from .storage import ticket_image_storage
+
+
+def _exclude_counters(instance, kwargs):
+    """Leave the counter columns out of the update of an existing row.
+
+    Counters are only written with ``F()`` expressions by
+    ``litrevu.counters``: saving the values loaded with the instance would
+    undo the increments committed since.
+
+    Args:
+        instance: The instance being saved, with a COUNTER_FIELDS attribute
+        kwargs: Keyword arguments of ``save``, updated in place
+    """
+    if (
+        instance._state.adding
+        or kwargs.get("force_insert")
+        or kwargs.get("update_fields") is not None
+    ):
+        return
+    kwargs["update_fields"] = [
+        field.name
+        for field in instance._meta.concrete_fields
+        if not field.primary_key and field.name not in instance.COUNTER_FIELDS
+    ]
 
 
 class User(AbstractUser):
-    """Custom user model for LITRevu."""
+    """Custom user model for LITRevu.
+
+    The counters are maintained by ``litrevu.counters`` and can be checked
+    with the ``reconcile_counters`` command. ``pages_version`` changes with
+    the content of the user's pages.
+    """
+
+    followers_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="Abonnés"
+    )
+    following_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="Abonnements"
+    )
+    tickets_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="Billets"
+    )
+    reviews_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="Critiques"
+    )
+    # Bumped by ``litrevu.feed_cache.invalidate`` in the transaction of each
+    # change shown on the user's pages, and part of their ETags
+    pages_version = models.PositiveBigIntegerField(
+        default=0, editable=False, verbose_name="Version des pages"
+    )
+
+    COUNTER_FIELDS = (
+        "followers_count",
+        "following_count",
+        "tickets_count",
+        "reviews_count",
+        "pages_version",
+    )
 
     class Meta:
         verbose_name = "Utilisateur"
         verbose_name_plural = "Utilisateurs"
 
+    def save(self, *args, **kwargs):
+        """Save the user, leaving the counters of an existing user untouched."""
+        _exclude_counters(self, kwargs)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         """Return the username as string representation.
 
@@ -27,10 +88,30 @@ class User(AbstractUser):
 class Ticket(models.Model):
     """Model representing a ticket (post) in the application.
 
-    A ticket can have an optional image that will be automatically resized.
-    Users can create tickets to request reviews or share content.
+    A ticket can have an optional image. The upload is stored as is and
+    resized in the background by ``litrevu.images``; ``image_state`` tells
+    whether the resized image is ready.
+    Users can create tickets to request reviews or share content. The
+    number of reviews and the sum of their ratings are maintained by
+    ``litrevu.counters``.
     """
 
+    class ImageState(models.TextChoices):
+        PENDING = "pending", "En cours de traitement"
+        READY = "ready", "Prête"
+        FAILED = "failed", "Échec du traitement"
+
+    # Fields describing the processed image, shared by the tickets with the
+    # same source image
+    PROCESSED_IMAGE_FIELDS = (
+        "image",
+        "image_renditions",
+        "image_width",
+        "image_height",
+        "image_size",
+    )
+    COUNTER_FIELDS = ("review_count", "rating_sum")
+
     title = models.CharField(max_length=128, verbose_name="Titre")
     description = models.TextField(
         max_length=2048, blank=True, verbose_name="Description"
@@ -45,9 +126,53 @@ class Ticket(models.Model):
         null=True,
         blank=True,
         upload_to="tickets/",
+        storage=ticket_image_storage,
         verbose_name="Image",
         help_text="Image maximum size is 800x800 pixels",
     )
+    image_state = models.CharField(
+        max_length=7,
+        choices=ImageState.choices,
+        default=ImageState.READY,
+        verbose_name="État de l'image",
+    )
+    image_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        db_index=True,
+        editable=False,
+        verbose_name="Empreinte de l'image",
+        help_text="SHA-256 of the uploaded image the stored image comes from",
+    )
+    image_renditions = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name="Déclinaisons de l'image",
+        help_text="Storage names of the renditions of the image",
+    )
+    # Recorded when the image is processed, so pages never read the file to
+    # know its size. Not declared as width_field/height_field: the ImageField
+    # would then open the file on every load of a row where they are empty.
+    image_width = models.PositiveIntegerField(
+        null=True, blank=True, editable=False, verbose_name="Largeur de l'image"
+    )
+    image_height = models.PositiveIntegerField(
+        null=True, blank=True, editable=False, verbose_name="Hauteur de l'image"
+    )
+    image_size = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Poids de l'image",
+        help_text="Size of the stored image file in bytes",
+    )
+    review_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="Nombre de critiques"
+    )
+    rating_sum = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="Somme des notes"
+    )
     time_created = models.DateTimeField(
         auto_now_add=True, verbose_name="Date de création"
     )
@@ -56,6 +181,11 @@ class Ticket(models.Model):
         ordering = ["-time_created"]
         verbose_name = "Billet"
         verbose_name_plural = "Billets"
+        indexes = [
+            models.Index(
+                fields=["user", "-time_created"], name="ticket_user_created_idx"
+            ),
+        ]
 
     def __str__(self):
         """Return the ticket title as string representation.
@@ -65,38 +195,107 @@ class Ticket(models.Model):
         """
         return f"{self.title}"
 
-    def save(self, *args, **kwargs):
-        if self.image:
-            # Open image
-            img = Image.open(self.image)
+    @property
+    def image_ready(self):
+        """Return True if the ticket has an image that can be displayed."""
+        return bool(self.image) and self.image_state == self.ImageState.READY
 
-            # Convert to RGB if necessary
-            if img.mode != "RGB":
-                img = img.convert("RGB")
+    @property
+    def average_rating(self):
+        """Return the mean rating of the reviews, or None without reviews."""
+        if not self.review_count:
+            return None
+        return self.rating_sum / self.review_count
 
-            # Set maximum size
-            max_size = (400, 400)
+    def save(self, *args, **kwargs):
+        """Save the ticket, marking a new image upload as pending.
+
+        The upload is stored unprocessed; the ``post_save`` receiver in
+        ``litrevu.signals`` queues its processing once the transaction
+        commits. Saves that keep the current image, or upload the same
+        content again, leave the stored image untouched: no file is written
+        and nothing is processed. An upload identical to the image of
+        another ticket shares its processed files. The review counters of
+        an existing ticket are left out of the update.
+        """
+        # Read by the post_save receivers queuing the image processing and
+        # releasing the files of a replaced image
+        self._image_changed = False
+        self._replaced_image = None
+        if self.image and not self.image._committed:
+            digest = self._upload_hash()
+            current = self._stored_image()
+            if (
+                current
+                and current["image"]
+                and current["image_hash"] == digest
+                and current["image_state"] != self.ImageState.FAILED
+            ):
+                # Same content as the stored image: keep the stored file
+                self.image = current["image"]
+                self.image_state = current["image_state"]
+            else:
+                self._replaced_image = current
+                self.image_hash = digest
+                processed = (
+                    Ticket.objects.filter(
+                        image_hash=digest, image_state=self.ImageState.READY
+                    )
+                    .values(*self.PROCESSED_IMAGE_FIELDS)
+                    .first()
+                )
+                if processed:
+                    # Already processed for another ticket: share its files
+                    for field, value in processed.items():
+                        setattr(self, field, value)
+                    self.image_state = self.ImageState.READY
+                else:
+                    self.image_state = self.ImageState.PENDING
+                    self._clear_processed_image()
+                    self._image_changed = True
+        elif not self.image:
+            if self.image_hash:
+                self._replaced_image = self._stored_image()
+            self.image_hash = ""
+            self.image_state = self.ImageState.READY
+            self._clear_processed_image()
+        _exclude_counters(self, kwargs)
+        super().save(*args, **kwargs)
 
-            # Resize if larger than maximum size while maintaining aspect ratio
-            if img.size[0] > max_size[0] or img.size[1] > max_size[1]:
-                img.thumbnail(max_size, Image.Resampling.LANCZOS)
+    def _clear_processed_image(self):
+        """Reset the fields describing the processed image, except the file."""
+        self.image_renditions = {}
+        self.image_width = self.image_height = self.image_size = None
 
-            # Save the processed image
-            output = BytesIO()
-            img.save(output, format="JPEG", quality=85)
-            output.seek(0)
+    def _stored_image(self):
+        """Return the image fields of the ticket as stored in the database.
 
-            # Replace the image field with processed image
-            self.image = File(output, name=self.image.name)
+        Returns:
+            dict: The image, image_hash, image_state and image_renditions
+                values, or None for a new ticket
+        """
+        if self.pk is None:
+            return None
+        return (
+            Ticket.objects.filter(pk=self.pk)
+            .values("image", "image_hash", "image_state", "image_renditions")
+            .first()
+        )
 
-        super().save(*args, **kwargs)
+    def _upload_hash(self):
+        """Return the SHA-256 hex digest of the uploaded image."""
+        digest = hashlib.sha256()
+        for chunk in self.image.chunks():
+            digest.update(chunk)
+        return digest.hexdigest()
 
 
 class Review(models.Model):
     """Model representing a review in the application.
 
     A review is always associated with a ticket and includes a rating (0-5),
-    a headline, and an optional detailed body text.
+    a headline, and an optional detailed body text. A user can only review a
+    ticket once (enforced by unique_together).
     """
 
     ticket = models.ForeignKey(
@@ -124,6 +323,26 @@ class Review(models.Model):
         ordering = ["-time_created"]
         verbose_name = "Critique"
         verbose_name_plural = "Critiques"
+        unique_together = (
+            "ticket",
+            "user",
+        )
+        indexes = [
+            models.Index(
+                fields=["user", "-time_created"], name="review_user_created_idx"
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Load a review, remembering its rating as stored.
+
+        Read by the ``post_save`` receiver of ``litrevu.signals`` updating
+        the rating sum of the ticket when the rating is edited.
+        """
+        review = super().from_db(db, field_names, values)
+        review._stored_rating = dict(zip(field_names, values)).get("rating")
+        return review
 
     def __str__(self):
         """Return the review headline as string representation.
@@ -165,6 +384,13 @@ class UserBlocks(models.Model):
             "user",
             "blocked_user",
         )
+        indexes = [
+            models.Index(
+                fields=["blocked_user", "-time_created"],
+                name="userblocks_blocked_idx",
+            ),
+            models.Index(fields=["user", "-time_created"], name="userblocks_user_idx"),
+        ]
         constraints = [
             models.CheckConstraint(
                 check=~models.Q(user=models.F("blocked_user")), name="cannot_block_self"
@@ -179,6 +405,28 @@ class UserBlocks(models.Model):
         """
         return f"{self.user} a bloqué {self.blocked_user}"
 
+    @classmethod
+    def blockers(cls, user_id, other_id):
+        """Return which of two users block the other, in one query.
+
+        Reads the database rather than the cached relations, so that the
+        writes it guards never rely on a cache another process may not have
+        invalidated yet.
+
+        Args:
+            user_id: Id of a user
+            other_id: Id of the other user
+
+        Returns:
+            set: Ids of the users among the two who block the other
+        """
+        return set(
+            cls.objects.filter(
+                models.Q(user_id=user_id, blocked_user_id=other_id)
+                | models.Q(user_id=other_id, blocked_user_id=user_id)
+            ).values_list("user_id", flat=True)
+        )
+
 
 class UserFollows(models.Model):
     """Model representing user follow relationships.
@@ -212,6 +460,13 @@ class UserFollows(models.Model):
             "user",
             "followed_user",
         )
+        indexes = [
+            models.Index(
+                fields=["followed_user", "-time_created"],
+                name="userfollows_followed_idx",
+            ),
+            models.Index(fields=["user", "-time_created"], name="userfollows_user_idx"),
+        ]
         constraints = [
             models.CheckConstraint(
                 check=~models.Q(user=models.F("followed_user")),
@@ -223,22 +478,20 @@ class UserFollows(models.Model):
         """Validate the follow relationship.
 
         Checks if either user has blocked the other, preventing the follow
-        relationship if blocks exist in either direction.
+        relationship if blocks exist in either direction. The blocks are
+        read from the database, in one query.
 
         Raises:
             ValidationError: If there are blocking relationships preventing the follow
         """
+        blockers = UserBlocks.blockers(self.user_id, self.followed_user_id)
         # Check if the user is blocked by the followed_user
-        if UserBlocks.objects.filter(
-            user=self.followed_user, blocked_user=self.user
-        ).exists():
+        if self.followed_user_id in blockers:
             raise ValidationError(
                 "Vous ne pouvez pas suivre un utilisateur qui vous a bloqué."
             )
         # Check if the user has blocked the followed_user
-        if UserBlocks.objects.filter(
-            user=self.user, blocked_user=self.followed_user
-        ).exists():
+        if self.user_id in blockers:
             raise ValidationError(
                 "Vous ne pouvez pas suivre un utilisateur que vous avez bloqué."
             )
@@ -265,3 +518,122 @@ class UserFollows(models.Model):
             str: Description of who follows whom
         """
         return f"{self.user} suit {self.followed_user}"
+
+
+class FeedEntry(models.Model):
+    """Materialized entry of a user's home feed.
+
+    One row is stored per (owner, item) pair, where the item is a ticket or a
+    review that belongs in the owner's feed. Rows are written when items are
+    created and when follow relationships change, so that reading a page of
+    the feed is a single range scan on the owner's entries.
+    """
+
+    class Kind(models.TextChoices):
+        TICKET = "TICKET", "Billet"
+        REVIEW = "REVIEW", "Critique"
+
+    owner = models.ForeignKey(
+        to=settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="feed_entries",
+        verbose_name="Propriétaire",
+    )
+    kind = models.CharField(max_length=6, choices=Kind.choices, verbose_name="Type")
+    item_id = models.PositiveBigIntegerField(verbose_name="Identifiant")
+    time_created = models.DateTimeField(verbose_name="Date de création")
+
+    class Meta:
+        verbose_name = "Entrée de flux"
+        verbose_name_plural = "Entrées de flux"
+        unique_together = (
+            "owner",
+            "kind",
+            "item_id",
+        )
+        indexes = [
+            models.Index(
+                fields=["owner", "-time_created", "-kind", "-item_id"],
+                name="feedentry_owner_page_idx",
+            ),
+            models.Index(fields=["kind", "item_id"], name="feedentry_item_idx"),
+        ]
+
+    def __str__(self):
+        """Return a string describing the feed entry.
+
+        Returns:
+            str: Description of the item and the feed it belongs to
+        """
+        return f"{self.kind} {self.item_id} dans le flux de {self.owner}"
+
+
+class FollowSuggestion(models.Model):
+    """User suggested to a user, computed by ``litrevu.suggestions``.
+
+    Suggested users are followed by users the user follows; ``mutual_count``
+    is the number of them. Rows are replaced for each user whose follow
+    neighborhood changed when the suggestions job runs.
+    """
+
+    user = models.ForeignKey(
+        to=settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="follow_suggestions",
+        verbose_name="Utilisateur",
+    )
+    suggested_user = models.ForeignKey(
+        to=settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name="Utilisateur suggéré",
+    )
+    mutual_count = models.PositiveIntegerField(verbose_name="Abonnements communs")
+    time_computed = models.DateTimeField(verbose_name="Date de calcul")
+
+    class Meta:
+        verbose_name = "Suggestion d'abonnement"
+        verbose_name_plural = "Suggestions d'abonnement"
+        unique_together = (
+            "user",
+            "suggested_user",
+        )
+        indexes = [
+            models.Index(
+                fields=["user", "-mutual_count", "suggested_user"],
+                name="followsuggestion_user_idx",
+            ),
+        ]
+
+    def __str__(self):
+        """Return a string describing the suggestion.
+
+        Returns:
+            str: Description of the suggested user and to whom
+        """
+        return f"{self.suggested_user} suggéré à {self.user}"
+
+
+class FollowGraphChange(models.Model):
+    """User whose follows or blocks changed since the suggestions job ran.
+
+    Not a foreign key: rows are written while users are being deleted, and
+    the job skips users that no longer exist.
+    """
+
+    user_id = models.PositiveBigIntegerField(verbose_name="Utilisateur")
+    time_created = models.DateTimeField(
+        auto_now_add=True, verbose_name="Date de création"
+    )
+
+    class Meta:
+        verbose_name = "Changement du graphe d'abonnements"
+        verbose_name_plural = "Changements du graphe d'abonnements"
+
+    def __str__(self):
+        """Return a string describing the change.
+
+        Returns:
+            str: The id of the user and the time of the change
+        """
+        return f"Utilisateur {self.user_id} modifié le {self.time_created}"
@@ -0,0 +1,99 @@
+"""Compact JSON serialization of feed items.
+
+Only the fields rendered on the feed cards are included, so that polling
+clients receive small payloads.
+"""
+
+import json
+
+from .feed import FeedCursor, TICKET
+
+
+def serialize_user(user):
+    """Serialize the public fields of a user.
+
+    Args:
+        user: The user
+
+    Returns:
+        dict: Id and username
+    """
+    return {"id": user.pk, "username": user.username}
+
+
+def serialize_ticket(ticket):
+    """Serialize a ticket as shown on a card.
+
+    Args:
+        ticket: The ticket, with its user loaded
+
+    Returns:
+        dict: The ticket fields
+    """
+    return {
+        "id": ticket.pk,
+        "title": ticket.title,
+        "description": ticket.description,
+        "image": ticket.image.url if ticket.image_ready else None,
+        "image_state": ticket.image_state if ticket.image else None,
+        "image_width": ticket.image_width if ticket.image_ready else None,
+        "image_height": ticket.image_height if ticket.image_ready else None,
+        "time_created": ticket.time_created.isoformat(),
+        "user": serialize_user(ticket.user),
+    }
+
+
+def serialize_item(item):
+    """Serialize a hydrated feed item.
+
+    Args:
+        item: A Ticket or Review annotated with ``content_type``
+
+    Returns:
+        dict: The item fields, with its kind and feed cursor
+    """
+    data = {
+        "kind": item.content_type,
+        "cursor": FeedCursor.for_item(item).encode(),
+    }
+    if item.content_type == TICKET:
+        data.update(serialize_ticket(item))
+        data["has_user_reviewed"] = item.has_user_reviewed
+    else:
+        data.update(
+            {
+                "id": item.pk,
+                "headline": item.headline,
+                "rating": item.rating,
+                "body": item.body,
+                "time_created": item.time_created.isoformat(),
+                "user": serialize_user(item.user),
+                "ticket": serialize_ticket(item.ticket),
+            }
+        )
+    return data
+
+
+def serialize_items(items, max_bytes):
+    """Serialize feed items until the payload reaches ``max_bytes``.
+
+    At least one item is always serialized, so that a client can make
+    progress whatever the limit.
+
+    Args:
+        items: Hydrated feed items, in the order they are sent
+        max_bytes: Approximate maximum size of the serialized items
+
+    Returns:
+        tuple: The serialized items and whether some items were left out
+    """
+    serialized = []
+    size = 0
+    for item in items:
+        data = serialize_item(item)
+        item_size = len(json.dumps(data, ensure_ascii=False).encode())
+        if serialized and size + item_size > max_bytes:
+            return serialized, True
+        serialized.append(data)
+        size += item_size
+    return serialized, False
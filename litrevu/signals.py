@@ -0,0 +1,241 @@
+"""Signal receivers keeping the home feeds up to date.
+
+Tickets and reviews are fanned out to the feed of every viewer when they are
+created and removed from all feeds when they are deleted. Follow
+relationships backfill or prune the follower's feed; this also covers
+``block_user``, which deletes follow relationships in both directions.
+
+New ticket images are queued for processing once the ticket is saved, and
+the files of replaced or deleted images are released.
+
+Every change also invalidates the cached feed pages of the affected viewers,
+and new items are pushed to the open event streams of their viewers. Follow
+and block changes invalidate the cached relations of both users and are
+recorded for the suggestions job.
+
+New, renamed and deleted users update the username index of the process
+once the transaction is committed.
+
+Created and deleted tickets, reviews and follows update the counters of
+their users and tickets in the same transaction.
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import (
+    counters,
+    events,
+    feed,
+    feed_cache,
+    images,
+    social_graph,
+    suggestions,
+    username_index,
+)
+from .models import Ticket, Review, UserFollows, UserBlocks, FeedEntry, User
+
+
+@receiver(post_save, sender=Ticket)
+def fan_out_ticket(sender, instance, created, raw=False, **kwargs):
+    """Add a new ticket to the feed of its author and their followers.
+
+    Connected streams of these users are notified of the new ticket.
+    """
+    if created and not raw:
+        viewers = feed.ticket_viewer_ids(instance)
+        feed.fan_out(feed.TICKET, instance, viewers)
+        events.publish_item(feed.TICKET, instance, viewers)
+
+
+@receiver(post_save, sender=Review)
+def fan_out_review(sender, instance, created, raw=False, **kwargs):
+    """Add a new review to the feed of every user who can see it.
+
+    Connected streams of these users are notified of the new review.
+    """
+    if created and not raw:
+        viewers = feed.review_viewer_ids(instance)
+        feed.fan_out(feed.REVIEW, instance, viewers)
+        events.publish_item(feed.REVIEW, instance, viewers)
+
+
+@receiver(post_save, sender=Ticket)
+def queue_ticket_image(sender, instance, raw=False, **kwargs):
+    """Queue the processing of a newly uploaded ticket image.
+
+    Saves that keep the stored image do not queue anything.
+    """
+    if not raw and getattr(instance, "_image_changed", False):
+        images.submit_on_commit(instance)
+
+
+@receiver(post_save, sender=Ticket)
+def release_replaced_image(sender, instance, raw=False, **kwargs):
+    """Delete the files of a replaced image if no other ticket uses them."""
+    replaced = getattr(instance, "_replaced_image", None)
+    if not raw and replaced and replaced["image"]:
+        images.release_on_commit(
+            replaced["image_hash"],
+            images.stored_names(replaced["image"], replaced["image_renditions"]),
+        )
+
+
+@receiver(post_delete, sender=Ticket)
+def release_deleted_image(sender, instance, **kwargs):
+    """Delete the files of a deleted ticket's image if no other ticket uses them."""
+    if instance.image:
+        images.release_on_commit(
+            instance.image_hash,
+            images.stored_names(instance.image.name, instance.image_renditions),
+        )
+
+
+@receiver(post_delete, sender=Ticket)
+def retract_ticket(sender, instance, **kwargs):
+    """Remove a deleted ticket from every feed."""
+    feed.retract(feed.TICKET, instance.pk)
+
+
+@receiver(post_delete, sender=Review)
+def retract_review(sender, instance, **kwargs):
+    """Remove a deleted review from every feed."""
+    feed.retract(feed.REVIEW, instance.pk)
+
+
+@receiver(post_save, sender=UserFollows)
+def backfill_follow(sender, instance, created, raw=False, **kwargs):
+    """Add the posts of the followed user to the follower's feed."""
+    if created and not raw:
+        feed.backfill_follow(instance.user_id, instance.followed_user_id)
+
+
+@receiver(post_delete, sender=UserFollows)
+def prune_follow(sender, instance, **kwargs):
+    """Remove the posts of the unfollowed user from the follower's feed."""
+    feed.prune_follow(instance.user_id, instance.followed_user_id)
+
+
+@receiver(post_save, sender=Ticket)
+@receiver(post_delete, sender=Ticket)
+def invalidate_ticket(sender, instance, raw=False, **kwargs):
+    """Invalidate the feeds showing a ticket, directly or through a review."""
+    if raw:
+        return
+    viewers = feed.ticket_viewer_ids(instance)
+    # Review cards embed the reviewed ticket
+    viewers.update(
+        FeedEntry.objects.filter(
+            kind=feed.REVIEW,
+            item_id__in=Review.objects.filter(ticket_id=instance.pk).values("id"),
+        ).values_list("owner_id", flat=True)
+    )
+    feed_cache.invalidate(viewers)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_review(sender, instance, raw=False, **kwargs):
+    """Invalidate the feeds of the author, their followers and the ticket owner."""
+    if not raw:
+        feed_cache.invalidate(feed.review_viewer_ids(instance))
+
+
+@receiver(post_save, sender=UserFollows)
+@receiver(post_delete, sender=UserFollows)
+def invalidate_follow(sender, instance, raw=False, **kwargs):
+    """Invalidate the feed of the follower and the version of both users.
+
+    The followed user's feed does not change, but their follows page does.
+    The relations of both users change, and the follower's follows are
+    recorded as changed for the suggestions job.
+    """
+    if not raw:
+        feed_cache.invalidate([instance.user_id, instance.followed_user_id])
+        social_graph.invalidate([instance.user_id, instance.followed_user_id])
+        suggestions.mark_changed([instance.user_id])
+
+
+@receiver(post_save, sender=UserBlocks)
+@receiver(post_delete, sender=UserBlocks)
+def invalidate_block(sender, instance, raw=False, **kwargs):
+    """Invalidate the feeds, relations and suggestions of both users of a block."""
+    if not raw:
+        feed_cache.invalidate([instance.user_id, instance.blocked_user_id])
+        social_graph.invalidate([instance.user_id, instance.blocked_user_id])
+        suggestions.mark_changed([instance.user_id, instance.blocked_user_id])
+
+
+@receiver(post_save, sender=User)
+def index_username(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Add a new user to the username index, or update a renamed one.
+
+    Saves that do not write the username, such as the ``last_login`` update
+    of each login, are skipped.
+    """
+    if raw:
+        return
+    index = username_index.get_index()
+    pk, username = instance.pk, instance.username
+    if created:
+        transaction.on_commit(lambda: index.add(pk, username))
+    elif update_fields is None or "username" in update_fields:
+        transaction.on_commit(lambda: index.rename(pk, username))
+
+
+@receiver(post_delete, sender=User)
+def unindex_username(sender, instance, **kwargs):
+    """Remove a deleted user from the username index."""
+    pk = instance.pk
+    transaction.on_commit(lambda: username_index.get_index().remove(pk))
+
+
+@receiver(post_save, sender=Ticket)
+def count_new_ticket(sender, instance, created, raw=False, **kwargs):
+    """Count a new ticket in the counters of its author."""
+    if created and not raw:
+        counters.ticket_changed(instance, 1)
+
+
+@receiver(post_delete, sender=Ticket)
+def uncount_ticket(sender, instance, **kwargs):
+    """Remove a deleted ticket from the counters of its author."""
+    counters.ticket_changed(instance, -1)
+
+
+@receiver(post_save, sender=Review)
+def count_review(sender, instance, created, raw=False, **kwargs):
+    """Count a new review, or the new rating of an edited review.
+
+    A new review is counted for its author and its ticket; an edit only
+    changes the rating sum of the ticket, when the rating changed.
+    """
+    if raw:
+        return
+    if created:
+        counters.review_changed(instance, 1)
+    else:
+        previous = getattr(instance, "_stored_rating", None)
+        if previous is not None and previous != instance.rating:
+            counters.rating_changed(instance, previous)
+    instance._stored_rating = instance.rating
+
+
+@receiver(post_delete, sender=Review)
+def uncount_review(sender, instance, **kwargs):
+    """Remove a deleted review from the counters of its author and ticket."""
+    counters.review_changed(instance, -1)
+
+
+@receiver(post_save, sender=UserFollows)
+def count_follow(sender, instance, created, raw=False, **kwargs):
+    """Count a new follow for the follower and the followed user."""
+    if created and not raw:
+        counters.follows_changed(instance.user_id, [instance.followed_user_id], 1)
+
+
+@receiver(post_delete, sender=UserFollows)
+def uncount_follow(sender, instance, **kwargs):
+    """Remove a deleted follow from the counters of both users."""
+    counters.follows_changed(instance.user_id, [instance.followed_user_id], -1)
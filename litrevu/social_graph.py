@@ -0,0 +1,291 @@
+"""Cached follow and block relations of each user.
+
+The ids of the users a user follows, is followed by, blocks and is blocked
+by are loaded together in a single query and kept in Django's cache under
+a per-user version, like the feed pages of ``litrevu.feed_cache``. Changes
+to ``UserFollows`` and ``UserBlocks`` bump the version of both users once
+the transaction is committed (see ``litrevu.signals``), so a stale entry is
+never read again.
+
+The relationship between two users is then a few set lookups on the
+relations of one of them.
+
+The follows page lists the related users themselves, most recent first,
+with ``list_relations``: one query per list returns a keyset-paginated
+page of it.
+"""
+
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import CharField, Q, Value
+
+from .models import UserBlocks, UserFollows
+
+SOCIAL_GRAPH_CACHE_ALIAS = getattr(settings, "SOCIAL_GRAPH_CACHE_ALIAS", "default")
+SOCIAL_GRAPH_CACHE_TIMEOUT = getattr(settings, "SOCIAL_GRAPH_CACHE_TIMEOUT", 3600)
+
+FOLLOWING = "following"
+FOLLOWERS = "followers"
+BLOCKING = "blocking"
+BLOCKED_BY = "blocked_by"
+
+Relations = namedtuple("Relations", [FOLLOWING, FOLLOWERS, BLOCKING, BLOCKED_BY])
+Relations.__doc__ = "Frozen sets of user ids related to a user, by kind."
+
+# Model, owner column and related user column of each kind of relation
+RELATION_COLUMNS = {
+    FOLLOWING: (UserFollows, "user", "followed_user"),
+    FOLLOWERS: (UserFollows, "followed_user", "user"),
+    BLOCKING: (UserBlocks, "user", "blocked_user"),
+    BLOCKED_BY: (UserBlocks, "blocked_user", "user"),
+}
+
+RELATIONS_PAGE_SIZE = 50
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+Relationship = namedtuple(
+    "Relationship", ["following", "followed_by", "blocking", "blocked_by"]
+)
+Relationship.__doc__ = "Relationship of a user towards another user."
+
+Related = namedtuple("Related", ["id", "time_created", "user_id", "username"])
+Related.__doc__ = "Follow or block row, with the id and name of the other user."
+
+
+class RelationCursor(namedtuple("RelationCursor", ["time_created", "id"])):
+    """Position of a row in a relation list.
+
+    Rows are sorted by ``(time_created, id)`` in descending order.
+    """
+
+    __slots__ = ()
+
+    def encode(self):
+        """Serialize the cursor for use in a query string.
+
+        Returns:
+            str: The cursor as ``<microseconds>-<id>``, where the signed number
+            of microseconds is counted from the epoch
+        """
+        microseconds = (self.time_created - _EPOCH) // _MICROSECOND
+        return f"{microseconds}-{self.id}"
+
+    @classmethod
+    def decode(cls, value):
+        """Parse a cursor produced by ``encode``.
+
+        Args:
+            value: The encoded cursor, usually taken from ``request.GET``
+
+        Returns:
+            RelationCursor: The decoded cursor, or None if the value is
+            missing or malformed
+        """
+        if not value:
+            return None
+        try:
+            # The time is negative before 1970: split from the right
+            microseconds, pk = value.rsplit("-", 1)
+            return cls(_EPOCH + timedelta(microseconds=int(microseconds)), int(pk))
+        except (ValueError, OverflowError):
+            return None
+
+
+class RelationPage:
+    """A bounded slice of a relation list.
+
+    Attributes:
+        items: Related rows, most recent first
+        next_cursor: Cursor of the next (older) page, or None if this is
+            the last page
+    """
+
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+
+def _cache():
+    return caches[SOCIAL_GRAPH_CACHE_ALIAS]
+
+
+def _version_key(user_id):
+    return f"graph:version:{user_id}"
+
+
+def graph_version(user_id):
+    """Return the current cache version of a user's relations.
+
+    Initialized from the clock, as the feed versions, so that entries
+    cached under an evicted version can never be reached again.
+
+    Args:
+        user_id: Id of the user
+
+    Returns:
+        int: The current version
+    """
+    cache = _cache()
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def load_relations(user_id):
+    """Read the relations of a user from the database, in one query.
+
+    Args:
+        user_id: Id of the user
+
+    Returns:
+        Relations: The related user ids
+    """
+    queries = [
+        model.objects.filter(**{f"{owner}_id": user_id})
+        .order_by()
+        .values_list(Value(kind, output_field=CharField()), f"{other}_id")
+        for kind, (model, owner, other) in RELATION_COLUMNS.items()
+    ]
+    rows = queries[0].union(*queries[1:], all=True)
+    related = {kind: set() for kind in Relations._fields}
+    for kind, other_id in rows:
+        related[kind].add(other_id)
+    return Relations(**{kind: frozenset(ids) for kind, ids in related.items()})
+
+
+def relations(user_id):
+    """Return the relations of a user, from the cache if possible.
+
+    The version is read before the database, so relations loaded while a
+    change commits are stored under the version that change bumps.
+
+    Args:
+        user_id: Id of the user
+
+    Returns:
+        Relations: The related user ids
+    """
+    cache = _cache()
+    key = f"graph:relations:{user_id}:{graph_version(user_id)}"
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    cached = load_relations(user_id)
+    cache.set(key, cached, SOCIAL_GRAPH_CACHE_TIMEOUT)
+    return cached
+
+
+def relationship(user_id, other_id):
+    """Return the relationship of a user towards another user.
+
+    Args:
+        user_id: Id of the user
+        other_id: Id of the other user
+
+    Returns:
+        Relationship: Whether the user follows, is followed by, blocks and
+            is blocked by the other user
+    """
+    related = relations(user_id)
+    return Relationship(
+        following=other_id in related.following,
+        followed_by=other_id in related.followers,
+        blocking=other_id in related.blocking,
+        blocked_by=other_id in related.blocked_by,
+    )
+
+
+def _bump(user_ids):
+    cache = _cache()
+    for user_id in user_ids:
+        try:
+            cache.incr(_version_key(user_id))
+        except ValueError:
+            # No version means no cached relations for this user
+            pass
+
+
+def invalidate(user_ids):
+    """Invalidate the cached relations of several users.
+
+    The versions are bumped once the current transaction is committed.
+    Until then, the relations read in the transaction come from the
+    cache as it was before it.
+
+    Args:
+        user_ids: Ids of the users whose relations changed
+    """
+    user_ids = set(user_ids)
+    if user_ids:
+        transaction.on_commit(lambda: _bump(user_ids))
+
+
+def _relation_rows(user_id, kind, before, limit):
+    """Return the queryset of one page of a relation list.
+
+    Args:
+        user_id: Id of the user the list belongs to
+        kind: FOLLOWING, FOLLOWERS, BLOCKING or BLOCKED_BY
+        before: Optional cursor of the last row of the previous page
+        limit: Number of rows to return
+
+    Returns:
+        QuerySet: Rows of id, time_created, other user id and username
+    """
+    model, owner, other = RELATION_COLUMNS[kind]
+    rows = model.objects.filter(**{f"{owner}_id": user_id})
+    if before is not None:
+        rows = rows.filter(
+            Q(time_created__lt=before.time_created)
+            | Q(time_created=before.time_created, id__lt=before.id)
+        )
+    return rows.order_by("-time_created", "-id").values_list(
+        "id", "time_created", f"{other}_id", f"{other}__username"
+    )[:limit]
+
+
+def list_relations(user_id, cursors=None, kinds=Relations._fields, limit=None):
+    """Return a page of each relation list of a user.
+
+    Each list is read by its own ordered and limited query, a range scan on
+    the ``(owner, -time_created)`` index of its table: one query per kind,
+    whatever the number of relations.
+
+    Args:
+        user_id: Id of the user
+        cursors: Optional dict of the cursor to start each list after
+        kinds: Relation kinds to list
+        limit: Number of rows per list, RELATIONS_PAGE_SIZE by default
+
+    Returns:
+        dict: RelationPage of each kind
+    """
+    cursors = cursors or {}
+    limit = limit or RELATIONS_PAGE_SIZE
+    rows = {
+        # One extra row tells whether there is a next page
+        kind: [
+            Related(*values)
+            for values in _relation_rows(user_id, kind, cursors.get(kind), limit + 1)
+        ]
+        for kind in kinds
+    }
+
+    pages = {}
+    for kind, items in rows.items():
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = RelationCursor(items[-1].time_created, items[-1].id)
+        pages[kind] = RelationPage(items, next_cursor)
+    return pages
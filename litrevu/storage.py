@@ -0,0 +1,113 @@
+"""Content-addressed storage of the ticket images.
+
+Files are named after the SHA-256 of their content, so an image uploaded by
+many users, and each of its renditions, is stored once. Saving content that
+is already stored only refreshes the modification time of the existing file
+and returns its name. Since a name
+always holds the same bytes, stored files can be served with far-future,
+immutable cache headers.
+
+Files shared by several tickets are deleted once no ticket references them
+any more (see ``litrevu.images.release``).
+"""
+
+import hashlib
+import os
+import re
+import uuid
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, storages
+
+# Storage names produced by ContentAddressedStorage
+HASHED_NAME = re.compile(r"(^|/)(?P<shard>[0-9a-f]{2})/(?P=shard)[0-9a-f]{62}\.\w+$")
+
+
+def is_hashed_name(name):
+    """Return True if a storage name was produced by ContentAddressedStorage.
+
+    Args:
+        name: Storage name
+
+    Returns:
+        bool: True if the name ends with "<xx>/<sha256>.<ext>"
+    """
+    return HASHED_NAME.search(name) is not None
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """File system storage naming files after the SHA-256 of their content.
+
+    The name given to ``save`` only provides the directory and the
+    extension: content saved as "tickets/photo.PNG" is stored as
+    "tickets/ab/ab12...ef.png". Files are never renamed on collision, since
+    an existing name holds the same content.
+    """
+
+    def save(self, name, content, max_length=None):
+        """Store content under its hashed name unless it is already stored.
+
+        Content that is already stored is not written again; the existing
+        file gets a new modification time.
+
+        Args:
+            name: Name hint giving the directory and extension
+            content: File or file-like object to store
+            max_length: Maximum length of the returned name
+
+        Returns:
+            str: The hashed storage name
+        """
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+
+        name = self.hashed_name(name, digest.hexdigest())
+        try:
+            # The orphan collector skips recent files: an old orphan about to
+            # be referenced again must not be collected before the ticket
+            # referencing it is committed
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            return super().save(name, content, max_length=max_length)
+        return name
+
+    @staticmethod
+    def hashed_name(name, digest):
+        """Return the storage name of content with the given digest.
+
+        Files are spread over 256 subdirectories by the first byte of their
+        digest.
+
+        Args:
+            name: Name hint giving the directory and extension
+            digest: SHA-256 hex digest of the content
+
+        Returns:
+            str: e.g. "tickets/ab/ab12...ef.png"
+        """
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(directory, digest[:2], f"{digest}{extension}")
+
+    def get_available_name(self, name, max_length=None):
+        """Keep hashed names as they are: equal names mean equal content."""
+        return name
+
+    def _save(self, name, content):
+        # Write to a unique temporary name, then move it in place atomically:
+        # a concurrent save of the same content replaces the file with the
+        # same bytes instead of failing on the existing name
+        temporary = super()._save(f"{name}.{uuid.uuid4().hex}.tmp", content)
+        os.replace(self.path(temporary), self.path(name))
+        return name
+
+
+def ticket_image_storage():
+    """Return the storage of the ticket images, configured in STORAGES."""
+    return storages["ticket_images"]
@@ -0,0 +1,284 @@
+"""Friends-of-friends follow suggestions, computed in batch.
+
+A user is suggested the users followed by the users they follow, ranked by
+the number of these mutual follows. Users already followed, the user
+themselves and blocks in either direction are left out.
+
+The suggestions are computed by the ``compute_suggestions`` command and
+stored in ``FollowSuggestion``, so the follows page reads them with one
+range scan. Follow and block changes record the users whose follows
+changed in ``FollowGraphChange`` (see ``litrevu.signals``); a run only
+recomputes these users and their followers, whose second-degree
+neighborhood goes through them.
+
+With NumPy and SciPy installed, the follow graph is loaded as a sparse
+adjacency matrix ``A`` and the mutual counts of a batch of users are the
+rows of ``A[batch] @ A``. Without them, the follows of each batch and of
+the users they follow are read from the database and counted in Python,
+which is slower but holds only one batch in memory.
+"""
+
+import heapq
+from collections import Counter, defaultdict
+from itertools import chain, islice
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .models import FollowGraphChange, FollowSuggestion, UserBlocks, UserFollows
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = sparse = None
+
+User = get_user_model()
+
+FOLLOW_SUGGESTIONS_LIMIT = getattr(settings, "FOLLOW_SUGGESTIONS_LIMIT", 20)
+# Suggestions shown on the follows page
+SUGGESTIONS_SHOWN = 5
+
+# Users whose suggestions are computed and written together
+BATCH_SIZE = 1000
+# Ids per IN clause, below SQLite's limit of bound parameters
+IN_CHUNK_SIZE = 500
+
+
+def mark_changed(user_ids):
+    """Record that the follows or blocks of users changed.
+
+    Args:
+        user_ids: Ids of the users whose follows or blocks changed
+    """
+    FollowGraphChange.objects.bulk_create(
+        FollowGraphChange(user_id=user_id) for user_id in set(user_ids)
+    )
+
+
+def _chunks(ids, size=IN_CHUNK_SIZE):
+    iterator = iter(ids)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _follower_ids(user_ids):
+    """Return the ids of the users following any of the given users."""
+    followers = set()
+    for chunk in _chunks(user_ids):
+        followers.update(
+            UserFollows.objects.filter(followed_user_id__in=chunk).values_list(
+                "user_id", flat=True
+            )
+        )
+    return followers
+
+
+def _block_ids(user_ids):
+    """Return the ids of the users each user blocks or is blocked by.
+
+    Returns:
+        defaultdict: Set of blocked and blocking user ids of each user
+    """
+    blocks = defaultdict(set)
+    rows = UserBlocks.objects.filter(
+        Q(user_id__in=user_ids) | Q(blocked_user_id__in=user_ids)
+    ).values_list("user_id", "blocked_user_id")
+    for user_id, blocked_id in rows:
+        blocks[user_id].add(blocked_id)
+        blocks[blocked_id].add(user_id)
+    return blocks
+
+
+def _top(user_id, counts, excluded, limit):
+    """Return the best candidates of a user, ties broken by user id."""
+    return heapq.nsmallest(
+        limit,
+        (
+            (-count, candidate)
+            for candidate, count in counts
+            if candidate not in excluded and candidate != user_id
+        ),
+    )
+
+
+class MatrixScorer:
+    """Count mutual follows with a sparse adjacency matrix of the follow graph.
+
+    The whole graph is loaded once: follows are read as pairs of user ids,
+    which index the rows and columns directly.
+    """
+
+    def __init__(self):
+        size = (User.objects.aggregate(Max("pk"))["pk__max"] or 0) + 1
+        pairs = UserFollows.objects.values_list("user_id", "followed_user_id")
+        edges = np.fromiter(
+            chain.from_iterable(pairs.iterator(chunk_size=10000)), dtype=np.int64
+        ).reshape(-1, 2)
+        self.adjacency = sparse.csr_matrix(
+            (np.ones(len(edges), dtype=np.int32), (edges[:, 0], edges[:, 1])),
+            shape=(size, size),
+        )
+
+    def score(self, user_ids, limit):
+        """Compute the suggestions of a batch of users.
+
+        Args:
+            user_ids: Ids of the users
+            limit: Number of suggestions per user
+
+        Returns:
+            dict: ``(-mutual_count, suggested_user_id)`` pairs of each user,
+                best first
+        """
+        adjacency = self.adjacency
+        rows = np.asarray(user_ids, dtype=np.int64)
+        # Users created after the matrix was loaded have no row
+        rows = rows[rows < adjacency.shape[0]]
+        counts = (adjacency[rows] @ adjacency).tocsr()
+        blocks = _block_ids(user_ids)
+        results = {user_id: [] for user_id in user_ids}
+        for position, user_id in enumerate(rows.tolist()):
+            found = slice(counts.indptr[position], counts.indptr[position + 1])
+            start, end = adjacency.indptr[user_id], adjacency.indptr[user_id + 1]
+            following = adjacency.indices[start:end]
+            results[user_id] = _top(
+                user_id,
+                zip(counts.indices[found].tolist(), counts.data[found].tolist()),
+                blocks[user_id].union(following.tolist()),
+                limit,
+            )
+        return results
+
+
+class QueryScorer:
+    """Count mutual follows from the follows of each batch, read from the database.
+
+    Used when NumPy or SciPy is not installed.
+    """
+
+    def _following(self, user_ids):
+        following = defaultdict(list)
+        for chunk in _chunks(user_ids):
+            for user_id, followed_id in UserFollows.objects.filter(
+                user_id__in=chunk
+            ).values_list("user_id", "followed_user_id"):
+                following[user_id].append(followed_id)
+        return following
+
+    def score(self, user_ids, limit):
+        """Compute the suggestions of a batch of users.
+
+        Args:
+            user_ids: Ids of the users
+            limit: Number of suggestions per user
+
+        Returns:
+            dict: ``(-mutual_count, suggested_user_id)`` pairs of each user,
+                best first
+        """
+        following = self._following(user_ids)
+        second = self._following(set(chain.from_iterable(following.values())))
+        blocks = _block_ids(user_ids)
+        results = {}
+        for user_id in user_ids:
+            counts = Counter(
+                chain.from_iterable(second[pk] for pk in following[user_id])
+            )
+            results[user_id] = _top(
+                user_id,
+                counts.items(),
+                blocks[user_id].union(following[user_id]),
+                limit,
+            )
+        return results
+
+
+def get_scorer():
+    """Return the matrix scorer if SciPy is installed, else the query scorer."""
+    if sparse is None:
+        return QueryScorer()
+    return MatrixScorer()
+
+
+def _store(results):
+    """Replace the stored suggestions of a batch of users."""
+    now = timezone.now()
+    with transaction.atomic():
+        FollowSuggestion.objects.filter(user_id__in=list(results)).delete()
+        FollowSuggestion.objects.bulk_create(
+            FollowSuggestion(
+                user_id=user_id,
+                suggested_user_id=suggested_id,
+                mutual_count=-negated_count,
+                time_computed=now,
+            )
+            for user_id, top in results.items()
+            for negated_count, suggested_id in top
+        )
+
+
+def compute_suggestions(full=False, limit=None, batch_size=BATCH_SIZE):
+    """Recompute the stored suggestions.
+
+    Args:
+        full: Recompute every user instead of the users affected by the
+            changes recorded since the last run
+        limit: Suggestions stored per user, FOLLOW_SUGGESTIONS_LIMIT by default
+        batch_size: Users computed and written together
+
+    Returns:
+        int: Number of users whose suggestions were recomputed
+    """
+    limit = limit or FOLLOW_SUGGESTIONS_LIMIT
+    # Changes recorded during the run are left for the next one
+    last_change = FollowGraphChange.objects.aggregate(Max("pk"))["pk__max"] or 0
+    if full:
+        user_ids = list(User.objects.order_by("pk").values_list("pk", flat=True))
+    else:
+        changed = set(
+            FollowGraphChange.objects.filter(pk__lte=last_change).values_list(
+                "user_id", flat=True
+            )
+        )
+        affected = changed | _follower_ids(changed)
+        user_ids = sorted(
+            chain.from_iterable(
+                User.objects.filter(pk__in=chunk).values_list("pk", flat=True)
+                for chunk in _chunks(affected)
+            )
+        )
+
+    if user_ids:
+        scorer = get_scorer()
+        for batch in _chunks(user_ids, batch_size):
+            _store(scorer.score(batch, limit))
+    FollowGraphChange.objects.filter(pk__lte=last_change).delete()
+    return len(user_ids)
+
+
+def suggestions_for(user, related, count=SUGGESTIONS_SHOWN):
+    """Return stored suggestions of a user that are still valid.
+
+    Suggestions are only as recent as the last run: users followed or
+    blocked since then are skipped.
+
+    Args:
+        user: The user
+        related: Relations of the user, from ``social_graph.relations``
+        count: Maximum number of suggestions
+
+    Returns:
+        list: ``(user_id, username, mutual_count)`` tuples, best first
+    """
+    excluded = related.following | related.blocking | related.blocked_by
+    # At most FOLLOW_SUGGESTIONS_LIMIT rows are stored per user
+    rows = (
+        FollowSuggestion.objects.filter(user=user)
+        .order_by("-mutual_count", "suggested_user")
+        .values_list("suggested_user_id", "suggested_user__username", "mutual_count")
+    )
+    return [row for row in rows if row[0] not in excluded][:count]
@@ -0,0 +1,48 @@
+"""Template tags displaying the ticket images.
+
+Usage::
+
+    {% load ticket_images %}
+    {% ticket_image ticket "thumb" css_class="img-fluid" %}
+"""
+
+from django import template
+
+from litrevu import images
+
+register = template.Library()
+
+# Value of the sizes attribute for each display size of the image
+SIZES = {
+    "thumb": "200px",
+    "card": "(max-width: 576px) 100vw, 400px",
+    "full": "(max-width: 992px) 100vw, 800px",
+}
+
+
+@register.inclusion_tag("litrevu/ticket_image.html")
+def ticket_image(ticket, rendition="card", css_class="", style="", alt=None):
+    """Render a ticket image with its renditions, or a placeholder.
+
+    Ready images are rendered as a ``<picture>`` with a WebP and a JPEG
+    srcset, lazily loaded. Pending and failed images are rendered as a
+    placeholder.
+
+    Args:
+        ticket: The ticket
+        rendition: Key of ``images.RENDITIONS`` the image is displayed at
+        css_class: CSS classes of the image or placeholder
+        style: Inline style of the image
+        alt: Alternative text, "Image du billet" by default
+
+    Returns:
+        dict: Context of the ``litrevu/ticket_image.html`` template
+    """
+    return {
+        "ticket": ticket,
+        "picture": images.picture(ticket, rendition) if ticket.image_ready else None,
+        "sizes": SIZES[rendition],
+        "css_class": css_class,
+        "style": style,
+        "alt": alt or "Image du billet",
+    }
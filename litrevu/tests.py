@@ -0,0 +1,45 @@
+from datetime import datetime, timezone
+
+from django.test import SimpleTestCase
+
+from .feed import REVIEW, TICKET, FeedCursor
+from .social_graph import RelationCursor
+
+
+class FeedCursorTests(SimpleTestCase):
+    """Round trip of the keyset cursors passed in the query string."""
+
+    def test_round_trip(self):
+        """Decoding an encoded cursor gives the same cursor back."""
+        for time_created in (
+            datetime(2024, 5, 17, 12, 30, 15, 123456, tzinfo=timezone.utc),
+            datetime(1970, 1, 1, tzinfo=timezone.utc),
+            datetime(1969, 12, 31, 23, 59, 59, 999999, tzinfo=timezone.utc),
+            datetime(1901, 3, 4, 5, 6, 7, 8, tzinfo=timezone.utc),
+        ):
+            for kind in (TICKET, REVIEW):
+                cursor = FeedCursor(time_created, kind, 42)
+                self.assertEqual(FeedCursor.decode(cursor.encode()), cursor)
+
+    def test_malformed(self):
+        """Malformed cursors decode to None."""
+        for value in (None, "", "abc", "1-TICKET", "1-OTHER-2", "--1-TICKET-2"):
+            self.assertIsNone(FeedCursor.decode(value))
+
+
+class RelationCursorTests(SimpleTestCase):
+    """Round trip of the cursors of the relation lists."""
+
+    def test_round_trip(self):
+        """Decoding an encoded cursor gives the same cursor back."""
+        for time_created in (
+            datetime(2024, 5, 17, 12, 30, 15, 123456, tzinfo=timezone.utc),
+            datetime(1969, 12, 31, 23, 59, 59, 999999, tzinfo=timezone.utc),
+        ):
+            cursor = RelationCursor(time_created, 42)
+            self.assertEqual(RelationCursor.decode(cursor.encode()), cursor)
+
+    def test_malformed(self):
+        """Malformed cursors decode to None."""
+        for value in (None, "", "abc", "1-2-3", "--1-2"):
+            self.assertIsNone(RelationCursor.decode(value))
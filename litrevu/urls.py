@@ -24,11 +24,20 @@ urlpatterns = [
     # Main pages
     path("home/", views.home, name="home"),
     path("posts/", views.posts, name="posts"),
+    path("home/new/", views.home_new, name="home_new"),
+    path("home/events/", views.home_events, name="home_events"),
+    path("home/cache-stats/", views.feed_cache_stats, name="feed_cache_stats"),
     # Following and Blocking
     path("follows/", views.follows_list, name="follows"),
+    path(
+        "follows/autocomplete/",
+        views.username_autocomplete,
+        name="username_autocomplete",
+    ),
     path("unfollow/<int:user_id>/", views.unfollow_user, name="unfollow"),
     path("block/<int:user_id>/", views.block_user, name="block"),
     path("unblock/<int:user_id>/", views.unblock_user, name="unblock"),
+    path("follows/bulk/", views.bulk_relations, name="bulk_relations"),
     # Tickets and Reviews
     path("ticket/create/", views.create_ticket, name="create_ticket"),
     path("ticket/edit/<int:ticket_id>/", views.edit_ticket, name="edit_ticket"),
@@ -39,6 +48,12 @@ urlpatterns = [
         views.create_review,
         name="create_review_for_ticket",
     ),
+    path("images/stats/", views.image_stats, name="image_stats"),
+    path(
+        "images/tickets/<int:ticket_id>/<str:rendition>.<str:extension>",
+        views.ticket_rendition,
+        name="ticket_rendition",
+    ),
     path("review/edit/<int:review_id>/", views.edit_review, name="edit_review"),
     path("review/delete/<int:review_id>/", views.delete_review, name="delete_review"),
 ]
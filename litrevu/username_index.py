@@ -0,0 +1,287 @@
+"""Prefix search on usernames for the follow form's autocomplete.
+
+Usernames are kept in memory in a sorted list, with the user ids in a
+parallel array: the names starting with a prefix are a contiguous run found
+by binary search, so a lookup reads a few dozen entries whatever the number
+of users. The index is loaded in a background thread when the server starts
+(see ``config/wsgi.py`` and ``config/asgi.py``) and kept up to date by the
+``User`` signal receivers of ``litrevu.signals``.
+
+Until the index is loaded, and in processes that never load it, lookups
+fall back to a range query on the unique index of ``username``: this is the
+plan an indexed ``LIKE 'prefix%'`` gets, which SQLite's case-insensitive
+``LIKE`` cannot use. Both paths match prefixes case-sensitively, as
+usernames are.
+
+Users created in other processes are picked up every
+USERNAME_INDEX_REFRESH seconds, by reading the users with a greater id than
+the last one loaded. Users renamed or deleted in another process keep their
+old entry until the index is reloaded; the follow form still rejects them.
+"""
+
+import bisect
+import logging
+import threading
+import time
+from array import array
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+
+from . import social_graph
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+USERNAME_AUTOCOMPLETE_LIMIT = getattr(settings, "USERNAME_AUTOCOMPLETE_LIMIT", 10)
+USERNAME_INDEX_REFRESH = getattr(settings, "USERNAME_INDEX_REFRESH", 60)
+
+# Rows read per query by the database fallback and by the initial load
+CHUNK_SIZE = 5000
+
+# Greater than every character allowed in a username: every name starting
+# with a prefix sorts between the prefix and the prefix followed by it
+_MAX_CHAR = "\U0010ffff"
+
+
+class UsernameIndex:
+    """Sorted usernames with their user ids.
+
+    Attributes:
+        names: Usernames in ascending code point order
+        ids: Id of the user of each name
+        max_id: Greatest user id read from the database
+        loaded: Whether the index holds every user
+        refreshed: ``time.monotonic()`` of the last refresh
+    """
+
+    def __init__(self):
+        self.names = []
+        self.ids = array("q")
+        self.max_id = 0
+        self.loaded = False
+        self.refreshed = 0.0
+        self._lock = threading.Lock()
+        # Changes received while loading, applied once the load is done
+        self._pending = None
+
+    def load(self):
+        """Read every user from the database and replace the index.
+
+        Users are read in primary key order, in chunks, then sorted once.
+        """
+        with self._lock:
+            self._pending = []
+        rows = []
+        last_id = 0
+        try:
+            while True:
+                chunk = list(
+                    User.objects.filter(pk__gt=last_id)
+                    .order_by("pk")
+                    .values_list("username", "pk")[:CHUNK_SIZE]
+                )
+                if not chunk:
+                    break
+                rows.extend(chunk)
+                last_id = chunk[-1][1]
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        rows.sort()
+
+        with self._lock:
+            self.names = [name for name, _ in rows]
+            self.ids = array("q", (pk for _, pk in rows))
+            self.max_id = last_id
+            for change, args in self._pending:
+                change(*args)
+            self._pending = None
+            self.loaded = True
+            self.refreshed = time.monotonic()
+        logger.info("Loaded %d usernames", len(rows))
+
+    def refresh(self):
+        """Add the users created in other processes since the last refresh."""
+        self.refreshed = time.monotonic()
+        for username, pk in (
+            User.objects.filter(pk__gt=self.max_id)
+            .order_by("pk")
+            .values_list("username", "pk")
+        ):
+            self.add(pk, username)
+
+    def _insert(self, user_id, username):
+        position = bisect.bisect_left(self.names, username)
+        if position < len(self.names) and self.names[position] == username:
+            self.ids[position] = user_id
+        else:
+            self.names.insert(position, username)
+            self.ids.insert(position, user_id)
+        self.max_id = max(self.max_id, user_id)
+
+    def _remove(self, user_id):
+        try:
+            # Linear, but only renames and deletions need it
+            position = self.ids.index(user_id)
+        except ValueError:
+            return
+        del self.names[position]
+        del self.ids[position]
+
+    def _apply(self, change, *args):
+        with self._lock:
+            if not self.loaded and self._pending is None:
+                # Lookups of this process use the database
+                return
+            if self._pending is not None:
+                self._pending.append((change, args))
+            change(*args)
+
+    def add(self, user_id, username):
+        """Add a new user, or reassign a name to the user holding it now.
+
+        Args:
+            user_id: Id of the user
+            username: Username of the user
+        """
+        self._apply(self._insert, user_id, username)
+
+    def rename(self, user_id, username):
+        """Replace the entry of a user whose username may have changed.
+
+        Args:
+            user_id: Id of the user
+            username: New username of the user
+        """
+        self._apply(self._rename, user_id, username)
+
+    def _rename(self, user_id, username):
+        position = bisect.bisect_left(self.names, username)
+        if (
+            position < len(self.names)
+            and self.names[position] == username
+            and self.ids[position] == user_id
+        ):
+            return
+        self._remove(user_id)
+        self._insert(user_id, username)
+
+    def remove(self, user_id):
+        """Remove a deleted user.
+
+        Args:
+            user_id: Id of the user
+        """
+        self._apply(self._remove, user_id)
+
+    def search(self, prefix, excluded, limit):
+        """Return the first users whose name starts with a prefix.
+
+        Args:
+            prefix: Start of the usernames
+            excluded: Ids of the users to skip
+            limit: Maximum number of users to return
+
+        Returns:
+            list: ``(user_id, username)`` pairs in username order
+        """
+        if (
+            USERNAME_INDEX_REFRESH is not None
+            and time.monotonic() - self.refreshed > USERNAME_INDEX_REFRESH
+        ):
+            self.refresh()
+        results = []
+        with self._lock:
+            position = bisect.bisect_left(self.names, prefix)
+            while len(results) < limit and position < len(self.names):
+                username = self.names[position]
+                if not username.startswith(prefix):
+                    break
+                if self.ids[position] not in excluded:
+                    results.append((self.ids[position], username))
+                position += 1
+        return results
+
+
+_index = UsernameIndex()
+
+
+def get_index():
+    """Return the username index of this process."""
+    return _index
+
+
+def warm_in_background():
+    """Load the username index of this process in a daemon thread.
+
+    Called once by the WSGI and ASGI entry points; lookups use the database
+    until the index is loaded.
+    """
+
+    def warm():
+        try:
+            _index.load()
+        except Exception:
+            logger.exception("Cannot load the username index")
+        finally:
+            connection.close()
+
+    threading.Thread(target=warm, name="litrevu-usernames", daemon=True).start()
+
+
+def search_database(prefix, excluded, limit):
+    """Return the first users whose name starts with a prefix, from the database.
+
+    The range condition is a range scan of the unique index of ``username``.
+    Rows are read in chunks, so excluded users cost at most a few queries.
+
+    Args:
+        prefix: Start of the usernames
+        excluded: Ids of the users to skip
+        limit: Maximum number of users to return
+
+    Returns:
+        list: ``(user_id, username)`` pairs in username order
+    """
+    chunk_size = limit + min(len(excluded), CHUNK_SIZE)
+    users = (
+        User.objects.filter(username__lt=prefix + _MAX_CHAR)
+        .order_by("username")
+        .values_list("pk", "username")
+    )
+    rows = users.filter(username__gte=prefix)[:chunk_size]
+    results = []
+    while True:
+        chunk = list(rows)
+        results.extend(row for row in chunk if row[0] not in excluded)
+        if len(results) >= limit or len(chunk) < chunk_size:
+            return results[:limit]
+        rows = users.filter(username__gt=chunk[-1][1])[:chunk_size]
+
+
+def suggest(user, prefix, limit=None):
+    """Return the users a user may follow whose name starts with a prefix.
+
+    The user themselves, the users they follow and the users they block or
+    are blocked by are left out, using their cached relations.
+
+    Args:
+        user: The user typing in the follow form
+        prefix: Start of the usernames
+        limit: Maximum number of users, USERNAME_AUTOCOMPLETE_LIMIT by default
+
+    Returns:
+        list: ``(user_id, username)`` pairs in username order
+    """
+    if not prefix:
+        return []
+    limit = limit or USERNAME_AUTOCOMPLETE_LIMIT
+    related = social_graph.relations(user.pk)
+    excluded = related.following | related.blocking | related.blocked_by | {user.pk}
+    if _index.loaded:
+        return _index.search(prefix, excluded, limit)
+    return search_database(prefix, excluded, limit)
@@ -1,25 +1,62 @@
+import asyncio
+import json
+
+from django.conf import settings
 from django.contrib.auth import login, logout, get_user_model
 from django.contrib.auth.views import LoginView
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse_lazy
 from django.views.generic import CreateView
 from django.views import View
+from django.views.decorators.http import require_POST
+from django.core.exceptions import ValidationError
 from django.db import IntegrityError, transaction
-from django.db.models import Q, CharField, Value, Exists, OuterRef
+from django.db.models import Q, CharField, Value
 from itertools import chain
-from django.http import HttpResponseForbidden
-
+from django.core.handlers.asgi import ASGIRequest
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseForbidden,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+
+from .decorators import async_login_required, conditional_page
+from .etags import home_etag, posts_etag, follows_etag
+from .events import get_hub
 from .forms import SignUpForm, LoginForm, UserFollowForm, TicketForm, ReviewForm
+from . import (
+    bulk_relations as bulk,
+    feed_cache,
+    images,
+    social_graph,
+    suggestions,
+    username_index,
+)
+from .feed import (
+    FEED_DELTA_MAX_BYTES,
+    FEED_DELTA_MAX_ITEMS,
+    FeedCursor,
+    entry_keys_after,
+    hydrate,
+)
 from .models import UserFollows, Ticket, Review, UserBlocks
+from .serializers import serialize_items
+from .social_graph import relationship
 
 User = get_user_model()
 
+FEED_EVENTS_HEARTBEAT = getattr(settings, "FEED_EVENTS_HEARTBEAT", 30)
+
 # Create your views here.
 
 
 @login_required
+@conditional_page(home_etag)
 def home(request):
     """Display the home feed for the logged-in user.
 
@@ -28,49 +65,168 @@ def home(request):
     - Users they follow
     - Reviews on the user's tickets (even if reviewer is not followed)
 
+    The feed is paginated with a keyset cursor passed in the ``before``
+    query parameter, and pages are served from the per-user feed cache.
+    Unchanged pages are answered with 304 Not Modified.
+
     Args:
         request: The HTTP request object
 
     Returns:
-        Rendered home page with combined feed of tickets and reviews
+        Rendered home page with one page of the combined feed
     """
-    # Get users that the current user follows
-    followed_users = User.objects.filter(followed_by__user=request.user)
+    page = feed_cache.get_page(
+        request.user, before=FeedCursor.decode(request.GET.get("before"))
+    )
 
-    # Get tickets:
-    # - From users you follow
-    # - Your own tickets
-    tickets = (
-        Ticket.objects.filter(Q(user=request.user) | Q(user__in=followed_users))
-        .annotate(
-            content_type=Value("TICKET", CharField()),
-            has_user_reviewed=Exists(
-                Review.objects.filter(ticket=OuterRef("pk"), user=request.user)
-            ),
-        )
-        .select_related("user")
+    return render(
+        request,
+        "litrevu/home.html",
+        {
+            "feed": page.items,
+            "next_cursor": page.next_cursor,
+            # The event stream is only served under ASGI, see home_events
+            "live_updates": isinstance(request, ASGIRequest),
+        },
     )
 
-    # Get reviews:
-    # - From users you follow
-    # - Your own reviews
-    # - Reviews on your tickets (even if reviewer is not followed)
-    reviews = (
-        Review.objects.filter(
-            Q(user=request.user)  # Your reviews
-            | Q(user__in=followed_users)  # Reviews from users you follow
-            | Q(ticket__user=request.user)  # Reviews on your tickets
-        )
-        .annotate(
-            content_type=Value("REVIEW", CharField()),
-        )
-        .select_related("user", "ticket", "ticket__user")
+
+@login_required
+def home_new(request):
+    """Return the home feed items newer than a cursor, as JSON.
+
+    Used by the front end to poll for new content. The ``after`` query
+    parameter is the cursor of the newest item the client already has.
+    Items are returned oldest first and bounded in number and size; when
+    ``has_more`` is true the client calls again with the returned cursor.
+
+    Args:
+        request: The HTTP request object
+
+    Returns:
+        JSON response with the new items, the cursor of the last one and
+        the ``has_more`` flag, or a 400 response if the cursor is invalid
+    """
+    after = FeedCursor.decode(request.GET.get("after"))
+    if after is None:
+        return JsonResponse({"error": "Curseur invalide."}, status=400)
+
+    keys = entry_keys_after(request.user, after, FEED_DELTA_MAX_ITEMS + 1)
+    items, truncated = serialize_items(
+        hydrate(keys[:FEED_DELTA_MAX_ITEMS], request.user), FEED_DELTA_MAX_BYTES
     )
 
-    # Combine and sort by most recent first
-    feed = sorted(chain(tickets, reviews), key=lambda x: x.time_created, reverse=True)
+    return JsonResponse(
+        {
+            "items": items,
+            "cursor": items[-1]["cursor"] if items else after.encode(),
+            "has_more": truncated or len(keys) > FEED_DELTA_MAX_ITEMS,
+        },
+        json_dumps_params={"ensure_ascii": False},
+    )
+
+
+@async_login_required
+async def home_events(request):
+    """Stream home feed events to the logged-in user (Server-Sent Events).
+
+    An event is sent when a ticket or review that belongs in the user's
+    feed is created; its data holds the kind, id and cursor of the item,
+    which the client can pass to ``home_new``. A comment line is sent
+    every ``FEED_EVENTS_HEARTBEAT`` seconds to keep the connection open.
+    The stream is only served under ASGI, where an idle stream only costs
+    a pending coroutine: under WSGI, Django would consume the stream in a
+    thread of its own, holding a worker for as long as the page is open.
+    WSGI requests get a 204 response, which tells ``EventSource`` not to
+    reconnect.
+
+    Args:
+        request: The HTTP request object
+
+    Returns:
+        Streaming response with the ``text/event-stream`` content type, or
+        an empty 204 response when the request is not served under ASGI
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    hub = get_hub()
+
+    async def stream():
+        # Subscribed when the stream starts, so that a response that is
+        # never iterated leaves no subscription behind
+        subscription = hub.subscribe(request.user.pk)
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(
+                        subscription.get(), FEED_EVENTS_HEARTBEAT
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: feed\ndata: {json.dumps(event)}\n\n"
+        finally:
+            hub.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    # Ask the proxy not to buffer the stream
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+@staff_member_required
+def feed_cache_stats(request):
+    """Return the hit, miss and invalidation counters of the feed cache.
+
+    Args:
+        request: The HTTP request object
+
+    Returns:
+        JSON response with the cache counters and hit rate
+    """
+    return JsonResponse(feed_cache.stats())
+
 
-    return render(request, "litrevu/home.html", {"feed": feed})
+@staff_member_required
+def image_stats(request):
+    """Return the queue depth and processing times of the ticket images.
+
+    Args:
+        request: The HTTP request object
+
+    Returns:
+        JSON response with the image processing metrics of this process
+    """
+    return JsonResponse(images.stats())
+
+
+@login_required
+def ticket_rendition(request, ticket_id, rendition, extension):
+    """Redirect to a rendition of a ticket image, generating it if missing.
+
+    Args:
+        request: The HTTP request object
+        ticket_id: ID of the ticket
+        rendition: Name of the rendition, e.g. "card"
+        extension: File extension of the format, "jpg" or "webp"
+
+    Returns:
+        Redirect to the stored rendition
+
+    Raises:
+        Http404: If the ticket has no processed image or the rendition is
+            unknown
+    """
+    formats = {extension: name for name, (_, extension, _) in images.FORMATS.items()}
+    if rendition not in images.RENDITIONS or extension not in formats:
+        raise Http404("Déclinaison inconnue")
+    ticket = get_object_or_404(Ticket, id=ticket_id)
+    if not ticket.image_ready:
+        raise Http404("Image indisponible")
+    name = images.ensure_rendition(ticket, rendition, formats[extension])
+    return redirect(ticket.image.storage.url(name))
 
 
 class SignUpView(CreateView):
@@ -190,6 +346,7 @@ class CustomLogoutView(View):
 
 
 @login_required
+@conditional_page(follows_etag)
 def follows_list(request):
     """Display the user's following/followers list and blocked users.
 
@@ -197,7 +354,16 @@ def follows_list(request):
     - Users being followed
     - Users following the current user
     - Users blocked by current user
-    - Users who have blocked the current user
+    - Suggested users, followed by the users the current user follows
+
+    The lists are read with one query each, one page of each list. Each
+    list is paginated with a keyset cursor passed in its ``<list>_before``
+    query parameter. Unchanged pages are answered with 304 Not Modified.
+
+    Following a user validates the username with the cached relations of
+    the current user and inserts the follow, whose ``clean`` checks the
+    blocks in one query: the number of queries does not depend on the
+    number of relations.
 
     Args:
         request: The HTTP request
@@ -205,18 +371,6 @@ def follows_list(request):
     Returns:
         Rendered follows page with all relationship lists
     """
-    following = request.user.following.select_related("followed_user").order_by(
-        "-time_created"
-    )
-    followers = request.user.followed_by.select_related("user").order_by(
-        "-time_created"
-    )
-    blocked_users = request.user.blocking.select_related("blocked_user").order_by(
-        "-time_created"
-    )
-    blocked_by = request.user.blocked_by.select_related("user").order_by(
-        "-time_created"
-    )
     form = UserFollowForm(request=request)
 
     if request.method == "POST":
@@ -224,30 +378,59 @@ def follows_list(request):
         if form.is_valid():
             username = form.cleaned_data["username"]
             try:
-                user_to_follow = User.objects.get(username=username)
-                UserFollows.objects.create(
-                    user=request.user, followed_user=user_to_follow
-                )
+                # The counters are updated in the transaction of the follow
+                with transaction.atomic():
+                    UserFollows.objects.create(
+                        user=request.user, followed_user=form.user_to_follow
+                    )
                 messages.success(request, f"Vous suivez maintenant {username}.")
                 return redirect("litrevu:follows")
-            except User.DoesNotExist:
-                messages.error(request, f"L'utilisateur {username} n'existe pas.")
+            except ValidationError as error:
+                # Blocks in either direction, checked by UserFollows.clean
+                form.add_error("username", error)
             except IntegrityError:
                 messages.error(request, "Une erreur est survenue. Veuillez réessayer.")
 
+    kinds = (social_graph.FOLLOWING, social_graph.FOLLOWERS, social_graph.BLOCKING)
+    cursors = {
+        kind: social_graph.RelationCursor.decode(request.GET.get(f"{kind}_before"))
+        for kind in kinds
+    }
+    pages = social_graph.list_relations(request.user.pk, cursors, kinds)
+
     return render(
         request,
         "litrevu/follows.html",
         {
             "form": form,
-            "following": following,
-            "followers": followers,
-            "blocked_users": blocked_users,
-            "blocked_by": blocked_by,
+            "following": pages[social_graph.FOLLOWING],
+            "followers": pages[social_graph.FOLLOWERS],
+            "blocked_users": pages[social_graph.BLOCKING],
+            "suggestions": suggestions.suggestions_for(
+                request.user, social_graph.relations(request.user.pk)
+            ),
         },
     )
 
 
+@login_required
+def username_autocomplete(request):
+    """Suggest users to follow whose username starts with the typed text.
+
+    Args:
+        request: The HTTP request, with the typed text as ``q``
+
+    Returns:
+        JSON response with the id and username of the suggested users,
+        leaving out the user, the users they follow and blocked users
+    """
+    prefix = request.GET.get("q", "").strip()
+    users = username_index.suggest(request.user, prefix)
+    return JsonResponse(
+        {"results": [{"id": pk, "username": username} for pk, username in users]}
+    )
+
+
 @login_required
 def unfollow_user(request, user_id):
     """Remove a follow relationship.
@@ -269,6 +452,44 @@ def unfollow_user(request, user_id):
     return redirect("litrevu:follows")
 
 
+@login_required
+@require_POST
+def bulk_relations(request):
+    """Follow, unfollow or block several users in one request.
+
+    The body is a JSON object with the ``action`` ("follow", "unfollow" or
+    "block") and the ``usernames`` and/or ``ids`` of the target users.
+
+    Args:
+        request: The HTTP request
+
+    Returns:
+        JSON response with the status of each target and the number of
+        targets per status, or a 400 response for an invalid body
+    """
+    try:
+        body = json.loads(request.body)
+        action = bulk.ACTIONS[body["action"]]
+        usernames = body.get("usernames", [])
+        ids = body.get("ids", [])
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return JsonResponse(
+            {"error": "Requête invalide : action, usernames ou ids incorrects."},
+            status=400,
+        )
+    try:
+        results = action(request.user, usernames=usernames, ids=ids)
+    except (bulk.InvalidTargets, bulk.TooManyTargets, OverflowError) as error:
+        return JsonResponse({"error": f"Requête invalide : {error}"}, status=400)
+
+    counts = {}
+    for result in results:
+        counts[result.status] = counts.get(result.status, 0) + 1
+    return JsonResponse(
+        {"results": [result._asdict() for result in results], "counts": counts}
+    )
+
+
 @login_required
 def create_ticket(request):
     """Create a new ticket.
@@ -286,7 +507,8 @@ def create_ticket(request):
         if form.is_valid():
             ticket = form.save(commit=False)
             ticket.user = request.user
-            ticket.save()
+            with transaction.atomic():
+                ticket.save()
             messages.success(request, "Votre billet a été créé avec succès!")
             return redirect("litrevu:home")
     else:
@@ -315,8 +537,12 @@ def create_review(request, ticket_id=None):
 
     if ticket_id:
         ticket = get_object_or_404(Ticket, id=ticket_id)
-        # Check if the user has already reviewed this ticket
-        if Review.objects.filter(ticket=ticket, user=request.user).exists():
+        # Check if the user has already reviewed this ticket before showing
+        # the form; on submission the unique constraint does the check
+        if (
+            request.method != "POST"
+            and Review.objects.filter(ticket=ticket, user=request.user).exists()
+        ):
             messages.error(request, "Vous avez déjà critiqué ce billet.")
             return redirect("litrevu:home")
 
@@ -329,7 +555,12 @@ def create_review(request, ticket_id=None):
                 review = review_form.save(commit=False)
                 review.user = request.user
                 review.ticket = ticket
-                review.save()
+                try:
+                    with transaction.atomic():
+                        review.save()
+                except IntegrityError:
+                    messages.error(request, "Vous avez déjà critiqué ce billet.")
+                    return redirect("litrevu:home")
                 messages.success(request, "Votre critique a été créée avec succès!")
                 return redirect("litrevu:home")
         else:
@@ -559,15 +790,20 @@ def block_user(request, user_id):
         messages.error(request, "Vous ne pouvez pas vous bloquer vous-même.")
         return redirect("litrevu:follows")
 
+    if relationship(request.user.pk, user_to_block.pk).blocking:
+        messages.error(request, "Vous bloquez déjà cet utilisateur.")
+        return redirect("litrevu:follows")
+
     try:
-        # Create the block
-        UserBlocks.objects.create(user=request.user, blocked_user=user_to_block)
+        with transaction.atomic():
+            # Create the block
+            UserBlocks.objects.create(user=request.user, blocked_user=user_to_block)
 
-        # Remove any existing follow relationships in both directions
-        UserFollows.objects.filter(
-            Q(user=request.user, followed_user=user_to_block)
-            | Q(user=user_to_block, followed_user=request.user)
-        ).delete()
+            # Remove any existing follow relationships in both directions
+            UserFollows.objects.filter(
+                Q(user=request.user, followed_user=user_to_block)
+                | Q(user=user_to_block, followed_user=request.user)
+            ).delete()
 
         messages.success(request, f"Vous avez bloqué {user_to_block.username}.")
     except IntegrityError:
@@ -600,10 +836,12 @@ def unblock_user(request, user_id):
 
 
 @login_required
+@conditional_page(posts_etag)
 def posts(request):
     """Display all posts (tickets and reviews) created by the user.
 
-    Combines and sorts both tickets and reviews by creation time.
+    Combines and sorts both tickets and reviews by creation time. Unchanged
+    pages are answered with 304 Not Modified.
 
     Args:
         request: The HTTP request